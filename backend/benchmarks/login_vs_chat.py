@@ -0,0 +1,208 @@
+"""
+Mixed load: does a burst of logins slow down /chat?
+
+Starts the app with uvicorn in a child process, on a temporary SQLite
+database, with the LLM call replaced by a fixed-latency fake, so only our
+own request handling is measured. Then it runs two phases of --seconds each:
+
+  chat only      --chat-clients loop on POST /chat
+  chat + login   the same, plus --login-clients looping on POST /auth/login
+
+It reports chat latency (p50/p95/p99) for both phases, and login throughput
+and 503s (password pool back-pressure) for the second.
+
+Run from backend/:
+
+    python benchmarks/login_vs_chat.py [--seconds 10] [--chat-clients 4] [--login-clients 16]
+
+On SQLite a chat turn holds the write lock from the credit hold until it
+commits, LLM call included, so chats run one at a time. Keep --llm-ms low
+there, or pass --database-url postgresql://... (an empty database: tables
+are created) for production-like concurrency.
+
+PASSWORD_WORKERS / PASSWORD_QUEUE_MAX / BCRYPT_ROUNDS in the environment
+are passed to the server unchanged.
+"""
+import argparse
+import asyncio
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+import orjson
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PASSWORD = "bench-password"
+
+
+# ── Server (child process) ───────────────────────────────────────────────────
+def serve(args) -> None:
+    sys.path.insert(0, BACKEND)
+    import uvicorn
+
+    import database
+    import llm
+    import main
+    import memory
+    import models
+    import utils
+
+    async def fake_reply(history, character, recalled=None):
+        await asyncio.sleep(args.llm_ms / 1000)   # providerul: doar latenta, fara CPU
+        return "mm tell me more"
+
+    llm.agenerate_response = fake_reply
+    memory.needs_refresh = lambda db, char: False   # rezumatul ar apela LLM-ul real
+
+    hashed = utils.get_password_hash(PASSWORD)   # un singur hash, refolosit de toti userii
+    db = database.SessionLocal()
+    tokens = []
+    for i in range(args.chat_clients + args.login_clients):
+        user = models.User(email=f"bench{i}@example.com", hashed_password=hashed, credits=10 ** 6, level=1)
+        db.add(user)
+        db.flush()
+        char = models.Character(user_id=user.id, name=f"Bench {i}")
+        db.add(char)
+        db.flush()
+        tokens.append((utils.create_access_token({"sub": user.id}), char.id))
+    db.commit()
+    db.close()
+
+    print(orjson.dumps(tokens).decode(), flush=True)
+    uvicorn.run(main.app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+# ── Load generator ───────────────────────────────────────────────────────────
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _start_server(args, tmp: str):
+    env = dict(os.environ)
+    env.update(
+        ENVIRONMENT="development",
+        AUTO_MIGRATE="1",
+        DATABASE_URL=args.database_url or f"sqlite:///{os.path.join(tmp, 'bench.db')}",
+        MEMORY_INDEX_DIR=os.path.join(tmp, "memory_index"),
+    )
+    cmd = [
+        sys.executable, os.path.abspath(__file__), "--serve",
+        "--port", str(args.port), "--llm-ms", str(args.llm_ms),
+        "--chat-clients", str(args.chat_clients), "--login-clients", str(args.login_clients),
+    ]
+    proc = subprocess.Popen(cmd, cwd=BACKEND, env=env, stdout=subprocess.PIPE, text=True)
+    for line in proc.stdout:
+        if line.startswith("[["):
+            return proc, orjson.loads(line)
+    raise RuntimeError("server exited before it was ready")
+
+
+async def _wait_ready(client: httpx.AsyncClient) -> None:
+    for _ in range(200):
+        try:
+            if (await client.get("/health")).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.05)
+    raise RuntimeError("server did not answer /health")
+
+
+async def _chat_loop(client, token, char_id, until, latencies, errors):
+    headers = {"Authorization": f"Bearer {token}"}
+    while time.monotonic() < until:
+        started = time.perf_counter()
+        r = await client.post("/chat", json={"character_id": char_id, "message": "how was your day?"},
+                              headers=headers)
+        if r.status_code == 200:
+            latencies.append((time.perf_counter() - started) * 1000)
+        else:
+            errors.append(r.status_code)
+
+
+async def _login_loop(client, email, until, results):
+    while time.monotonic() < until:
+        started = time.perf_counter()
+        r = await client.post("/auth/login", json={"email": email, "password": PASSWORD})
+        results.append((r.status_code, (time.perf_counter() - started) * 1000))
+        if r.status_code == 503:
+            await asyncio.sleep(float(r.headers.get("Retry-After", "1")))
+
+
+def _pct(values, p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))] if values else float("nan")
+
+
+async def _phase(client, chat_users, login_emails, seconds) -> dict:
+    until = time.monotonic() + seconds
+    latencies, chat_errors, logins = [], [], []
+    await asyncio.gather(
+        *(_chat_loop(client, token, char_id, until, latencies, chat_errors) for token, char_id in chat_users),
+        *(_login_loop(client, email, until, logins) for email in login_emails),
+    )
+    ok = [ms for status, ms in logins if status == 200]
+    return {
+        "chats": len(latencies),
+        "chat_errors": len(chat_errors),
+        "chat_p50": _pct(latencies, 0.5),
+        "chat_p95": _pct(latencies, 0.95),
+        "chat_p99": _pct(latencies, 0.99),
+        "logins_per_s": len(ok) / seconds,
+        "login_p50": statistics.median(ok) if ok else float("nan"),
+        "login_503": sum(1 for status, _ in logins if status == 503),
+    }
+
+
+async def run(args) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        proc, users = _start_server(args, tmp)
+        try:
+            chat_users = users[:args.chat_clients]
+            login_emails = [f"bench{i}@example.com" for i in range(args.chat_clients, len(users))]
+            limits = httpx.Limits(max_connections=args.chat_clients + args.login_clients)
+            async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{args.port}", limits=limits,
+                                         timeout=60) as client:
+                await _wait_ready(client)
+                print(f"{args.chat_clients} chat clients, fake LLM {args.llm_ms}ms, "
+                      f"{args.login_clients} login clients, {args.seconds}s per phase")
+                for name, emails in (("chat only", []), ("chat + login", login_emails)):
+                    r = await _phase(client, chat_users, emails, args.seconds)
+                    line = (f"{name:13} chat p50 {r['chat_p50']:6.0f}ms  p95 {r['chat_p95']:6.0f}ms  "
+                            f"p99 {r['chat_p99']:6.0f}ms  ({r['chats']} ok, {r['chat_errors']} errors)")
+                    if emails:
+                        line += (f"   login {r['logins_per_s']:5.1f}/s  p50 {r['login_p50']:5.0f}ms  "
+                                 f"503s {r['login_503']}")
+                    print(line)
+        finally:
+            proc.terminate()
+            proc.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--chat-clients", type=int, default=4)
+    parser.add_argument("--login-clients", type=int, default=16)
+    parser.add_argument("--llm-ms", type=int, default=20, help="latency of the fake LLM call")
+    parser.add_argument("--database-url", help="default: a temporary SQLite file")
+    parser.add_argument("--port", type=int, default=0)
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args)
+        return
+    args.port = args.port or _free_port()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Microbenchmark: serializing the 50-row /chat/history and /images/gallery lists.
+
+  old  dict per row -> jsonable_encoder -> json.dumps   (JSONResponse, before typed models)
+  new  SQL rows -> response model (from_attributes) -> orjson   (ORJSONResponse)
+
+Run from backend/:
+
+    python benchmarks/serialization.py [rows] [iterations]
+"""
+import json
+import os
+import sys
+import timeit
+import uuid
+from collections import namedtuple
+from datetime import datetime, timedelta
+from typing import List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("ENVIRONMENT", "development")
+os.environ.setdefault("DATABASE_URL", "sqlite:///:memory:")
+
+import orjson
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+
+from main import GalleryImageOut, MessageOut
+
+MessageRow = namedtuple("MessageRow", "id sender content is_image image_url credits_cost timestamp")
+GalleryRow = namedtuple("GalleryRow", "id character_id image_url nsfw credits_cost liked status created_at")
+
+
+def _rows(n: int):
+    now = datetime.utcnow()
+    messages = [
+        MessageRow(str(uuid.uuid4()), "user" if i % 2 else "ai", "Hey, how was your day? " * 6,
+                   False, None, i % 2, now - timedelta(minutes=i))
+        for i in range(n)
+    ]
+    gallery = [
+        GalleryRow(str(uuid.uuid4()), str(uuid.uuid4()), f"https://fal.media/files/{i}.jpeg",
+                   bool(i % 3), 7, bool(i % 2), "ready", now - timedelta(hours=i))
+        for i in range(n)
+    ]
+    return messages, gallery
+
+
+def old_path(rows) -> bytes:
+    # ce faceau rutele inainte: dict construit manual + encoder-ul generic FastAPI + json stdlib
+    content = jsonable_encoder([row._asdict() for row in rows])
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def new_path(adapter: TypeAdapter, rows) -> bytes:
+    # ce face FastAPI cu response_model + ORJSONResponse
+    return orjson.dumps(adapter.dump_python(adapter.validate_python(rows), mode="json"))
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    iterations = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    messages, gallery = _rows(n)
+
+    for name, model, rows in (("history", MessageOut, messages), ("gallery", GalleryImageOut, gallery)):
+        adapter = TypeAdapter(List[model])
+        assert orjson.loads(old_path(rows)) == orjson.loads(new_path(adapter, rows))
+        old = min(timeit.repeat(lambda: old_path(rows), number=iterations, repeat=5)) / iterations
+        new = min(timeit.repeat(lambda: new_path(adapter, rows), number=iterations, repeat=5)) / iterations
+        print(f"{name:8} {n} rows   old {old * 1e6:8.1f} us   new {new * 1e6:8.1f} us   {old / new:4.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Worker cold start: `import main` + app startup, each run in a fresh process.
+
+  default       schema setup left to `python migrate.py` (Procfile release)
+  AUTO_MIGRATE  every worker runs migrate.run() at import, as before
+
+Both modes use the same temporary SQLite file. It is migrated once up front,
+so AUTO_MIGRATE measures what a worker pays on an existing database.
+
+Run from backend/:
+
+    python benchmarks/startup.py [runs]
+"""
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import orjson
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Ruleaza in procesul copil: importtime + startup (lifespan) prin TestClient
+CHILD = """
+import time
+started = time.perf_counter()
+import main
+imported = time.perf_counter()
+from fastapi.testclient import TestClient
+with TestClient(main.app):
+    ready = time.perf_counter()
+import orjson
+print(orjson.dumps({
+    "import_ms": (imported - started) * 1000,
+    "startup_ms": (ready - imported) * 1000,
+}).decode())
+"""
+
+
+def _env(db_path: str, auto_migrate: bool) -> dict:
+    env = dict(os.environ)
+    env.update(ENVIRONMENT="development", DATABASE_URL=f"sqlite:///{db_path}")
+    env.pop("AUTO_MIGRATE", None)
+    if auto_migrate:
+        env["AUTO_MIGRATE"] = "1"
+    return env
+
+
+def _run(env: dict) -> dict:
+    started = time.perf_counter()
+    out = subprocess.run(
+        [sys.executable, "-c", CHILD], cwd=BACKEND, env=env,
+        capture_output=True, text=True, check=True,
+    ).stdout
+    result = orjson.loads(out.strip().splitlines()[-1])
+    result["process_ms"] = (time.perf_counter() - started) * 1000
+    return result
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        subprocess.run([sys.executable, "migrate.py"], cwd=BACKEND, env=_env(db_path, False),
+                       capture_output=True, check=True)
+
+        for name, auto_migrate in (("default", False), ("AUTO_MIGRATE", True)):
+            _run(_env(db_path, auto_migrate))   # warm the OS file cache / .pyc
+            samples = [_run(_env(db_path, auto_migrate)) for _ in range(runs)]
+            line = "   ".join(
+                f"{field[:-3]} {statistics.median(s[field] for s in samples):7.0f}ms"
+                for field in ("import_ms", "startup_ms", "process_ms")
+            )
+            print(f"{name:13} median of {runs}   {line}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+"""
+Credit packages <-> Stripe.
+
+sync_packages() creates (or finds) one Stripe Product + Price per active
+CreditPackage and stores the Price ID in CreditPackage.stripe_price_id,
+next to the lookup_key it was found by (stripe_lookup_key). Prices are
+found again by lookup_key, so re-running the sync, or two workers running
+it together, never creates duplicates. The key includes the amount: after
+price_usd changes the stored key no longer matches, and the next sync (or
+checkout) moves the package to a Price for the new amount.
+
+Packages are also cached (shared cache, see cache.py): /credits/checkout
+needs no DB query and exactly one Stripe call (Checkout Session create).
+
+`client` defaults to the stripe module (imported on first use, not at
+worker boot); tests can pass a stand-in that exposes Product.create,
+Price.list, Price.create and error.InvalidRequestError.
+"""
+import os
+from typing import Optional
+
+import orjson
+from sqlalchemy.orm import Session
+
+import cache
+import models
+
+PACKAGES_CACHE_KEY = "credit_packages:v1"
+PACKAGE_CACHE_KEY = "credit_package:v1:{}"
+PACKAGES_CACHE_SECONDS = int(os.getenv("PACKAGES_CACHE_SECONDS", "300"))
+
+
+def stripe_configured() -> bool:
+    return bool(os.getenv("STRIPE_SECRET_KEY"))
+
+
+def stripe_client():
+    import stripe
+    if not stripe.api_key:
+        stripe.api_key = os.getenv("STRIPE_SECRET_KEY")
+    return stripe
+
+
+def _package_dict(pkg: models.CreditPackage) -> dict:
+    return {
+        "id": pkg.id,
+        "name": pkg.name,
+        "credits": pkg.credits,
+        "bonus_credits": pkg.bonus_credits,
+        "total_credits": pkg.credits + pkg.bonus_credits,
+        "price_usd": pkg.price_usd,
+        # un Price pentru o suma veche nu ajunge in cache: price_id_for re-sincronizeaza
+        "stripe_price_id": pkg.stripe_price_id if is_synced(pkg) else None,
+    }
+
+
+# ── Package cache ────────────────────────────────────────────────────────────
+def packages_body(db: Session) -> bytes:
+    """Serialized list of active packages, as returned by /credits/packages."""
+    body = cache.get_cache().get(PACKAGES_CACHE_KEY)
+    if body is not None:
+        return body
+
+    pkgs = db.query(models.CreditPackage).filter(models.CreditPackage.is_active == True).all()
+    body = orjson.dumps([_package_dict(p) for p in pkgs])
+    cache.get_cache().set(PACKAGES_CACHE_KEY, body, ttl=PACKAGES_CACHE_SECONDS)
+    return body
+
+
+def get_package(db: Session, package_id: str) -> Optional[dict]:
+    key = PACKAGE_CACHE_KEY.format(package_id)
+    pkg = cache.get_cache().get_json(key)
+    if pkg is not None:
+        return pkg
+
+    row = db.query(models.CreditPackage).filter(
+        models.CreditPackage.id == package_id,
+        models.CreditPackage.is_active == True,
+    ).first()
+    if not row:
+        return None
+    pkg = _package_dict(row)
+    cache.get_cache().set_json(key, pkg, ttl=PACKAGES_CACHE_SECONDS)
+    return pkg
+
+
+def invalidate_packages(package_ids) -> None:
+    store = cache.get_cache()
+    store.delete(PACKAGES_CACHE_KEY)
+    for package_id in package_ids:
+        store.delete(PACKAGE_CACHE_KEY.format(package_id))
+
+
+# ── Stripe sync ──────────────────────────────────────────────────────────────
+def is_subscription(package_id: str) -> bool:
+    return package_id.startswith("sub_")
+
+
+def lookup_key(pkg: models.CreditPackage) -> str:
+    return f"bunnycrush_{pkg.id}_{int(round(pkg.price_usd * 100))}usd"
+
+
+def is_synced(pkg: models.CreditPackage) -> bool:
+    return bool(pkg.stripe_price_id) and pkg.stripe_lookup_key == lookup_key(pkg)
+
+
+def _sync_price(pkg: models.CreditPackage, client=None) -> None:
+    pkg.stripe_price_id = ensure_price(pkg, client)
+    pkg.stripe_lookup_key = lookup_key(pkg)
+
+
+def ensure_price(pkg: models.CreditPackage, client=None) -> str:
+    """Stripe Price ID for `pkg`, creating Product + Price on first use."""
+    client = client or stripe_client()
+    key = lookup_key(pkg)
+    existing = client.Price.list(lookup_keys=[key], active=True, limit=1)
+    if existing.data:
+        return existing.data[0].id
+
+    product = client.Product.create(
+        name=f"BunnyCrush - {pkg.name}",
+        description=f"{pkg.credits + pkg.bonus_credits} credits ({pkg.credits} + {pkg.bonus_credits} bonus)",
+        metadata={"package_id": pkg.id},
+    )
+    params = dict(
+        product=product.id,
+        currency="usd",
+        unit_amount=int(round(pkg.price_usd * 100)),
+        lookup_key=key,
+        metadata={"package_id": pkg.id},
+    )
+    if is_subscription(pkg.id):
+        params["recurring"] = {"interval": "year" if pkg.id.endswith("annual") else "month"}
+    try:
+        return client.Price.create(**params).id
+    except client.error.InvalidRequestError:
+        # alt worker a creat acelasi lookup_key intre timp
+        existing = client.Price.list(lookup_keys=[key], active=True, limit=1)
+        if existing.data:
+            return existing.data[0].id
+        raise
+
+
+def sync_packages(db: Session, client=None) -> int:
+    """Set stripe_price_id for every active package missing one, or priced since. Returns how many were set."""
+    active = db.query(models.CreditPackage).filter(models.CreditPackage.is_active == True).all()
+    pkgs = [pkg for pkg in active if not is_synced(pkg)]
+
+    for pkg in pkgs:
+        _sync_price(pkg, client)
+    db.commit()
+
+    if pkgs:
+        invalidate_packages([p.id for p in pkgs])
+        print(f"[STRIPE] synced prices for {len(pkgs)} packages")
+    return len(pkgs)
+
+
+def price_id_for(db: Session, pkg: dict, client=None) -> Optional[str]:
+    """Price ID from the cached package; syncs this one package if it was never synced
+    for its current price.
+
+    None if the package was deactivated or deleted after it was cached.
+    """
+    if pkg["stripe_price_id"]:
+        return pkg["stripe_price_id"]
+
+    row = db.query(models.CreditPackage).filter(
+        models.CreditPackage.id == pkg["id"],
+        models.CreditPackage.is_active == True,
+    ).first()
+    if not row:
+        invalidate_packages([pkg["id"]])
+        return None
+    if not is_synced(row):
+        _sync_price(row, client)
+        db.commit()
+        invalidate_packages([row.id])
+    return row.stripe_price_id
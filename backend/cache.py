@@ -0,0 +1,380 @@
+"""
+Shared cache with one interface for several backends.
+
+    cache.get_cache().get(key) / set(key, value, ttl) / delete(key)
+                     .incr(key, amount, ttl) / ttl(key)
+
+Values are bytes; get_json()/set_json() wrap them with orjson.
+
+Backends, chosen with CACHE_URL:
+    memory://                 in-process LRU (one process: dev server, tests)
+    sqlite:////dev/shm/bc.db  one SQLite file shared by the workers of a host
+                              (sqlite:/// alone = /dev/shm/bunnycrush-cache.sqlite)
+    redis://host:6379/0       Redis, or any client exposing the same commands
+
+The gunicorn workers share the sqlite:// and redis:// backends; the Procfile
+defaults CACHE_URL to sqlite:/// for both the workers and `migrate.py`. Each worker also keeps a small in-process L1 copy in front of
+them (TieredCache). set()/delete() publish the key on an invalidation log
+in the shared backend, and each worker polls the log before reading its L1.
+An update in one worker therefore invalidates the L1 copy everywhere.
+"""
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Iterable, List, Optional, Tuple
+
+import orjson
+
+CACHE_URL = os.getenv("CACHE_URL", "memory://")
+L1_MAX_ITEMS = int(os.getenv("CACHE_L1_MAX_ITEMS", "2048"))
+L1_TTL = float(os.getenv("CACHE_L1_TTL", "30"))
+INVALIDATION_POLL_SECONDS = 0.5
+INVALIDATION_RETENTION = 120      # secunde pastrate in log; peste -> flush total L1
+MAX_INVALIDATIONS_PER_POLL = 1000
+SQLITE_PURGE_SECONDS = 60         # cel mult un DELETE al cheilor expirate pe minut, per proces
+
+
+class CacheBackend:
+    def get(self, key: str) -> Optional[bytes]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: bytes, ttl: Optional[float] = None) -> None:
+        raise NotImplementedError
+
+    def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        """Atomic counter. `ttl` applies when the counter is created."""
+        raise NotImplementedError
+
+    def ttl(self, key: str) -> Optional[float]:
+        """Seconds left, None if the key is missing or never expires."""
+        raise NotImplementedError
+
+    # Invalidation log (shared backends only)
+    def publish_invalidation(self, keys: Iterable[str]) -> None:
+        pass
+
+    def poll_invalidations(self, since: Optional[int]) -> Tuple[int, Optional[List[str]]]:
+        """(latest seq, keys changed after `since`). keys=None means "drop everything".
+
+        since=None only asks for the current position (a worker starting up).
+        """
+        return since or 0, []
+
+    # ── JSON helpers ──────────────────────────────────────────────────────────
+    def get_json(self, key: str):
+        raw = self.get(key)
+        return orjson.loads(raw) if raw is not None else None
+
+    def set_json(self, key: str, value, ttl: Optional[float] = None) -> None:
+        self.set(key, orjson.dumps(value), ttl)
+
+
+# ── In-process LRU ───────────────────────────────────────────────────────────
+class MemoryCache(CacheBackend):
+    def __init__(self, max_items: int = 10000):
+        self._items: "OrderedDict[str, Tuple[object, Optional[float]]]" = OrderedDict()
+        self._max_items = max_items
+        self._lock = threading.Lock()
+
+    def _live(self, key: str):
+        item = self._items.get(key)
+        if item is None:
+            return None
+        if item[1] is not None and item[1] <= time.monotonic():
+            del self._items[key]
+            return None
+        self._items.move_to_end(key)
+        return item
+
+    def _store(self, key: str, value, ttl: Optional[float]) -> None:
+        self._items[key] = (value, time.monotonic() + ttl if ttl else None)
+        self._items.move_to_end(key)
+        while len(self._items) > self._max_items:
+            self._items.popitem(last=False)
+
+    def get(self, key):
+        with self._lock:
+            item = self._live(key)
+            return item[0] if item else None
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._store(key, value, ttl)
+
+    def delete(self, key):
+        with self._lock:
+            self._items.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+
+    def incr(self, key, amount=1, ttl=None):
+        with self._lock:
+            item = self._live(key)
+            if item is None:
+                value, expires_at = amount, (time.monotonic() + ttl if ttl else None)
+            else:
+                value, expires_at = int(item[0]) + amount, item[1]
+            self._items[key] = (value, expires_at)
+            return value
+
+    def ttl(self, key):
+        with self._lock:
+            item = self._live(key)
+            if item is None or item[1] is None:
+                return None
+            return item[1] - time.monotonic()
+
+
+# ── SQLite file (single host, multi worker) ──────────────────────────────────
+class SQLiteCache(CacheBackend):
+    def __init__(self, path: str):
+        self._path = path
+        self._local = threading.local()
+        self._next_purge = 0.0
+        with self._conn() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS kv ("
+                "key TEXT PRIMARY KEY, value BLOB, expires_at REAL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS kv_expires_at ON kv (expires_at)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS invalidations ("
+                "seq INTEGER PRIMARY KEY AUTOINCREMENT, key TEXT, at REAL)"
+            )
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self._path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _expires(ttl: Optional[float]) -> Optional[float]:
+        return time.time() + ttl if ttl else None
+
+    def get(self, key):
+        row = self._conn().execute(
+            "SELECT value FROM kv WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)",
+            (key, time.time()),
+        ).fetchone()
+        if row is None:
+            return None
+        return row[0] if isinstance(row[0], bytes) else str(row[0]).encode()
+
+    def set(self, key, value, ttl=None):
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, ?)",
+            (key, value, self._expires(ttl)),
+        )
+        # get() ignora randurile expirate, dar fara purge fisierul din /dev/shm doar creste
+        now = time.time()
+        if now >= self._next_purge:
+            self._next_purge = now + SQLITE_PURGE_SECONDS
+            conn.execute("DELETE FROM kv WHERE expires_at <= ?", (now,))
+
+    def delete(self, key):
+        self._conn().execute("DELETE FROM kv WHERE key = ?", (key,))
+
+    def incr(self, key, amount=1, ttl=None):
+        conn = self._conn()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM kv WHERE key = ? AND expires_at <= ?", (key, now))
+            value = conn.execute(
+                "INSERT INTO kv (key, value, expires_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + excluded.value "
+                "RETURNING value",
+                (key, amount, self._expires(ttl)),
+            ).fetchone()[0]
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return int(value)
+
+    def ttl(self, key):
+        row = self._conn().execute("SELECT expires_at FROM kv WHERE key = ?", (key,)).fetchone()
+        if row is None or row[0] is None:
+            return None
+        left = row[0] - time.time()
+        return left if left > 0 else None
+
+    def publish_invalidation(self, keys):
+        now = time.time()
+        conn = self._conn()
+        conn.executemany("INSERT INTO invalidations (key, at) VALUES (?, ?)", [(k, now) for k in keys])
+        conn.execute("DELETE FROM invalidations WHERE at < ?", (now - INVALIDATION_RETENTION,))
+
+    def poll_invalidations(self, since):
+        conn = self._conn()
+        if since is None:
+            latest = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM invalidations").fetchone()[0]
+            return latest, []
+        oldest = conn.execute("SELECT MIN(seq) FROM invalidations").fetchone()[0]
+        if oldest is not None and oldest > since + 1:
+            # log trimmed past our position: we may have missed keys
+            latest = conn.execute("SELECT MAX(seq) FROM invalidations").fetchone()[0]
+            return latest, None
+        rows = conn.execute(
+            "SELECT seq, key FROM invalidations WHERE seq > ? ORDER BY seq LIMIT ?",
+            (since, MAX_INVALIDATIONS_PER_POLL),
+        ).fetchall()
+        if not rows:
+            return since, []
+        return rows[-1][0], [key for _, key in rows]
+
+
+# ── Redis (or a compatible stand-in) ─────────────────────────────────────────
+class RedisCache(CacheBackend):
+    """Uses only GET/SET/DELETE/INCRBY/EXPIRE/TTL/MGET, so a tiny stand-in works in tests."""
+
+    SEQ_KEY = "cache:invalidations:seq"
+
+    def __init__(self, client, prefix: str = "bc:"):
+        self._client = client
+        self._prefix = prefix
+
+    @classmethod
+    def from_url(cls, url: str) -> "RedisCache":
+        import redis   # optional dependency, only needed with CACHE_URL=redis://
+        return cls(redis.Redis.from_url(url))
+
+    def _k(self, key: str) -> str:
+        return self._prefix + key
+
+    def get(self, key):
+        return self._client.get(self._k(key))
+
+    def set(self, key, value, ttl=None):
+        self._client.set(self._k(key), value, ex=int(ttl) if ttl else None)
+
+    def delete(self, key):
+        self._client.delete(self._k(key))
+
+    def incr(self, key, amount=1, ttl=None):
+        value = self._client.incrby(self._k(key), amount)
+        if ttl and value == amount:
+            self._client.expire(self._k(key), int(ttl))
+        return int(value)
+
+    def ttl(self, key):
+        left = self._client.ttl(self._k(key))
+        return float(left) if left is not None and left >= 0 else None
+
+    def publish_invalidation(self, keys):
+        for key in keys:
+            seq = self._client.incrby(self._k(self.SEQ_KEY), 1)
+            self._client.set(self._k(f"cache:invalidations:{seq}"), key, ex=INVALIDATION_RETENTION)
+
+    def poll_invalidations(self, since):
+        latest = int(self._client.get(self._k(self.SEQ_KEY)) or 0)
+        if since is None or latest == since:
+            return latest, []
+        if latest < since:
+            return latest, None   # contorul a fost resetat (Redis golit / repornit)
+        if latest - since > MAX_INVALIDATIONS_PER_POLL:
+            return latest, None
+        names = [self._k(f"cache:invalidations:{seq}") for seq in range(since + 1, latest + 1)]
+        values = self._client.mget(names)
+        if any(v is None for v in values):
+            return latest, None   # expired before we saw it
+        return latest, [v.decode() if isinstance(v, bytes) else v for v in values]
+
+
+# ── L1 + shared backend ──────────────────────────────────────────────────────
+class TieredCache(CacheBackend):
+    def __init__(self, shared: CacheBackend, l1_max_items: int = L1_MAX_ITEMS, l1_ttl: float = L1_TTL):
+        self.shared = shared
+        self._l1 = MemoryCache(l1_max_items)
+        self._l1_ttl = l1_ttl
+        # seq 0 e o pozitie valida (log gol), nu "necunoscut"
+        self._seq, _ = shared.poll_invalidations(None)
+        self._next_poll = 0.0
+        self._poll_lock = threading.Lock()
+
+    def _sync(self) -> None:
+        now = time.monotonic()
+        if now < self._next_poll or not self._poll_lock.acquire(blocking=False):
+            return
+        try:
+            self._next_poll = now + INVALIDATION_POLL_SECONDS
+            self._seq, keys = self.shared.poll_invalidations(self._seq)
+            if keys is None:
+                self._l1.clear()
+            else:
+                for key in keys:
+                    self._l1.delete(key)
+        finally:
+            self._poll_lock.release()
+
+    def get(self, key):
+        self._sync()
+        value = self._l1.get(key)
+        if value is None:
+            value = self.shared.get(key)
+            if value is not None:
+                self._l1.set(key, value, self._l1_ttl)
+        return value
+
+    def set(self, key, value, ttl=None):
+        self.shared.set(key, value, ttl)
+        self.shared.publish_invalidation([key])
+        self._l1.set(key, value, min(ttl, self._l1_ttl) if ttl else self._l1_ttl)
+
+    def delete(self, key):
+        self.shared.delete(key)
+        self.shared.publish_invalidation([key])
+        self._l1.delete(key)
+
+    def incr(self, key, amount=1, ttl=None):
+        return self.shared.incr(key, amount, ttl)   # counters are never cached in L1
+
+    def ttl(self, key):
+        return self.shared.ttl(key)
+
+
+def from_url(url: str) -> CacheBackend:
+    if url.startswith("memory://"):
+        return MemoryCache()
+    if url.startswith("sqlite:///"):
+        return TieredCache(SQLiteCache(url[len("sqlite:///"):] or _default_sqlite_path()))
+    if url.startswith(("redis://", "rediss://")):
+        return TieredCache(RedisCache.from_url(url))
+    raise ValueError(f"Unsupported CACHE_URL: {url}")
+
+
+def _default_sqlite_path() -> str:
+    base = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    return os.path.join(base, "bunnycrush-cache.sqlite")
+
+
+_cache: Optional[CacheBackend] = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> CacheBackend:
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = from_url(CACHE_URL)
+    return _cache
+
+
+def set_cache(backend: CacheBackend) -> None:
+    """Swap the process-wide cache (tests, or a Redis stand-in)."""
+    global _cache
+    _cache = backend
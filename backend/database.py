@@ -1,4 +1,5 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 import os
@@ -32,3 +33,31 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+def sync_schema(metadata) -> None:
+    """
+    create_all() creeaza doar tabelele lipsa - nu adauga coloane/indexuri noi
+    pe tabele existente. Le adaugam aici (coloanele noi sunt mereu nullable).
+    """
+    metadata.create_all(bind=engine)
+
+    inspector = inspect(engine)
+    for table in metadata.sorted_tables:
+        existing = {c["name"] for c in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            col_type = column.type.compile(dialect=engine.dialect)
+            try:
+                with engine.begin() as conn:
+                    conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {col_type}"))
+            except SQLAlchemyError:
+                # alt worker a adaugat-o intre timp
+                pass
+
+        for index in table.indexes:
+            try:
+                index.create(bind=engine, checkfirst=True)
+            except SQLAlchemyError:
+                pass
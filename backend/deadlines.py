@@ -0,0 +1,80 @@
+"""
+Deadline propagation and client-disconnect detection for slow provider calls.
+
+Every /chat and /images/generate request gets a time budget: the route
+default, lowered by the client through the X-Request-Budget header (in
+seconds). guard() runs the outbound call as a task and cancels it when the
+client goes away or the budget runs out. The caller then rolls back its
+uncommitted credit deduction, so abandoned requests stop using worker
+slots and upstream connections.
+"""
+import asyncio
+import os
+import time
+from contextlib import suppress
+
+from fastapi import Request
+
+BUDGET_HEADER = "x-request-budget"
+CHAT_BUDGET = float(os.getenv("CHAT_BUDGET_SECONDS", "60"))
+IMAGE_BUDGET = float(os.getenv("IMAGE_BUDGET_SECONDS", "170"))   # sub --timeout 200 din Procfile
+DISCONNECT_POLL_SECONDS = 0.25
+
+
+class Abandoned(Exception):
+    """The request was given up: client disconnected or budget exhausted."""
+
+    def __init__(self, reason: str):
+        self.reason = reason
+        # 499 = "client closed request" (nginx convention); 504 = budget exhausted
+        self.status_code = 499 if reason == "disconnected" else 504
+        self.detail = (
+            "Client disconnected." if reason == "disconnected"
+            else "Request took too long and was cancelled. No credits were charged."
+        )
+        super().__init__(self.detail)
+
+
+class Deadline:
+    def __init__(self, seconds: float):
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return max(self.expires_at - time.monotonic(), 0.0)
+
+
+def from_request(request: Request, default_seconds: float) -> Deadline:
+    raw = request.headers.get(BUDGET_HEADER)
+    try:
+        requested = float(raw) if raw else default_seconds
+    except ValueError:
+        requested = default_seconds
+    return Deadline(min(max(requested, 1.0), default_seconds))
+
+
+async def _wait_for_disconnect(request: Request) -> None:
+    while not await request.is_disconnected():
+        await asyncio.sleep(DISCONNECT_POLL_SECONDS)
+
+
+async def guard(request: Request, coro, deadline: Deadline):
+    """Await `coro`, cancelling it if the client disconnects or the deadline passes."""
+    work = asyncio.ensure_future(coro)
+    watcher = asyncio.ensure_future(_wait_for_disconnect(request))
+    try:
+        done, _ = await asyncio.wait(
+            {work, watcher}, timeout=deadline.remaining(), return_when=asyncio.FIRST_COMPLETED
+        )
+        if work in done:
+            return work.result()
+        reason = "disconnected" if watcher in done else "deadline"
+    finally:
+        watcher.cancel()
+        if not work.done():
+            work.cancel()
+            # asteptam anularea: conexiunea catre provider se inchide aici
+            with suppress(asyncio.CancelledError, Exception):
+                await work
+
+    print(f"[DEADLINE] {request.url.path} abandoned ({reason})")
+    raise Abandoned(reason)
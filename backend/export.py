@@ -0,0 +1,202 @@
+"""
+Streaming exports of a user's conversations and gallery.
+
+Rows are read in keyset-paginated chunks of EXPORT_CHUNK_ROWS. Each chunk
+uses its own short session, and inside a chunk the rows are streamed with
+yield_per. A pool connection is held only while one chunk is read, never
+while the client downloads, and memory stays flat whatever the account
+size. The first bytes go out as soon as the first chunk is read.
+
+Formats:
+  ndjson  one JSON object per line
+  csv     header + rows
+  zip     messages.ndjson + images.ndjson + images/<id>.jpg (mirrored from
+          the provider URLs, one at a time; failures listed in
+          missing_images.txt). Written with ZipFile on a non-seekable
+          stream, so the archive is never built in memory or on disk.
+
+The generators are sync: StreamingResponse iterates them on the threadpool.
+"""
+import csv
+import io
+import os
+import zipfile
+from datetime import datetime
+from typing import Iterator, List, Optional
+
+import orjson
+from sqlalchemy import and_, or_, select
+
+import database
+import models
+
+EXPORT_CHUNK_ROWS = int(os.getenv("EXPORT_CHUNK_ROWS", "500"))
+IMAGE_DOWNLOAD_TIMEOUT = 30
+KINDS = ("messages", "images")
+FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+    "zip": "application/zip",
+}
+
+MESSAGE_COLUMNS = [
+    models.Message.id,
+    models.Message.character_id,
+    models.Message.sender,
+    models.Message.content,
+    models.Message.is_image,
+    models.Message.image_url,
+    models.Message.credits_cost,
+    models.Message.timestamp,
+]
+IMAGE_COLUMNS = [
+    models.ImageGeneration.id,
+    models.ImageGeneration.character_id,
+    models.ImageGeneration.prompt,
+    models.ImageGeneration.nsfw_level,
+    models.ImageGeneration.credits_cost,
+    models.ImageGeneration.image_url,
+    models.ImageGeneration.liked,
+    models.ImageGeneration.status,
+    models.ImageGeneration.created_at,
+]
+
+
+def _query(kind: str, user_id: str, character_id: Optional[str]):
+    if kind == "messages":
+        msg = models.Message
+        stmt = (
+            select(*MESSAGE_COLUMNS)
+            .join(models.Character, models.Character.id == msg.character_id)
+            .where(models.Character.user_id == user_id)
+        )
+        if character_id:
+            stmt = stmt.where(msg.character_id == character_id)
+        return stmt, msg.timestamp, msg.id
+
+    img = models.ImageGeneration
+    stmt = select(*IMAGE_COLUMNS).where(img.user_id == user_id)
+    if character_id:
+        stmt = stmt.where(img.character_id == character_id)
+    return stmt, img.created_at, img.id
+
+
+def iter_chunks(kind: str, user_id: str, character_id: Optional[str] = None) -> Iterator[List[dict]]:
+    """Rows as dicts, EXPORT_CHUNK_ROWS at a time, oldest first."""
+    stmt, sort_col, id_col = _query(kind, user_id, character_id)
+    after = None   # (sort value, id) ale ultimului rand trimis
+    while True:
+        page = stmt
+        if after is not None:
+            page = page.where(or_(sort_col > after[0], and_(sort_col == after[0], id_col > after[1])))
+        page = (
+            page.order_by(sort_col, id_col)
+            .limit(EXPORT_CHUNK_ROWS)
+            .execution_options(yield_per=EXPORT_CHUNK_ROWS)
+        )
+
+        db = database.SessionLocal()
+        try:
+            rows = [dict(row._mapping) for row in db.execute(page)]
+        finally:
+            db.close()   # conexiunea se intoarce in pool inainte sa trimitem chunk-ul
+
+        if not rows:
+            return
+        yield rows
+        if len(rows) < EXPORT_CHUNK_ROWS:
+            return
+        last = rows[-1]
+        after = (last[sort_col.key], last["id"])
+
+
+# ── Formats ──────────────────────────────────────────────────────────────────
+def ndjson(kind: str, user_id: str, character_id: Optional[str] = None) -> Iterator[bytes]:
+    for rows in iter_chunks(kind, user_id, character_id):
+        yield b"".join(orjson.dumps(row) + b"\n" for row in rows)
+
+
+def _csv_value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def csv_rows(kind: str, user_id: str, character_id: Optional[str] = None) -> Iterator[bytes]:
+    columns = MESSAGE_COLUMNS if kind == "messages" else IMAGE_COLUMNS
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([c.key for c in columns])
+    for rows in iter_chunks(kind, user_id, character_id):
+        writer.writerows([_csv_value(v) for v in row.values()] for row in rows)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()   # doar header-ul: export gol
+
+
+class _Pipe(io.RawIOBase):
+    """Write-only, non-seekable sink: ZipFile writes into it, the generator drains it."""
+
+    def __init__(self):
+        self.chunks: List[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+def zip_archive(user_id: str, character_id: Optional[str] = None, mirror_images: bool = True) -> Iterator[bytes]:
+    # deflate tine date in buffer: multe drain()-uri sunt goale, nu le trimitem
+    return (data for data in _zip_chunks(user_id, character_id, mirror_images) if data)
+
+
+def _zip_chunks(user_id: str, character_id: Optional[str], mirror_images: bool) -> Iterator[bytes]:
+    pipe = _Pipe()
+    missing = []
+    with zipfile.ZipFile(pipe, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for kind in KINDS:
+            with archive.open(f"{kind}.ndjson", "w") as entry:
+                for chunk in ndjson(kind, user_id, character_id):
+                    entry.write(chunk)
+                    yield pipe.drain()
+
+        if mirror_images:
+            import httpx   # lazy, ca in image_gen
+
+            with httpx.Client(timeout=IMAGE_DOWNLOAD_TIMEOUT, follow_redirects=True) as client:
+                for rows in iter_chunks("images", user_id, character_id):
+                    for row in rows:
+                        if not row["image_url"]:
+                            continue
+                        if not _mirror(client, archive, row):
+                            missing.append(row["id"])
+                        yield pipe.drain()
+
+        if missing:
+            archive.writestr("missing_images.txt", "\n".join(missing) + "\n")
+    yield pipe.drain()
+
+
+def _mirror(client, archive: zipfile.ZipFile, row: dict) -> bool:
+    # O imagine intreaga in memorie (sute de KB), deci nu ramane intrare partiala in arhiva la eroare
+    try:
+        response = client.get(row["image_url"])
+    except Exception as e:
+        print(f"[EXPORT] image {row['id']} not mirrored: {e}")
+        return False
+    if response.status_code != 200:
+        return False
+
+    created = row["created_at"] or datetime(1980, 1, 1)
+    info = zipfile.ZipInfo(f"images/{row['id']}.jpg", date_time=created.timetuple()[:6])
+    info.compress_type = zipfile.ZIP_STORED   # JPEG-ul e deja comprimat
+    archive.writestr(info, response.content)
+    return True
@@ -0,0 +1,73 @@
+"""
+Conditional GET helpers (ETag / Last-Modified) for the read endpoints
+the frontend polls: /auth/me, /characters, /images/gallery, /credits/packages.
+
+ETags are built from cheap version data (updated_at, row counts) so a
+304 can be answered without loading or serializing the full rows.
+"""
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Optional
+
+from fastapi import Request, Response
+
+# Per-user data: the browser may keep it but must revalidate every time
+PRIVATE_REVALIDATE = "private, no-cache"
+
+
+def make_etag(*parts) -> str:
+    raw = "|".join(
+        "" if p is None else p.isoformat() if isinstance(p, datetime) else str(p)
+        for p in parts
+    )
+    return 'W/"' + hashlib.blake2b(raw.encode(), digest_size=12).hexdigest() + '"'
+
+
+def _opaque(tag: str) -> str:
+    return tag[2:] if tag.startswith("W/") else tag
+
+
+def _http_date(dt: datetime) -> str:
+    return format_datetime(dt.replace(tzinfo=timezone.utc, microsecond=0), usegmt=True)
+
+
+def is_fresh(request: Request, etag: str, last_modified: Optional[datetime] = None) -> bool:
+    """True if the client's cached copy is still valid (If-None-Match wins over If-Modified-Since)."""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [t.strip() for t in if_none_match.split(",")]
+        return "*" in tags or _opaque(etag) in {_opaque(t) for t in tags}
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        return last_modified.replace(tzinfo=timezone.utc, microsecond=0) <= since
+    return False
+
+
+def apply(
+    response: Response,
+    etag: str,
+    last_modified: Optional[datetime] = None,
+    cache_control: str = PRIVATE_REVALIDATE,
+) -> None:
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = cache_control
+    if last_modified:
+        response.headers["Last-Modified"] = _http_date(last_modified)
+    if cache_control.startswith("private"):
+        response.headers["Vary"] = "Authorization"
+
+
+def not_modified(
+    etag: str,
+    last_modified: Optional[datetime] = None,
+    cache_control: str = PRIVATE_REVALIDATE,
+) -> Response:
+    response = Response(status_code=304)
+    apply(response, etag, last_modified, cache_control)
+    return response
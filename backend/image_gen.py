@@ -1,9 +1,35 @@
+import asyncio
+import hashlib
 import os
 import random
-import requests
+
+import orjson
+
+import cache
 
 FAL_MODEL = "fal-ai/flux/dev"
 
+# Progressive mode: a cheap "draft" render first (same seed, so it previews the
+# same composition), then the "full" one replaces it. Every tier is env-configurable.
+PROGRESSIVE_IMAGES = os.getenv("PROGRESSIVE_IMAGES", "1") == "1"
+
+
+def _tier(name: str, model: str, steps: int, width: int, height: int, guidance: float) -> dict:
+    env = f"IMAGE_{name.upper()}_"
+    return {
+        "model": os.getenv(env + "MODEL", model),
+        "steps": int(os.getenv(env + "STEPS", steps)),
+        "width": int(os.getenv(env + "WIDTH", width)),
+        "height": int(os.getenv(env + "HEIGHT", height)),
+        "guidance_scale": float(os.getenv(env + "GUIDANCE", guidance)),
+    }
+
+
+TIERS = {
+    "draft": _tier("draft", "fal-ai/flux/schnell", 4, 384, 512, 3.5),
+    "full": _tier("full", FAL_MODEL, 28, 768, 1024, 3.5),
+}
+
 BASE_QUALITY = (
     "RAW photo, 8k uhd, photorealistic, dslr, sharp focus, "
     "soft studio lighting, realistic skin texture, high detail"
@@ -31,56 +57,112 @@ def build_prompt(visual_prompt: str, scenario: str, nsfw: bool) -> str:
     return f"{base}, {style}, {BASE_QUALITY}"
 
 
-def generate_image(visual_prompt: str, scenario: str, nsfw: bool = False, seed: int = None) -> str:
-    if seed is None:
-        seed = random.randint(1, 2**32 - 1)
-
-    prompt = build_prompt(visual_prompt, scenario, nsfw)
+def _request_args(visual_prompt: str, scenario: str, nsfw: bool, seed: int, tier: str = "full") -> dict:
     fal_key = os.getenv("FAL_KEY")
-
     if not fal_key:
         raise RuntimeError("FAL_KEY not configured")
 
-    try:
-        response = requests.post(
-            f"https://fal.run/{FAL_MODEL}",
-            headers={
-                "Authorization": f"Key {fal_key}",
-                "Content-Type": "application/json",
-            },
-            json={
-                "prompt": prompt,
-                "image_size": {"width": 768, "height": 1024},
-                "num_inference_steps": 28,
-                "guidance_scale": 3.5,
-                "seed": seed,
-                "enable_safety_checker": False,
-                "num_images": 1,
-                "output_format": "jpeg",
-            },
-            timeout=180,
-        )
+    config = TIERS[tier]
+    return dict(
+        url=f"https://fal.run/{config['model']}",
+        headers={
+            "Authorization": f"Key {fal_key}",
+            "Content-Type": "application/json",
+        },
+        json={
+            "prompt": build_prompt(visual_prompt, scenario, nsfw),
+            "image_size": {"width": config["width"], "height": config["height"]},
+            "num_inference_steps": config["steps"],
+            "guidance_scale": config["guidance_scale"],
+            "seed": seed,
+            "enable_safety_checker": False,
+            "num_images": 1,
+            "output_format": "jpeg",
+        },
+    )
+
+
+# Same model + prompt + size + seed = same picture: a repeated request (a character's
+# fixed seed, same scenario) reuses the URL from the shared cache instead of a new render.
+IMAGE_CACHE_SECONDS = int(os.getenv("IMAGE_CACHE_SECONDS", "3600"))
+
+
+def _result_key(args: dict) -> str:
+    payload = orjson.dumps([args["url"], args["json"]], option=orjson.OPT_SORT_KEYS)
+    return "image_result:v1:" + hashlib.sha256(payload).hexdigest()
+
 
-        if response.status_code != 200:
-            raise RuntimeError(f"fal.ai API error {response.status_code}: {response.text[:500]}")
+def _image_url(status_code: int, text: str, data) -> str:
+    if status_code != 200:
+        raise RuntimeError(f"fal.ai API error {status_code}: {text[:500]}")
 
-        data = response.json()
-        images = data.get("images", [])
-        if not images:
-            raise RuntimeError("No images returned from fal.ai")
+    images = data.get("images", [])
+    if not images:
+        raise RuntimeError("No images returned from fal.ai")
 
-        return images[0]["url"]
+    return images[0]["url"]
+
+
+def generate_image(
+    visual_prompt: str, scenario: str, nsfw: bool = False, seed: int = None, tier: str = "full"
+) -> str:
+    if seed is None:
+        seed = random.randint(1, 2**32 - 1)
+
+    import requests   # lazy: keep HTTP clients off worker boot
+    args = _request_args(visual_prompt, scenario, nsfw, seed, tier)
+    try:
+        response = requests.post(**args, timeout=180)
+        data = response.json() if response.status_code == 200 else {}
+        return _image_url(response.status_code, response.text, data)
 
     except requests.RequestException as e:
         raise RuntimeError(f"fal.ai request failed: {e}")
 
 
-def generate_avatar(visual_prompt: str, seed: int = None) -> str:
+async def agenerate_image(
+    visual_prompt: str, scenario: str, nsfw: bool = False, seed: int = None, tier: str = "full"
+) -> str:
+    """Async variant: cancelling the awaiting task closes the fal.ai connection.
+
+    With an explicit seed the result is cached (see IMAGE_CACHE_SECONDS).
+    """
+    pinned = seed is not None
+    if seed is None:
+        seed = random.randint(1, 2**32 - 1)
+
+    import httpx
+    args = _request_args(visual_prompt, scenario, nsfw, seed, tier)
+    store, key = cache.get_cache(), _result_key(args)
+    if pinned:
+        cached = await asyncio.to_thread(store.get, key)   # Redis / SQLite: nu blocam event loop-ul
+        if cached is not None:
+            return cached.decode()
+
+    try:
+        async with httpx.AsyncClient(timeout=180) as client:
+            response = await client.post(**args)
+        data = response.json() if response.status_code == 200 else {}
+        url = _image_url(response.status_code, response.text, data)
+
+    except httpx.HTTPError as e:
+        raise RuntimeError(f"fal.ai request failed: {e}")
+
+    if pinned:
+        await asyncio.to_thread(store.set, key, url.encode(), IMAGE_CACHE_SECONDS)
+    return url
+
+
+AVATAR_SCENARIO = "close-up portrait, smiling, looking at camera, headshot"
+
+
+def generate_avatar(visual_prompt: str, seed: int = None, tier: str = "full") -> str:
     if seed is None:
         seed = random.randint(1, 2**32 - 1)
     return generate_image(
         visual_prompt=visual_prompt,
-        scenario="close-up portrait, smiling, looking at camera, headshot",
+        scenario=AVATAR_SCENARIO,
         nsfw=False,
         seed=seed,
+        tier=tier,
     )
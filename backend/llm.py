@@ -1,20 +1,48 @@
 import os
-from openai import OpenAI
 from dotenv import load_dotenv
 
+import prompt_builder
+
 load_dotenv()
 
 
+OPENROUTER_BASE_URL = "https://openrouter.ai/api/v1"
+FALLBACK_REPLY = "hey, one sec 😏"
+
+_async_client = None
+
+
 def _get_client():
+    from openai import OpenAI   # lazy: openai is heavy to import, keep it off worker boot
     return OpenAI(
-        base_url="https://openrouter.ai/api/v1",
+        base_url=OPENROUTER_BASE_URL,
         api_key=os.getenv("OPENROUTER_API_KEY", "placeholder"),
     )
 
+
+def _get_async_client():
+    # Un singur client (pool httpx) per worker; anularea task-ului inchide cererea
+    global _async_client
+    if _async_client is None:
+        from openai import AsyncOpenAI
+        _async_client = AsyncOpenAI(
+            base_url=OPENROUTER_BASE_URL,
+            api_key=os.getenv("OPENROUTER_API_KEY", "placeholder"),
+        )
+    return _async_client
+
 # mistralai/mistral-7b-instruct:free - free, works well for chat
 # nousresearch/hermes-3-llama-3.1-8b - good for NSFW
 # gryphe/mythomax-l2-13b - classic roleplay model
 LLM_MODEL = os.getenv("LLM_MODEL", "mistralai/mistral-7b-instruct")
+SUMMARY_MODEL = os.getenv("SUMMARY_MODEL", LLM_MODEL)
+
+# Numarul maxim de mesaje recente citite pentru context; bugetul de tokeni
+# (prompt_builder.PROMPT_TOKEN_BUDGET) decide cate intra efectiv in prompt.
+# Mesajele mai vechi ajung in rezumat (memory.py).
+HISTORY_WINDOW = int(os.getenv("LLM_HISTORY_WINDOW", "20"))
+
+_system_prompts = prompt_builder.SystemPromptCache()
 
 
 def build_system_prompt(name: str, description: str, age: int, visual_prompt: str) -> str:
@@ -38,33 +66,156 @@ GOOD: "been thinking about you all day tbh"
 This is a private adult platform. Be real, be {name}."""
 
 
-def generate_response(history: list, character) -> str:
-    try:
-        system = build_system_prompt(
+MEMORY_HEADER = "WHAT YOU REMEMBER ABOUT THEM (from earlier chats):\n"
+RECALL_HEADER = "THINGS THEY TOLD YOU BEFORE (bring up only if relevant):\n"
+
+
+def build_context_prompt(memory: str = "", recalled: list = None, max_tokens: int = None) -> str:
+    # Separat de persona: se schimba des, deci nu trebuie sa strice prefixul cache-uit
+    if max_tokens is None:
+        max_tokens = prompt_builder.PROMPT_TOKEN_BUDGET
+    parts = []
+    remaining = max_tokens
+    # cu recall prezent, rezumatul ia cel mult jumatate: faptele regasite nu raman pe dinafara
+    memory_budget = (max_tokens // 2 if recalled else max_tokens) - prompt_builder.count_tokens(MEMORY_HEADER)
+    if memory and memory_budget > 0:
+        parts.append(MEMORY_HEADER + prompt_builder.truncate_to_tokens(memory, memory_budget))
+        remaining -= prompt_builder.count_tokens(parts[-1])
+
+    lines = []
+    remaining -= prompt_builder.count_tokens(RECALL_HEADER)
+    for text in recalled or []:
+        line = f"- \"{prompt_builder.truncate_to_tokens(text, prompt_builder.RECALL_SNIPPET_TOKENS)}\""
+        cost = prompt_builder.count_tokens(line) + 1
+        if cost > remaining:
+            break
+        lines.append(line)
+        remaining -= cost
+    if lines:
+        parts.append(RECALL_HEADER + "\n".join(lines))
+    return "\n\n".join(parts)
+
+
+def system_prompt_for(character) -> tuple:
+    """Cached (persona prompt, token count) for the current character version."""
+    return _system_prompts.get(
+        (character.id, character.updated_at),
+        lambda: build_system_prompt(
             name=character.name,
             description=character.description or "Confident, flirty, direct",
             age=character.age or 24,
             visual_prompt=character.visual_prompt or "beautiful woman",
-        )
+        ),
+    )
 
-        messages = [{"role": "system", "content": system}]
 
-        for msg in history[-10:]:
-            role = "assistant" if msg.sender == "ai" else "user"
-            content = "[just sent you a photo]" if msg.is_image else msg.content
-            messages.append({"role": role, "content": content})
+def build_messages(history: list, character, recalled: list = None) -> list:
+    """[persona (byte-stable)] + [memory context] + newest history that fits the token budget."""
+    system, system_tokens = system_prompt_for(character)
+    messages = [{"role": "system", "content": system}]
+    budget = prompt_builder.PROMPT_TOKEN_BUDGET - system_tokens
+    turns = [
+        {
+            "role": "assistant" if msg.sender == "ai" else "user",
+            "content": "[just sent you a photo]" if msg.is_image else msg.content,
+        }
+        for msg in history[-HISTORY_WINDOW:]
+    ]
+
+    # Memoria + recall au o cota fixa si nu pot lua locul mesajului curent
+    current = prompt_builder.turn_cost(turns[-1]) if turns else 0
+    context_budget = min(int(budget * prompt_builder.CONTEXT_BUDGET_SHARE), budget - current)
+    context = build_context_prompt(character.memory_summary or "", recalled, max(context_budget, 0))
+    if context:
+        messages.append({"role": "system", "content": context})
+        budget -= prompt_builder.count_tokens(context) + prompt_builder.TURN_OVERHEAD_TOKENS
+
+    messages.extend(prompt_builder.fill_history(turns, budget))
+    return messages
+
+
+def _chat_params(messages: list) -> dict:
+    return dict(
+        model=LLM_MODEL,
+        messages=messages,
+        temperature=0.95,
+        max_tokens=120,
+        presence_penalty=0.6,
+        frequency_penalty=0.3,
+    )
 
-        response = _get_client().chat.completions.create(
-            model=LLM_MODEL,
-            messages=messages,
-            temperature=0.95,
-            max_tokens=120,
-            presence_penalty=0.6,
-            frequency_penalty=0.3,
-        )
 
+def generate_response(history: list, character, recalled: list = None) -> str:
+    try:
+        messages = build_messages(history, character, recalled)
+        response = _get_client().chat.completions.create(**_chat_params(messages))
+        return response.choices[0].message.content.strip()
+
+    except Exception as e:
+        print(f"[LLM ERROR] {e}")
+        return FALLBACK_REPLY
+
+
+async def astream_response(history: list, character, recalled: list = None):
+    """Yields reply text deltas as OpenRouter streams them (WebSocket chat)."""
+    produced = False
+    try:
+        messages = build_messages(history, character, recalled)
+        stream = await _get_async_client().chat.completions.create(**_chat_params(messages), stream=True)
+        async for chunk in stream:
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                produced = True
+                yield delta
+
+    except Exception as e:
+        print(f"[LLM STREAM ERROR] {e}")
+
+    if not produced:
+        yield FALLBACK_REPLY
+
+
+async def agenerate_response(history: list, character, recalled: list = None) -> str:
+    """Async variant: cancelling the awaiting task aborts the OpenRouter request."""
+    try:
+        messages = build_messages(history, character, recalled)
+        response = await _get_async_client().chat.completions.create(**_chat_params(messages))
         return response.choices[0].message.content.strip()
 
     except Exception as e:
         print(f"[LLM ERROR] {e}")
-        return "hey, one sec 😏"
\ No newline at end of file
+        return FALLBACK_REPLY
+
+
+def summarize_conversation(name: str, previous_summary: str, history: list, max_tokens: int) -> str:
+    """Fold `history` into `previous_summary`. Returns "" on failure (old summary is kept)."""
+    transcript = "\n".join(
+        f"{name if msg.sender == 'ai' else 'Them'}: "
+        f"{'[sent a photo]' if msg.is_image else msg.content}"
+        for msg in history
+    )
+    instructions = (
+        f"You maintain the long-term memory of {name}, a character in an ongoing chat. "
+        "Update the memory with the new messages. Keep durable facts about the other person "
+        "(name, job, likes, plans, things they shared), important events and the tone of the "
+        "relationship. Drop small talk. Write short bullet points in third person. "
+        f"Stay under {int(max_tokens * 0.75)} words."
+    )
+    try:
+        response = _get_client().chat.completions.create(
+            model=SUMMARY_MODEL,
+            messages=[
+                {"role": "system", "content": instructions},
+                {"role": "user", "content": (
+                    f"CURRENT MEMORY:\n{previous_summary or '(empty)'}\n\n"
+                    f"NEW MESSAGES:\n{transcript}"
+                )},
+            ],
+            temperature=0.2,
+            max_tokens=max_tokens,
+        )
+        return (response.choices[0].message.content or "").strip()
+
+    except Exception as e:
+        print(f"[LLM SUMMARY ERROR] {e}")
+        return ""
@@ -1,10 +1,18 @@
-from fastapi import FastAPI, Depends, HTTPException, Request, Header
+import time
+_BOOT_STARTED = time.perf_counter()   # inainte de importuri: masuram si costul lor
+
+from fastapi import FastAPI, BackgroundTasks, Depends, HTTPException, Request, Response, Header, WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from sqlalchemy import delete, func, not_, or_, update
 from sqlalchemy.orm import Session
-from pydantic import BaseModel
-from typing import Optional
-from datetime import datetime
-import stripe
+from pydantic import BaseModel, ConfigDict
+from typing import List, Optional
+from datetime import datetime, timedelta
+import asyncio
+import hmac
+import orjson
 import os
 import random
 
@@ -13,14 +21,31 @@ import database
 import utils
 import llm
 import image_gen
+import deadlines
+import realtime
+import profiling
+import memory
+import vector_memory
+import http_cache
+import billing
+import export
+import passwords
+import scheduler
+import search
+
+_IMPORTS_MS = (time.perf_counter() - _BOOT_STARTED) * 1000
 
 # ── Initialize ───────────────────────────────────────────────────────────────
-models.Base.metadata.create_all(bind=database.engine)
+# Schema + seed: migrate.py, rulat o data per deploy (Procfile release), nu in fiecare worker
+if os.getenv("AUTO_MIGRATE") == "1":
+    import migrate
+    migrate.run()
 
-stripe.api_key = os.getenv("STRIPE_SECRET_KEY")
 STRIPE_WEBHOOK_SECRET = os.getenv("STRIPE_WEBHOOK_SECRET", "")
 
-app = FastAPI(title="BunnyCrush API", version="1.0.0")
+# ORJSONResponse: datetime-urile sunt serializate direct de orjson, fara jsonable_encoder
+# (varianta Timed masoara si faza "json" cand PROFILING_ENABLED=1)
+app = FastAPI(title="BunnyCrush API", version="1.0.0", default_response_class=profiling.TimedORJSONResponse)
 
 def _build_cors_origins() -> list:
     raw = os.getenv("ALLOWED_ORIGINS", "*").strip()
@@ -50,27 +75,24 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+profiling.install(app, database.engine)
+
+
+# ── Worker boot time ─────────────────────────────────────────────────────────
+_boot_stats = {"imports_ms": round(_IMPORTS_MS, 1), "ready_ms": None}
+
 
-# ── Seed credit packages on startup ──────────────────────────────────────────
 @app.on_event("startup")
 def startup():
-    db = database.SessionLocal()
-    try:
-        packages = [
-            {"id": "starter",     "name": "Starter",      "credits": 100,  "bonus_credits": 0,    "price_usd": 9.99},
-            {"id": "basic",       "name": "Basic",        "credits": 250,  "bonus_credits": 10,   "price_usd": 19.99},
-            {"id": "popular",     "name": "Popular",      "credits": 600,  "bonus_credits": 60,   "price_usd": 39.99},
-            {"id": "pro",         "name": "Premium",      "credits": 1500, "bonus_credits": 300,  "price_usd": 89.99},
-            {"id": "vip",         "name": "Premium",      "credits": 4000, "bonus_credits": 1200, "price_usd": 199.99},
-            {"id": "sub_monthly", "name": "Monthly Sub",  "credits": 100,  "bonus_credits": 0,    "price_usd": 10.00},
-            {"id": "sub_annual",  "name": "Annual Sub",   "credits": 1000, "bonus_credits": 0,    "price_usd": 72.00},
-        ]
-        for p in packages:
-            if not db.query(models.CreditPackage).filter_by(id=p["id"]).first():
-                db.add(models.CreditPackage(**p))
-        db.commit()
-    finally:
-        db.close()
+    # Logat la fiecare boot: urmarim cold start / autoscale-up in logurile Railway
+    _boot_stats["ready_ms"] = round((time.perf_counter() - _BOOT_STARTED) * 1000, 1)
+    print(f"[STARTUP] worker {os.getpid()} ready in {_boot_stats['ready_ms']:.0f}ms "
+          f"(imports {_boot_stats['imports_ms']:.0f}ms)")
+
+
+@app.on_event("shutdown")
+def shutdown():
+    passwords.shutdown()
 
 
 # ═══════════════════════════════════════════════════════════
@@ -109,13 +131,158 @@ class StripeCheckoutRequest(BaseModel):
 class LikeRequest(BaseModel):
     image_id: str
 
+class ProfileRequest(BaseModel):
+    route: str             # path prefix, e.g. "/chat"
+    requests: int = 10
+
+
+# ── Responses ─────────────────────────────────────────────────────────────────
+# from_attributes: routes return ORM objects / SQL rows directly, no dict building
+
+class ORMModel(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+class UserOut(ORMModel):
+    id: str
+    email: str
+    username: Optional[str] = None
+    credits: int
+    level: int
+    total_spent: int
+    is_premium: bool
+    created_at: Optional[datetime] = None
+
+class TokenOut(ORMModel):
+    access_token: str
+    token_type: str
+    user: UserOut
+
+class CharacterOut(ORMModel):
+    id: str
+    name: str
+    age: Optional[int] = None
+    description: Optional[str] = None
+    visual_prompt: Optional[str] = None
+    avatar_url: Optional[str] = None
+    total_images_generated: int = 0
+    created_at: Optional[datetime] = None
+
+class MessageOut(ORMModel):
+    id: str
+    sender: str
+    content: Optional[str] = None
+    is_image: bool = False
+    image_url: Optional[str] = None
+    credits_cost: int = 0
+    timestamp: Optional[datetime] = None
+
+class ChatOut(BaseModel):
+    response: str
+    credits: int
+    level: int
+
+class ImageGenerateOut(BaseModel):
+    image_url: str          # the draft while status == "rendering"; image_ready event brings the full one
+    image_id: str
+    status: str = "ready"
+    credits: int
+    level: int
+    credits_spent: int
+
+class ImageCancelOut(BaseModel):
+    image_id: str
+    credits: int
+
+class GalleryImageOut(ORMModel):
+    id: str
+    character_id: Optional[str] = None
+    image_url: Optional[str] = None
+    nsfw: bool
+    credits_cost: Optional[int] = None
+    liked: bool = False
+    status: Optional[str] = None
+    created_at: Optional[datetime] = None
+
+class GalleryStatsOut(ORMModel):
+    character_id: Optional[str] = None
+    images: int
+    liked: int
+    last_created_at: Optional[datetime] = None
+
+class LikeOut(BaseModel):
+    liked: bool
+
+class PackageOut(BaseModel):
+    id: str
+    name: str
+    credits: int
+    bonus_credits: int
+    total_credits: int
+    price_usd: float
+    stripe_price_id: Optional[str] = None
+
+class CheckoutOut(BaseModel):
+    checkout_url: str
+    session_id: str
+
+class TransactionOut(ORMModel):
+    id: str
+    type: str
+    amount: int
+    description: Optional[str] = None
+    status: str
+    created_at: Optional[datetime] = None
+
+class SearchHitOut(ORMModel):
+    id: str
+    character_id: Optional[str] = None
+    sender: Optional[str] = None
+    snippet: str
+    created_at: Optional[datetime] = None
+
+class SearchOut(BaseModel):
+    results: List[SearchHitOut]
+    next_cursor: Optional[str] = None
+
+class DashboardUserOut(UserOut):
+    total_messages: int = 0
+    total_images: int = 0
+    last_active_at: Optional[datetime] = None
+
+class DashboardCharacterOut(CharacterOut):
+    total_messages: int = 0
+    credits_spent: int = 0
+    last_message_at: Optional[datetime] = None
+
+class DashboardOut(BaseModel):
+    user: DashboardUserOut
+    characters: List[DashboardCharacterOut]
+    recent_images: List[GalleryImageOut]
+    recent_transactions: List[TransactionOut]
+
+class DetailOut(BaseModel):
+    message: str
+
+class StatusOut(BaseModel):
+    status: str
+
+class HealthOut(StatusOut):
+    version: str
+
 
 # ═══════════════════════════════════════════════════════════
 # AUTH
 # ═══════════════════════════════════════════════════════════
 
-@app.post("/auth/register", summary="Register new account")
-def register(body: UserRegister, db: Session = Depends(database.get_db)):
+async def _password_job(coro):
+    """Await a passwords.* call, turning pool back-pressure into 503 + Retry-After."""
+    try:
+        return await coro
+    except passwords.Busy as e:
+        raise HTTPException(e.status_code, e.detail, headers={"Retry-After": str(e.retry_after)})
+
+
+def _check_registration(db: Session, body: UserRegister) -> None:
     if db.query(models.User).filter(models.User.email == body.email).first():
         raise HTTPException(400, "This email is already registered.")
 
@@ -123,13 +290,12 @@ def register(body: UserRegister, db: Session = Depends(database.get_db)):
         if db.query(models.User).filter(models.User.username == body.username).first():
             raise HTTPException(400, "This username is already taken.")
 
-    if len(body.password) < 6:
-        raise HTTPException(400, "Password must be at least 6 characters.")
 
+def _create_user(db: Session, body: UserRegister, hashed_password: str) -> models.User:
     user = models.User(
         email=body.email,
         username=body.username,
-        hashed_password=utils.get_password_hash(body.password),
+        hashed_password=hashed_password,
         credits=10,
         level=1,
     )
@@ -141,68 +307,129 @@ def register(body: UserRegister, db: Session = Depends(database.get_db)):
 
     db.commit()
     db.refresh(user)
+    return user
+
+
+@app.post("/auth/register", summary="Register new account", response_model=TokenOut)
+async def register(body: UserRegister, db: Session = Depends(database.get_db)):
+    if len(body.password) < 6:
+        raise HTTPException(400, "Password must be at least 6 characters.")
+
+    await run_in_threadpool(_check_registration, db, body)
+    hashed = await _password_job(passwords.hash(body.password))
+    user = await run_in_threadpool(_create_user, db, body, hashed)
 
     token = utils.create_access_token({"sub": user.id})
     return {
         "access_token": token,
         "token_type": "bearer",
-        "user": _user_response(user),
+        "user": user,
     }
 
 
-@app.post("/auth/login", summary="Login")
-def login(body: UserLogin, db: Session = Depends(database.get_db)):
-    user = db.query(models.User).filter(models.User.email == body.email).first()
-    if not user or not utils.verify_password(body.password, user.hashed_password):
-        raise HTTPException(401, "Incorrect email or password.")
-
+def _record_login(db: Session, user: models.User, new_hash: Optional[str]) -> None:
+    if new_hash:   # hash vechi (alt cost bcrypt) - il inlocuim transparent
+        user.hashed_password = new_hash
     user.last_login = datetime.utcnow()
     db.commit()
+    db.refresh(user)   # serializarea raspunsului ruleaza pe event loop, nu aici
+
+
+@app.post("/auth/login", summary="Login", response_model=TokenOut)
+async def login(body: UserLogin, db: Session = Depends(database.get_db)):
+    user = await run_in_threadpool(
+        lambda: db.query(models.User).filter(models.User.email == body.email).first()
+    )
+    if not user:
+        raise HTTPException(401, "Incorrect email or password.")
+
+    ok, new_hash = await _password_job(passwords.verify(body.password, user.hashed_password))
+    if not ok:
+        raise HTTPException(401, "Incorrect email or password.")
+
+    await run_in_threadpool(_record_login, db, user, new_hash)
 
     token = utils.create_access_token({"sub": user.id})
     return {
         "access_token": token,
         "token_type": "bearer",
-        "user": _user_response(user),
+        "user": user,
     }
 
 
-@app.get("/auth/me", summary="Current account info")
-def get_me(user: models.User = Depends(utils.get_current_user)):
-    return _user_response(user)
-
-
-def _user_response(user: models.User) -> dict:
-    return {
-        "id": user.id,
-        "email": user.email,
-        "username": user.username,
-        "credits": user.credits,
-        "level": user.level,
-        "total_spent": user.total_spent,
-        "is_premium": user.is_premium,
-        "created_at": user.created_at,
-    }
+@app.get("/auth/me", summary="Current account info", response_model=UserOut)
+def get_me(
+    request: Request,
+    response: Response,
+    user: models.User = Depends(utils.get_current_user),
+):
+    etag = http_cache.make_etag("me", user.id, user.updated_at)
+    if http_cache.is_fresh(request, etag, user.updated_at):
+        return http_cache.not_modified(etag, user.updated_at)
+    http_cache.apply(response, etag, user.updated_at)
+    return user
 
 
 # ═══════════════════════════════════════════════════════════
 # CHARACTERS
 # ═══════════════════════════════════════════════════════════
 
-@app.post("/characters", summary="Create character")
+def _render_avatar(user_id: str, tier: str, char_id: str, visual_prompt: str, seed: int, draft_url: str) -> None:
+    """Background: full-quality avatar replaces the draft the character was created with."""
+    try:
+        with scheduler.blocking_slot("image", tier, admit=False):   # deja admis la creare
+            avatar_url = image_gen.generate_avatar(visual_prompt, seed=seed, tier="full")
+    except Exception as e:
+        print(f"[AVATAR GEN ERROR] full render for {char_id}: {e}")   # ramane draft-ul
+        return
+
+    db = database.SessionLocal()
+    try:
+        replaced = db.execute(
+            update(models.Character)
+            .where(models.Character.id == char_id, models.Character.avatar_url == draft_url)
+            .values(avatar_url=avatar_url)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        db.commit()
+    finally:
+        db.close()
+
+    if replaced:
+        realtime.hub.publish_threadsafe(user_id, {
+            "type": "avatar_ready", "character_id": char_id, "avatar_url": avatar_url,
+        })
+
+
+AVATAR_WAIT_SECONDS = 30   # coada "image" plina: personajul se creeaza fara avatar
+
+
+@app.post("/characters", summary="Create character", response_model=CharacterOut)
 def create_character(
     body: CharacterCreate,
+    background_tasks: BackgroundTasks,
     db: Session = Depends(database.get_db),
     user: models.User = Depends(utils.get_current_user),
 ):
     seed = random.randint(1, 999999)
-
-    # Generate initial avatar
-    try:
-        avatar_url = image_gen.generate_avatar(body.visual_prompt, seed=seed)
-    except Exception as e:
-        print(f"[AVATAR GEN ERROR] {e}")
-        avatar_url = None  # don't block creation if avatar gen fails
+    tier = scheduler.tier_for(user)
+
+    # Generate initial avatar: the draft tier in progressive mode (full render follows in background)
+    avatar_url, is_draft = None, False
+    if image_gen.PROGRESSIVE_IMAGES:
+        try:
+            with scheduler.blocking_slot("image", tier, timeout=AVATAR_WAIT_SECONDS):
+                avatar_url = image_gen.generate_avatar(body.visual_prompt, seed=seed, tier="draft")
+            is_draft = True
+        except Exception as e:
+            print(f"[AVATAR GEN ERROR] draft: {e}")
+    if avatar_url is None:
+        try:
+            with scheduler.blocking_slot("image", tier, timeout=AVATAR_WAIT_SECONDS):
+                avatar_url = image_gen.generate_avatar(body.visual_prompt, seed=seed)
+        except Exception as e:
+            print(f"[AVATAR GEN ERROR] {e}")
+            avatar_url = None  # don't block creation if avatar gen fails
 
     char = models.Character(
         user_id=user.id,
@@ -217,29 +444,44 @@ def create_character(
     db.commit()
     db.refresh(char)
 
-    return _char_response(char)
+    if is_draft:
+        background_tasks.add_task(_render_avatar, user.id, tier, char.id, body.visual_prompt, seed, avatar_url)
+    elif avatar_url:
+        realtime.hub.publish_threadsafe(user.id, {
+            "type": "avatar_ready", "character_id": char.id, "avatar_url": avatar_url,
+        })
+    return char
 
 
-@app.get("/characters", summary="List my characters")
+@app.get("/characters", summary="List my characters", response_model=List[CharacterOut])
 def list_characters(
+    request: Request,
+    response: Response,
     db: Session = Depends(database.get_db),
     user: models.User = Depends(utils.get_current_user),
 ):
-    chars = db.query(models.Character).filter(models.Character.user_id == user.id).all()
-    return [_char_response(c) for c in chars]
+    # Version = (row count, newest updated_at) - one aggregate, no row loading
+    count, last_update = db.query(
+        func.count(models.Character.id), func.max(models.Character.updated_at)
+    ).filter(models.Character.user_id == user.id).one()
+    etag = http_cache.make_etag("characters", user.id, count, last_update)
+    if http_cache.is_fresh(request, etag):
+        return http_cache.not_modified(etag)
+    http_cache.apply(response, etag)
 
+    return db.query(models.Character).filter(models.Character.user_id == user.id).all()
 
-@app.get("/characters/{char_id}", summary="Character details")
+
+@app.get("/characters/{char_id}", summary="Character details", response_model=CharacterOut)
 def get_character(
     char_id: str,
     db: Session = Depends(database.get_db),
     user: models.User = Depends(utils.get_current_user),
 ):
-    char = _get_char_or_404(char_id, user.id, db)
-    return _char_response(char)
+    return _get_char_or_404(char_id, user.id, db)
 
 
-@app.delete("/characters/{char_id}", summary="Delete character")
+@app.delete("/characters/{char_id}", summary="Delete character", response_model=DetailOut)
 def delete_character(
     char_id: str,
     db: Session = Depends(database.get_db),
@@ -247,7 +489,9 @@ def delete_character(
 ):
     char = _get_char_or_404(char_id, user.id, db)
     db.delete(char)
+    utils.bump_gallery_version(db, user.id)   # imaginile raman, dar fara personaj
     db.commit()
+    vector_memory.forget(char_id)
     return {"message": "Character deleted."}
 
 
@@ -261,31 +505,16 @@ def _get_char_or_404(char_id: str, user_id: str, db: Session) -> models.Characte
     return char
 
 
-def _char_response(char: models.Character) -> dict:
-    return {
-        "id": char.id,
-        "name": char.name,
-        "age": char.age,
-        "description": char.description,
-        "visual_prompt": char.visual_prompt,
-        "avatar_url": char.avatar_url,
-        "total_images_generated": char.total_images_generated,
-        "created_at": char.created_at,
-    }
+def _overloaded(e: scheduler.Overloaded) -> HTTPException:
+    return HTTPException(e.status_code, e.detail, headers={"Retry-After": str(e.retry_after)})
 
 
 # ═══════════════════════════════════════════════════════════
 # CHAT  (1 credit / message)
 # ═══════════════════════════════════════════════════════════
 
-@app.post("/chat", summary="Send text message")
-def chat(
-    body: ChatRequest,
-    db: Session = Depends(database.get_db),
-    user: models.User = Depends(utils.get_current_user),
-):
-    char = _get_char_or_404(body.character_id, user.id, db)
-
+def _begin_chat_turn(db: Session, user: models.User, char: models.Character, message: str) -> tuple:
+    """Deduct the credit and stage the user message (not committed yet = credit hold)."""
     # Deduct credit BEFORE generating the response
     utils.deduct_credits(user, utils.COST_TEXT_MESSAGE, f"Chat with {char.name}", db)
 
@@ -293,22 +522,36 @@ def chat(
     db.add(models.Message(
         character_id=char.id,
         sender="user",
-        content=body.message,
+        content=message,
         credits_cost=0,
     ))
     db.flush()
 
-    # Get history for AI context
+    # Get history for AI context: only the recent window, older turns live in char.memory_summary
     history = (
         db.query(models.Message)
         .filter(models.Message.character_id == char.id)
-        .order_by(models.Message.timestamp.asc())
+        .order_by(models.Message.timestamp.desc())
+        .limit(llm.HISTORY_WINDOW)
         .all()
-    )
-
-    # Generate response
-    ai_text = llm.generate_response(history, char)
+    )[::-1]
 
+    # Older facts relevant to this message, from the embedding index
+    recalled = vector_memory.recall(
+        char.id, message, exclude={m.content for m in history if m.sender == "user"}
+    )
+    return history, recalled
+
+
+def _finish_chat_turn(
+    db: Session,
+    user: models.User,
+    char: models.Character,
+    message: str,
+    ai_text: str,
+    background_tasks: BackgroundTasks,
+) -> bool:
+    """Commit the turn. Returns True if a memory summary refresh was scheduled."""
     # Save AI response
     db.add(models.Message(
         character_id=char.id,
@@ -316,10 +559,51 @@ def chat(
         content=ai_text,
         credits_cost=utils.COST_TEXT_MESSAGE,
     ))
+    utils.record_activity(db, user.id, char.id, messages=2, credits=utils.COST_TEXT_MESSAGE)
 
     db.commit()
     db.refresh(user)
 
+    background_tasks.add_task(vector_memory.remember, char.id, [message])
+    if memory.needs_refresh(db, char):
+        background_tasks.add_task(memory.refresh_summary, char.id)
+        return True
+    return False
+
+
+@app.post("/chat", summary="Send text message", response_model=ChatOut)
+async def chat(
+    body: ChatRequest,
+    request: Request,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(database.get_db),
+    user: models.User = Depends(utils.get_current_user),
+):
+    deadline = deadlines.from_request(request, deadlines.CHAT_BUDGET)
+    tier = scheduler.tier_for(user)
+    char = await run_in_threadpool(_get_char_or_404, body.character_id, user.id, db)
+    history, recalled = await run_in_threadpool(_begin_chat_turn, db, user, char, body.message)
+
+    # Generate response - queued by tier, cancelled if the client leaves or the budget runs out
+    try:
+        with profiling.phase("llm"):
+            ai_text = await deadlines.guard(
+                request,
+                scheduler.run("llm", tier, llm.agenerate_response(history, char, recalled=recalled), deadline),
+                deadline,
+            )
+    except deadlines.Abandoned as e:
+        await run_in_threadpool(db.rollback)   # releases the credit hold + user message
+        raise HTTPException(e.status_code, e.detail)
+    except scheduler.Overloaded as e:
+        await run_in_threadpool(db.rollback)
+        raise _overloaded(e)
+
+    await run_in_threadpool(
+        _finish_chat_turn, db, user, char, body.message, ai_text, background_tasks
+    )
+    await realtime.hub.publish(user.id, realtime.credits_event(user))
+
     return {
         "response": ai_text,
         "credits": user.credits,
@@ -331,35 +615,45 @@ def chat(
 # IMAGE GENERATION  (7 credits SFW / 15 credits NSFW)
 # ═══════════════════════════════════════════════════════════
 
-@app.post("/images/generate", summary="Generate image")
-def generate_image(
-    body: ImageRequest,
-    db: Session = Depends(database.get_db),
-    user: models.User = Depends(utils.get_current_user),
-):
+def _hold_image_credits(db: Session, user: models.User, body: ImageRequest) -> tuple:
     char = _get_char_or_404(body.character_id, user.id, db)
 
     cost = utils.COST_IMAGE_NSFW if body.nsfw else utils.COST_IMAGE_NORMAL
     label = "NSFW" if body.nsfw else "Standard"
 
-    # Deduct credits
+    # Deduct credits (committed only once the image exists)
     utils.deduct_credits(user, cost, f"{label} photo with {char.name}", db)
+    return char, cost
+
+
+def _image_event(img: models.ImageGeneration) -> dict:
+    return {
+        "id": img.id,
+        "character_id": img.character_id,
+        "image_url": img.image_url,
+        "nsfw": bool(img.nsfw_level),
+        "credits_cost": img.credits_cost,
+        "liked": bool(img.liked),
+        "status": img.status,
+        "created_at": img.created_at,
+    }
 
-    # Generate image
-    try:
-        image_url = image_gen.generate_image(
-            visual_prompt=char.visual_prompt,
-            scenario=body.scenario,
-            nsfw=body.nsfw,
-            seed=char.seed,
-        )
-    except RuntimeError as e:
-        # If generation fails, refund credits
-        utils.add_credits(user, cost, "Refund - image generation failed", db, transaction_type="refund")
-        db.commit()
-        raise HTTPException(500, f"Image generation failed: {str(e)}")
 
-    # Save to gallery
+def _refund_image_credits(db: Session, user: models.User, cost: int) -> None:
+    utils.add_credits(user, cost, "Refund - image generation failed", db, transaction_type="refund")
+    db.commit()
+
+
+def _save_image(
+    db: Session,
+    user: models.User,
+    char: models.Character,
+    body: ImageRequest,
+    cost: int,
+    image_url: str,
+    draft: bool = False,
+) -> models.ImageGeneration:
+    # Save to gallery (a draft is shown until the full render replaces it)
     img_record = models.ImageGeneration(
         user_id=user.id,
         character_id=char.id,
@@ -367,6 +661,8 @@ def generate_image(
         nsfw_level=1 if body.nsfw else 0,
         credits_cost=cost,
         image_url=image_url,
+        draft_url=image_url if draft else None,
+        status="rendering" if draft else "ready",
     )
     db.add(img_record)
 
@@ -381,23 +677,412 @@ def generate_image(
     ))
 
     char.total_images_generated += 1
+    utils.record_activity(db, user.id, char.id, messages=1, images=1, credits=cost)
+    utils.bump_gallery_version(db, user.id)
     db.commit()
     db.refresh(user)
+    return img_record
+
+
+# ── Progressive mode: draft returned right away, full render in background ──
+# "rendering" -> "ready" (full render saved) or row deleted + refund (failed /
+# cancelled). Both transitions are conditional on status == "rendering", so
+# exactly one of them wins, even across workers.
+# The image_ready / image_failed events reach only sockets on the worker that
+# renders, so clients also poll GET /images/{id} while status == "rendering".
+_renders = {}   # image_id -> asyncio.Task of the full render (this worker only)
+# Dupa acest timp nicio randare nu mai poate termina (workerul ei a murit): o renuntam si rambursam
+# la urmatoarea citire (GET /images/{id}, galerie, dashboard, export)
+RENDER_STALE_SECONDS = deadlines.IMAGE_BUDGET + 60
+
+
+def _finish_render(image_id: str, draft_url: str, full_url: str) -> Optional[models.ImageGeneration]:
+    db = database.SessionLocal()
+    try:
+        img = models.ImageGeneration
+        won = db.execute(
+            update(img)
+            .where(img.id == image_id, img.status == "rendering")
+            .values(image_url=full_url, status="ready")
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        if not won:
+            db.rollback()
+            return None
+        record = db.get(img, image_id)
+        db.execute(
+            update(models.Message)
+            .where(models.Message.character_id == record.character_id, models.Message.image_url == draft_url)
+            .values(image_url=full_url)
+            .execution_options(synchronize_session=False)
+        )
+        utils.bump_gallery_version(db, record.user_id)
+        db.commit()
+        db.refresh(record)
+        db.expunge(record)
+        return record
+    finally:
+        db.close()
+
+
+def _discard_render(image_id: str, user_id: str, reason: str) -> Optional[models.User]:
+    """Drop a still-rendering image and refund it. None if it already finished (or was discarded)."""
+    db = database.SessionLocal()
+    try:
+        img = models.ImageGeneration
+        row = db.execute(
+            delete(img)
+            .where(img.id == image_id, img.user_id == user_id, img.status == "rendering")
+            .returning(img.credits_cost, img.character_id, img.draft_url)
+            .execution_options(synchronize_session=False)
+        ).first()
+        if row is None:
+            db.rollback()
+            return None
+        cost, char_id, draft_url = row
+
+        db.execute(
+            delete(models.Message)
+            .where(models.Message.character_id == char_id, models.Message.image_url == draft_url)
+            .execution_options(synchronize_session=False)
+        )
+        db.execute(
+            update(models.Character)
+            .where(models.Character.id == char_id)
+            .values(total_images_generated=models.Character.total_images_generated - 1)
+            .execution_options(synchronize_session=False)
+        )
+        utils.record_activity(db, user_id, char_id, messages=-1, images=-1, credits=-cost)
+        utils.bump_gallery_version(db, user_id)
+        user = db.get(models.User, user_id)
+        utils.add_credits(user, cost, f"Refund - image render {reason}", db, transaction_type="refund")
+        db.commit()
+        db.refresh(user)
+        db.expunge(user)
+        return user
+    finally:
+        db.close()
+
+
+def _reap_stale_renders(db: Session, user_id: str) -> int:
+    """Discard + refund the user's renders whose worker died. Returns how many were dropped."""
+    img = models.ImageGeneration
+    cutoff = datetime.utcnow() - timedelta(seconds=RENDER_STALE_SECONDS)
+    stale = db.query(img.id).filter(
+        img.user_id == user_id, img.status == "rendering", img.created_at < cutoff,
+    ).all()
+    return sum(_discard_render(image_id, user_id, "expired") is not None for (image_id,) in stale)
+
+
+async def _render_full(user_id: str, tier: str, image_id: str, draft_url: str, visual_prompt: str,
+                       scenario: str, nsfw: bool, seed: int) -> None:
+    # admit=False: already admitted (and charged) with the draft; it only waits its turn
+    task = asyncio.ensure_future(scheduler.run(
+        "image", tier,
+        image_gen.agenerate_image(visual_prompt, scenario, nsfw=nsfw, seed=seed, tier="full"),
+        admit=False,
+    ))
+    _renders[image_id] = task
+    try:
+        full_url = await asyncio.wait_for(task, timeout=deadlines.IMAGE_BUDGET)
+    except (Exception, asyncio.CancelledError) as e:
+        # esuat, expirat sau anulat: de user (POST /images/{id}/cancel scoate task-ul din
+        # _renders inainte sa-l anuleze) sau la oprirea workerului (anularea trebuie propagata)
+        cancelled = isinstance(e, asyncio.CancelledError)
+        stopping = cancelled and _renders.get(image_id) is task
+        reason = "cancelled" if cancelled else "failed"
+        print(f"[IMAGE GEN ERROR] full render {image_id} {reason}: {e!r}")
+        # in thread chiar daca suntem anulati din nou: DELETE-ul + rambursarea se termina oricum
+        user = await run_in_threadpool(_discard_render, image_id, user_id, reason)
+        if user is not None:
+            await realtime.hub.publish(user_id, {"type": "image_failed", "image_id": image_id, "reason": reason})
+            await realtime.hub.publish(user_id, realtime.credits_event(user))
+        if stopping:
+            raise
+        return
+    finally:
+        _renders.pop(image_id, None)
+
+    record = await run_in_threadpool(_finish_render, image_id, draft_url, full_url)
+    if record is not None:
+        await realtime.hub.publish(user_id, {"type": "image_ready", "image": _image_event(record)})
+
+
+@app.post("/images/generate", summary="Generate image", response_model=ImageGenerateOut)
+async def generate_image(
+    body: ImageRequest,
+    request: Request,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(database.get_db),
+    user: models.User = Depends(utils.get_current_user),
+):
+    deadline = deadlines.from_request(request, deadlines.IMAGE_BUDGET)
+    tier = scheduler.tier_for(user)
+    char, cost = await run_in_threadpool(_hold_image_credits, db, user, body)
+    args = dict(visual_prompt=char.visual_prompt, scenario=body.scenario, nsfw=body.nsfw, seed=char.seed)
+
+    def render(image_tier: str):
+        return scheduler.run("image", tier, image_gen.agenerate_image(**args, tier=image_tier), deadline)
+
+    # Generate image: the draft tier first in progressive mode, the full tier if that is off or fails
+    image_url, is_draft = None, False
+    try:
+        with profiling.phase("image"):
+            if image_gen.PROGRESSIVE_IMAGES:
+                try:
+                    image_url = await deadlines.guard(request, render("draft"), deadline)
+                    is_draft = True
+                except RuntimeError as e:
+                    print(f"[IMAGE GEN ERROR] draft: {e}")
+            if image_url is None:
+                image_url = await deadlines.guard(request, render("full"), deadline)
+    except deadlines.Abandoned as e:
+        await run_in_threadpool(db.rollback)   # deduction was never committed
+        raise HTTPException(e.status_code, e.detail)
+    except scheduler.Overloaded as e:
+        await run_in_threadpool(db.rollback)
+        raise _overloaded(e)
+    except RuntimeError as e:
+        # If generation fails, refund credits
+        await run_in_threadpool(_refund_image_credits, db, user, cost)
+        raise HTTPException(500, f"Image generation failed: {str(e)}")
+
+    img_record = await run_in_threadpool(_save_image, db, user, char, body, cost, image_url, is_draft)
+    if is_draft:
+        # Charged now; refunded by _render_full if the full render fails or is cancelled
+        background_tasks.add_task(_render_full, user.id, tier, img_record.id, image_url, **args)
+    else:
+        await realtime.hub.publish(user.id, {"type": "image_ready", "image": _image_event(img_record)})
+    await realtime.hub.publish(user.id, realtime.credits_event(user))
 
     return {
         "image_url": image_url,
         "image_id": img_record.id,
+        "status": img_record.status,
         "credits": user.credits,
         "level": user.level,
         "credits_spent": cost,
     }
 
 
+@app.post("/images/{image_id}/cancel", summary="Cancel a full render, keep nothing, refund", response_model=ImageCancelOut)
+async def cancel_image_render(
+    image_id: str,
+    user: models.User = Depends(utils.get_current_user),
+):
+    refunded_user = await run_in_threadpool(_discard_render, image_id, user.id, "cancelled")
+    if refunded_user is None:
+        raise HTTPException(409, "This image is not rendering anymore.")
+
+    task = _renders.pop(image_id, None)
+    if task is not None:
+        task.cancel()   # inchide conexiunea fal.ai (doar daca randarea ruleaza in acest worker)
+    await realtime.hub.publish(user.id, realtime.credits_event(refunded_user))
+    return {"image_id": image_id, "credits": refunded_user.credits}
+
+
+# ═══════════════════════════════════════════════════════════
+# REALTIME  (WebSocket session: auth once, chat + pushed events)
+# ═══════════════════════════════════════════════════════════
+#
+# client -> {"type": "auth", "token": "..."}            (first message)
+#           {"type": "select_character", "character_id": "..."}
+#           {"type": "chat", "message": "...", "character_id": "..."?}
+#           {"type": "ping"}
+# server -> ready / character / token / reply / credits / image_ready /
+#           image_failed / avatar_ready / error / pong
+
+WS_AUTH_TIMEOUT = 10
+
+
+def _load_user_detached(user_id: str) -> Optional[models.User]:
+    db = database.SessionLocal()
+    try:
+        user = db.query(models.User).filter(models.User.id == user_id).first()
+        if user:
+            db.expunge(user)
+        return user
+    finally:
+        db.close()
+
+
+def _load_character_detached(char_id: str, user_id: str) -> models.Character:
+    db = database.SessionLocal()
+    try:
+        char = _get_char_or_404(char_id, user_id, db)
+        db.expunge(char)
+        return char
+    finally:
+        db.close()
+
+
+def _ws_begin_turn(db: Session, user_id: str, cached_char: models.Character, message: str) -> tuple:
+    # PK lookup for fresh credits; the character is re-attached without a SELECT
+    user = db.get(models.User, user_id)
+    char = db.merge(cached_char, load=False)
+    history, recalled = _begin_chat_turn(db, user, char, message)
+    return user, char, history, recalled
+
+
+async def _ws_error(websocket: WebSocket, status_code: int, detail: str) -> None:
+    await realtime.hub.send(websocket, {"type": "error", "status": status_code, "detail": detail})
+
+
+async def _ws_receive(websocket: WebSocket) -> Optional[dict]:
+    """Next client message, text or binary frame. None if it is not a JSON object."""
+    message = await websocket.receive()
+    if message["type"] == "websocket.disconnect":
+        raise WebSocketDisconnect(message.get("code", 1000), message.get("reason"))
+    data = message.get("text")
+    if data is None:
+        data = message.get("bytes") or b""
+    try:
+        msg = orjson.loads(data)
+    except orjson.JSONDecodeError:
+        return None
+    return msg if isinstance(msg, dict) else None
+
+
+def _ws_str(msg: dict, key: str) -> str:
+    # {"character_id": {...}} nu ajunge in query
+    value = msg.get(key)
+    return value if isinstance(value, str) else ""
+
+
+async def _ws_authenticate(websocket: WebSocket) -> Optional[models.User]:
+    try:
+        msg = await asyncio.wait_for(_ws_receive(websocket), timeout=WS_AUTH_TIMEOUT)
+    except (asyncio.TimeoutError, WebSocketDisconnect):
+        msg = {}
+    if msg is None:
+        await _ws_error(websocket, 400, "Expected a JSON object.")
+        msg = {}
+
+    user_id = utils.user_id_from_token(_ws_str(msg, "token")) if msg.get("type") == "auth" else None
+    user = await run_in_threadpool(_load_user_detached, user_id) if user_id else None
+    if user is None:
+        try:
+            await websocket.close(code=4401, reason="Invalid or expired token.")
+        except RuntimeError:
+            pass
+        return None
+
+    await realtime.hub.send(websocket, {"type": "ready", "user": UserOut.model_validate(user).model_dump()})
+    return user
+
+
+async def _ws_chat(websocket: WebSocket, user_id: str, session: dict, msg: dict) -> None:
+    cached = session.get("char")
+    char_id = _ws_str(msg, "character_id") or (cached.id if cached else None)
+    if char_id and (cached is None or cached.id != char_id or session.get("stale")):
+        try:
+            cached = session["char"] = await run_in_threadpool(_load_character_detached, char_id, user_id)
+            session["stale"] = False
+        except HTTPException as e:
+            return await _ws_error(websocket, e.status_code, e.detail)
+    if cached is None:
+        return await _ws_error(websocket, 400, "No character selected.")
+
+    message = _ws_str(msg, "message").strip()
+    if not message:
+        return await _ws_error(websocket, 400, "Message is empty.")
+
+    background_tasks = BackgroundTasks()
+    db = database.SessionLocal()
+    try:
+        try:
+            user, char, history, recalled = await run_in_threadpool(
+                _ws_begin_turn, db, user_id, cached, message
+            )
+        except HTTPException as e:
+            await run_in_threadpool(db.rollback)
+            return await _ws_error(websocket, e.status_code, e.detail)
+
+        parts = []
+        deadline = deadlines.Deadline(deadlines.CHAT_BUDGET)
+
+        async def stream_reply():
+            async with scheduler.slot("llm", scheduler.tier_for(user), deadline):
+                async for delta in llm.astream_response(history, char, recalled=recalled):
+                    parts.append(delta)
+                    await realtime.hub.send(websocket, {"type": "token", "delta": delta})
+
+        try:
+            await asyncio.wait_for(stream_reply(), timeout=deadline.remaining())
+        except asyncio.TimeoutError:
+            await run_in_threadpool(db.rollback)
+            return await _ws_error(websocket, 504, deadlines.Abandoned("deadline").detail)
+        except scheduler.Overloaded as e:
+            await run_in_threadpool(db.rollback)
+            return await _ws_error(websocket, e.status_code, e.detail)
+        except BaseException:
+            # client gone mid-stream: release the credit hold
+            await run_in_threadpool(db.rollback)
+            raise
+
+        ai_text = "".join(parts).strip() or llm.FALLBACK_REPLY
+        refreshing = await run_in_threadpool(
+            _finish_chat_turn, db, user, char, message, ai_text, background_tasks
+        )
+        session["stale"] = session.get("stale") or refreshing   # summary will change
+
+        await realtime.hub.send(websocket, {
+            "type": "reply", "response": ai_text, "credits": user.credits, "level": user.level,
+        })
+        await realtime.hub.publish(user_id, realtime.credits_event(user))
+    finally:
+        await run_in_threadpool(db.close)
+
+    await background_tasks()
+
+
+@app.websocket("/ws")
+async def session_socket(websocket: WebSocket):
+    await websocket.accept()
+    user = await _ws_authenticate(websocket)
+    if user is None:
+        return
+
+    realtime.hub.connect(user.id, websocket)
+    session = {"char": None, "stale": False}
+    try:
+        while True:
+            msg = await _ws_receive(websocket)
+            if msg is None:
+                await _ws_error(websocket, 400, "Expected a JSON object.")
+                continue
+
+            kind = msg.get("type")
+            if kind == "ping":
+                await realtime.hub.send(websocket, {"type": "pong"})
+            elif kind == "select_character":
+                try:
+                    session["char"] = await run_in_threadpool(
+                        _load_character_detached, _ws_str(msg, "character_id"), user.id
+                    )
+                    session["stale"] = False
+                except HTTPException as e:
+                    await _ws_error(websocket, e.status_code, e.detail)
+                    continue
+                await realtime.hub.send(websocket, {
+                    "type": "character",
+                    "character": CharacterOut.model_validate(session["char"]).model_dump(),
+                })
+            elif kind == "chat":
+                await _ws_chat(websocket, user.id, session, msg)
+            else:
+                await _ws_error(websocket, 400, f"Unknown message type: {kind}")
+    except WebSocketDisconnect:
+        pass
+    finally:
+        realtime.hub.disconnect(user.id, websocket)
+
+
 # ═══════════════════════════════════════════════════════════
 # HISTORY
 # ═══════════════════════════════════════════════════════════
 
-@app.get("/chat/history/{char_id}", summary="Conversation history")
+@app.get("/chat/history/{char_id}", summary="Conversation history", response_model=List[MessageOut])
 def get_history(
     char_id: str,
     limit: int = 50,
@@ -406,134 +1091,243 @@ def get_history(
 ):
     char = _get_char_or_404(char_id, user.id, db)
 
-    messages = (
-        db.query(models.Message)
+    # Column-only select: rows go straight into MessageOut, no ORM hydration
+    return (
+        db.query(
+            models.Message.id,
+            models.Message.sender,
+            models.Message.content,
+            models.Message.is_image,
+            models.Message.image_url,
+            models.Message.credits_cost,
+            models.Message.timestamp,
+        )
         .filter(models.Message.character_id == char.id)
         .order_by(models.Message.timestamp.asc())
         .limit(limit)
         .all()
     )
 
-    return [
-        {
-            "id": m.id,
-            "sender": m.sender,
-            "content": m.content,
-            "is_image": m.is_image,
-            "image_url": m.image_url,
-            "credits_cost": m.credits_cost,
-            "timestamp": m.timestamp,
-        }
-        for m in messages
-    ]
-
 
 # ═══════════════════════════════════════════════════════════
 # GALLERY
 # ═══════════════════════════════════════════════════════════
 
-@app.get("/images/gallery", summary="Generated images gallery")
+def _gallery_filters(
+    user_id: str,
+    character_id: Optional[str] = None,
+    liked: Optional[bool] = None,
+    nsfw_level: Optional[int] = None,
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None,
+) -> list:
+    # Fiecare combinatie are un index (user_id, <filtru>, created_at) in models.py
+    img = models.ImageGeneration
+    filters = [img.user_id == user_id]
+    if character_id:
+        filters.append(img.character_id == character_id)
+    if liked is True:
+        filters.append(img.liked == True)   # aceeasi expresie ca indexul partial
+    elif liked is False:
+        # liked != TRUE e NULL pentru randurile vechi fara valoare: le includem explicit
+        filters.append(or_(img.liked == False, img.liked.is_(None)))
+    if nsfw_level is not None:
+        filters.append(img.nsfw_level == nsfw_level)
+    if created_after:
+        filters.append(img.created_at >= created_after)
+    if created_before:
+        filters.append(img.created_at < created_before)
+    return filters
+
+
+@app.get("/images/gallery", summary="Generated images gallery", response_model=List[GalleryImageOut])
 def get_gallery(
+    request: Request,
+    response: Response,
     limit: int = 20,
+    character_id: Optional[str] = None,
+    liked: Optional[bool] = None,
+    nsfw_level: Optional[int] = None,
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None,
     db: Session = Depends(database.get_db),
     user: models.User = Depends(utils.get_current_user),
 ):
-    images = (
-        db.query(models.ImageGeneration)
-        .filter(models.ImageGeneration.user_id == user.id)
+    filters = _gallery_filters(user.id, character_id, liked, nsfw_level, created_after, created_before)
+    if _reap_stale_renders(db, user.id):
+        db.refresh(user)   # gallery_version schimbat de _discard_render (alta sesiune)
+
+    # Versiunea e pe randul userului (deja incarcat de auth): fara agregat peste toate imaginile
+    etag = http_cache.make_etag(
+        "gallery", user.id, limit, character_id, liked, nsfw_level, created_after, created_before,
+        user.gallery_version,
+    )
+    if http_cache.is_fresh(request, etag):
+        return http_cache.not_modified(etag)
+    http_cache.apply(response, etag)
+    return _gallery_rows(db, filters, limit)
+
+
+def _gallery_rows(db: Session, filters: list, limit: int) -> list:
+    return (
+        db.query(
+            models.ImageGeneration.id,
+            models.ImageGeneration.character_id,
+            models.ImageGeneration.image_url,
+            (models.ImageGeneration.nsfw_level > 0).label("nsfw"),
+            models.ImageGeneration.credits_cost,
+            # randurile vechi au liked NULL; GalleryImageOut.liked e bool
+            func.coalesce(models.ImageGeneration.liked, False).label("liked"),
+            models.ImageGeneration.status,
+            models.ImageGeneration.created_at,
+        )
+        .filter(*filters)
         .order_by(models.ImageGeneration.created_at.desc())
         .limit(limit)
         .all()
     )
-    return [
-        {
-            "id": img.id,
-            "character_id": img.character_id,
-            "image_url": img.image_url,
-            "nsfw": bool(img.nsfw_level),
-            "credits_cost": img.credits_cost,
-            "liked": img.liked,
-            "created_at": img.created_at,
-        }
-        for img in images
-    ]
-
-
-@app.patch("/images/{image_id}/like", summary="Like / unlike image")
+
+
+@app.get("/images/gallery/stats", summary="Image counts per character", response_model=List[GalleryStatsOut])
+def get_gallery_stats(
+    db: Session = Depends(database.get_db),
+    user: models.User = Depends(utils.get_current_user),
+):
+    img = models.ImageGeneration
+    return (
+        db.query(
+            img.character_id,
+            func.count(img.id).label("images"),
+            func.count(img.id).filter(img.liked == True).label("liked"),
+            func.max(img.created_at).label("last_created_at"),
+        )
+        .filter(img.user_id == user.id)
+        .group_by(img.character_id)
+        .all()
+    )
+
+
+@app.get("/images/{image_id}", summary="One image - poll while status is rendering", response_model=GalleryImageOut)
+def get_image(
+    image_id: str,
+    db: Session = Depends(database.get_db),
+    user: models.User = Depends(utils.get_current_user),
+):
+    """404 once a render failed or was cancelled: the row is gone and the credits refunded."""
+    img = models.ImageGeneration
+    filters = [img.id == image_id, img.user_id == user.id]
+    rows = _gallery_rows(db, filters, 1)
+    if not rows:
+        raise HTTPException(404, "Image not found.")
+
+    image = rows[0]
+    if image.status == "rendering" and image.created_at < datetime.utcnow() - timedelta(seconds=RENDER_STALE_SECONDS):
+        # workerul care randa a disparut: altfel ar ramane "rendering" pentru totdeauna
+        if _discard_render(image_id, user.id, "expired") is not None:
+            raise HTTPException(404, "Image not found.")
+        rows = _gallery_rows(db, filters, 1)   # s-a terminat intre timp
+        if not rows:
+            raise HTTPException(404, "Image not found.")
+        image = rows[0]
+    return image
+
+
+@app.patch("/images/{image_id}/like", summary="Like / unlike image", response_model=LikeOut)
 def toggle_like(
     image_id: str,
     db: Session = Depends(database.get_db),
     user: models.User = Depends(utils.get_current_user),
 ):
-    img = db.query(models.ImageGeneration).filter(
-        models.ImageGeneration.id == image_id,
-        models.ImageGeneration.user_id == user.id,
-    ).first()
-    if not img:
+    # Un singur UPDATE ... RETURNING in loc de SELECT + UPDATE
+    liked = db.execute(
+        update(models.ImageGeneration)
+        .where(
+            models.ImageGeneration.id == image_id,
+            models.ImageGeneration.user_id == user.id,
+        )
+        .values(liked=not_(func.coalesce(models.ImageGeneration.liked, False)))
+        .returning(models.ImageGeneration.liked)
+        .execution_options(synchronize_session=False)
+    ).scalar_one_or_none()
+    if liked is None:
         raise HTTPException(404, "Image not found.")
-    img.liked = not img.liked
+    utils.bump_gallery_version(db, user.id)
     db.commit()
-    return {"liked": img.liked}
+    return {"liked": liked}
+
+
+# ═══════════════════════════════════════════════════════════
+# SEARCH  (chat history + gallery prompts)
+# ═══════════════════════════════════════════════════════════
+
+@app.get("/search", summary="Search conversations or gallery prompts", response_model=SearchOut)
+def search_text(
+    q: str,
+    scope: str = "messages",
+    character_id: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = 20,
+    db: Session = Depends(database.get_db),
+    user: models.User = Depends(utils.get_current_user),
+):
+    if scope not in search.SCOPES:
+        raise HTTPException(400, f"scope must be one of: {', '.join(search.SCOPES)}")
+    if not q.strip():
+        raise HTTPException(400, "Search query is empty.")
+    limit = max(1, min(limit, 50))
+
+    try:
+        rows, next_cursor = search.search(db, user.id, q, scope, character_id, cursor, limit)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+
+    return {"results": rows, "next_cursor": next_cursor}
 
 
 # ═══════════════════════════════════════════════════════════
 # CREDITS & STRIPE
 # ═══════════════════════════════════════════════════════════
 
-@app.get("/credits/packages", summary="Available packages")
-def get_packages(db: Session = Depends(database.get_db)):
-    pkgs = db.query(models.CreditPackage).filter(models.CreditPackage.is_active == True).all()
-    return [
-        {
-            "id": p.id,
-            "name": p.name,
-            "credits": p.credits,
-            "bonus_credits": p.bonus_credits,
-            "total_credits": p.credits + p.bonus_credits,
-            "price_usd": p.price_usd,
-            "stripe_price_id": p.stripe_price_id,
-        }
-        for p in pkgs
-    ]
-
-
-@app.post("/credits/checkout", summary="Create Stripe Checkout session")
+# Packages change only through seeding / manual DB edits: the serialized list
+# lives in the shared cache (billing.py) and browsers may cache it too.
+PACKAGES_CACHE_CONTROL = f"public, max-age={billing.PACKAGES_CACHE_SECONDS}"
+
+
+@app.get("/credits/packages", summary="Available packages", response_model=List[PackageOut])
+def get_packages(request: Request, db: Session = Depends(database.get_db)):
+    body = billing.packages_body(db)
+    etag = http_cache.make_etag("packages", body.decode())
+    if http_cache.is_fresh(request, etag):
+        return http_cache.not_modified(etag, cache_control=PACKAGES_CACHE_CONTROL)
+    response = Response(content=body, media_type="application/json")
+    http_cache.apply(response, etag, cache_control=PACKAGES_CACHE_CONTROL)
+    return response
+
+
+@app.post("/credits/checkout", summary="Create Stripe Checkout session", response_model=CheckoutOut)
 def create_checkout(
     body: StripeCheckoutRequest,
     db: Session = Depends(database.get_db),
     user: models.User = Depends(utils.get_current_user),
 ):
-    pkg = db.query(models.CreditPackage).filter(
-        models.CreditPackage.id == body.package_id,
-        models.CreditPackage.is_active == True,
-    ).first()
+    pkg = billing.get_package(db, body.package_id)
     if not pkg:
         raise HTTPException(404, "Package not found.")
 
-    if not stripe.api_key:
+    if not billing.stripe_configured():
         raise HTTPException(500, "Stripe is not configured. Add STRIPE_SECRET_KEY to .env")
 
+    stripe = billing.stripe_client()
     try:
-        # If package has stripe_price_id set, use Price from Stripe Dashboard
-        # Otherwise create a dynamic price
-        if pkg.stripe_price_id:
-            line_items = [{"price": pkg.stripe_price_id, "quantity": 1}]
-        else:
-            # Dynamic price - no Stripe Dashboard configuration needed
-            line_items = [{
-                "price_data": {
-                    "currency": "usd",
-                    "unit_amount": int(pkg.price_usd * 100),  # in eurocenti
-                    "product_data": {
-                        "name": f"BunnyCrush - {pkg.name}",
-                        "description": f"{pkg.credits + pkg.bonus_credits} credits ({pkg.credits} + {pkg.bonus_credits} bonus)",
-                    },
-                },
-                "quantity": 1,
-            }]
+        # Price synced once per package (billing.py) - no inline price_data
+        price_id = billing.price_id_for(db, pkg)
+        if not price_id:
+            raise HTTPException(404, "Package not found.")
+        line_items = [{"price": price_id, "quantity": 1}]
+        total_credits = pkg["credits"] + pkg["bonus_credits"]
 
         # Subscriptions (sub_*) use "subscription" mode; one-time packs use "payment"
-        is_subscription = pkg.id.startswith("sub_")
+        is_subscription = billing.is_subscription(pkg["id"])
         checkout_mode = "subscription" if is_subscription else "payment"
 
         # Use & if success_url already contains ?, else use ?
@@ -546,8 +1340,8 @@ def create_checkout(
             client_reference_id=user.id,
             metadata={
                 "user_id": user.id,
-                "package_id": pkg.id,
-                "credits": str(pkg.credits + pkg.bonus_credits),
+                "package_id": pkg["id"],
+                "credits": str(total_credits),
             },
         )
         # Subscription mode doesn't support one-time payment_intent, use subscription_data
@@ -563,7 +1357,7 @@ def create_checkout(
         raise HTTPException(400, error_msg)
 
 
-@app.post("/credits/webhook", summary="Stripe webhook - process payments")
+@app.post("/credits/webhook", summary="Stripe webhook - process payments", response_model=StatusOut)
 async def stripe_webhook(request: Request):
     """
     Stripe trimite un POST aici dupa fiecare plata.
@@ -573,6 +1367,7 @@ async def stripe_webhook(request: Request):
     """
     payload = await request.body()
     sig_header = request.headers.get("stripe-signature", "")
+    stripe = billing.stripe_client()
 
     # Verificam semnatura Stripe (securitate)
     try:
@@ -580,8 +1375,7 @@ async def stripe_webhook(request: Request):
             event = stripe.Webhook.construct_event(payload, sig_header, STRIPE_WEBHOOK_SECRET)
         else:
             # In development fara webhook secret
-            import json
-            event = json.loads(payload)
+            event = orjson.loads(payload)
     except Exception as e:
         raise HTTPException(400, f"Webhook error: {str(e)}")
 
@@ -622,36 +1416,171 @@ async def stripe_webhook(request: Request):
     return {"status": "ok"}
 
 
-@app.get("/credits/transactions", summary="Transaction history")
+@app.get("/credits/transactions", summary="Transaction history", response_model=List[TransactionOut])
 def get_transactions(
     limit: int = 20,
     db: Session = Depends(database.get_db),
     user: models.User = Depends(utils.get_current_user),
 ):
-    txs = (
-        db.query(models.Transaction)
-        .filter(models.Transaction.user_id == user.id)
+    return _transaction_rows(db, user.id, limit)
+
+
+def _transaction_rows(db: Session, user_id: str, limit: int) -> list:
+    return (
+        db.query(
+            models.Transaction.id,
+            models.Transaction.type,
+            models.Transaction.amount,
+            models.Transaction.description,
+            models.Transaction.status,
+            models.Transaction.created_at,
+        )
+        .filter(models.Transaction.user_id == user_id)
         .order_by(models.Transaction.created_at.desc())
         .limit(limit)
         .all()
     )
-    return [
-        {
-            "id": t.id,
-            "type": t.type,
-            "amount": t.amount,
-            "description": t.description,
-            "status": t.status,
-            "created_at": t.created_at,
-        }
-        for t in txs
-    ]
+
+
+# ═══════════════════════════════════════════════════════════
+# EXPORT  (streamed: NDJSON / CSV / zip with mirrored images)
+# ═══════════════════════════════════════════════════════════
+
+def _export_response(
+    db: Session,
+    user_id: str,
+    character_id: Optional[str],
+    kind: str,
+    fmt: str,
+    mirror_images: bool,
+) -> StreamingResponse:
+    if fmt not in export.FORMATS:
+        raise HTTPException(400, f"format must be one of: {', '.join(export.FORMATS)}")
+    if kind not in export.KINDS and fmt != "zip":
+        raise HTTPException(400, f"kind must be one of: {', '.join(export.KINDS)}")
+    if character_id:
+        _get_char_or_404(character_id, user_id, db)
+    if kind == "images" or fmt == "zip":
+        _reap_stale_renders(db, user_id)
+
+    # Sesiunea requestului s-ar inchide abia dupa ultimul byte: o eliberam acum,
+    # exportul isi deschide cate o sesiune scurta per chunk
+    db.close()
+
+    if fmt == "zip":
+        body, name = export.zip_archive(user_id, character_id, mirror_images), "export"
+    elif fmt == "csv":
+        body, name = export.csv_rows(kind, user_id, character_id), kind
+    else:
+        body, name = export.ndjson(kind, user_id, character_id), kind
+
+    filename = f"bunnycrush-{name}-{datetime.utcnow():%Y%m%d}.{fmt}"
+    return StreamingResponse(
+        body,
+        media_type=export.FORMATS[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+@app.get("/export", summary="Download conversations or gallery (streamed)", response_class=StreamingResponse)
+def export_data(
+    kind: str = "messages",
+    format: str = "ndjson",
+    character_id: Optional[str] = None,
+    mirror_images: bool = True,
+    db: Session = Depends(database.get_db),
+    user: models.User = Depends(utils.get_current_user),
+):
+    return _export_response(db, user.id, character_id, kind, format, mirror_images)
+
+
+# ═══════════════════════════════════════════════════════════
+# DASHBOARD  (one round trip instead of /auth/me + /characters + gallery + transactions)
+# ═══════════════════════════════════════════════════════════
+
+DASHBOARD_RECENT_IMAGES = 6
+DASHBOARD_RECENT_TRANSACTIONS = 5
+
+
+@app.get("/dashboard/summary", summary="Account, characters and recent activity", response_model=DashboardOut)
+def dashboard_summary(
+    db: Session = Depends(database.get_db),
+    user: models.User = Depends(utils.get_current_user),
+):
+    if _reap_stale_renders(db, user.id):
+        db.refresh(user)   # creditele rambursate
+    # Statisticile vin din contoarele precalculate (utils.record_activity), fara scan pe messages
+    char = models.Character
+    characters = (
+        db.query(char)
+        .filter(char.user_id == user.id)
+        .order_by(func.coalesce(char.last_message_at, char.created_at).desc())
+        .all()
+    )
+    return {
+        "user": user,
+        "characters": characters,
+        "recent_images": _gallery_rows(db, _gallery_filters(user.id), DASHBOARD_RECENT_IMAGES),
+        "recent_transactions": _transaction_rows(db, user.id, DASHBOARD_RECENT_TRANSACTIONS),
+    }
+
+
+# ═══════════════════════════════════════════════════════════
+# ADMIN  (X-Admin-Token header, disabled when ADMIN_TOKEN is unset)
+# ═══════════════════════════════════════════════════════════
+
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
+
+def _require_admin(x_admin_token: Optional[str] = Header(None)) -> None:
+    if not ADMIN_TOKEN or not hmac.compare_digest(x_admin_token or "", ADMIN_TOKEN):
+        raise HTTPException(403, "Admin access required.")
+
+
+@app.post("/admin/profile", summary="Sample the next N requests of a route", dependencies=[Depends(_require_admin)])
+def arm_profiler(body: ProfileRequest):
+    if not profiling.PROFILING_ENABLED:
+        raise HTTPException(400, "Profiling is disabled. Set PROFILING_ENABLED=1.")
+    profiling.arm(body.route, max(1, min(body.requests, 1000)))
+    return profiling.status()
+
+
+@app.get("/admin/profile", summary="Folded stacks (flame graph input) for a route",
+         response_class=PlainTextResponse, dependencies=[Depends(_require_admin)])
+def get_profile(route: str):
+    return profiling.folded_stacks(route)
+
+
+@app.get("/admin/export/{user_id}", summary="Support: export a user's data (streamed)",
+         response_class=StreamingResponse, dependencies=[Depends(_require_admin)])
+def admin_export(
+    user_id: str,
+    kind: str = "messages",
+    format: str = "ndjson",
+    character_id: Optional[str] = None,
+    mirror_images: bool = False,
+    db: Session = Depends(database.get_db),
+):
+    if db.get(models.User, user_id) is None:
+        raise HTTPException(404, "User not found.")
+    return _export_response(db, user_id, character_id, kind, format, mirror_images)
+
+
+@app.get("/admin/stats", summary="Instrumentation stats", dependencies=[Depends(_require_admin)])
+def admin_stats():
+    return {
+        "boot": _boot_stats,
+        "passwords": passwords.stats(),
+        "scheduler": scheduler.stats(),
+        "profiling": profiling.status(),
+        "vector_memory": vector_memory.stats(),
+    }
 
 
 # ═══════════════════════════════════════════════════════════
 # HEALTH CHECK
 # ═══════════════════════════════════════════════════════════
 
-@app.get("/health")
+@app.get("/health", response_model=HealthOut)
 def health():
     return {"status": "ok", "version": "1.0.0"}
\ No newline at end of file
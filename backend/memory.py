@@ -0,0 +1,115 @@
+"""
+Long-term character memory via a rolling conversation summary.
+
+Only the last llm.HISTORY_WINDOW messages are sent verbatim. Older messages
+are folded, SUMMARY_EVERY at a time, into Character.memory_summary by a
+background pass. build_system_prompt injects that summary. Prompt size stays
+flat however long the conversation gets.
+"""
+import os
+import threading
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+import database
+import llm
+import models
+import prompt_builder
+
+SUMMARY_EVERY = int(os.getenv("MEMORY_SUMMARY_EVERY", "20"))
+SUMMARY_MAX_TOKENS = int(os.getenv("MEMORY_SUMMARY_MAX_TOKENS", "250"))
+SUMMARY_MAX_BATCH = 200   # mesaje pliate intr-o singura trecere
+
+_in_flight = set()
+_in_flight_lock = threading.Lock()
+
+
+def _pending_query(db: Session, char: models.Character):
+    q = db.query(models.Message).filter(models.Message.character_id == char.id)
+    if char.summarized_until:
+        q = q.filter(models.Message.timestamp > char.summarized_until)
+    return q
+
+
+def needs_refresh(db: Session, char: models.Character) -> bool:
+    """Cheap check run after each chat turn (uses ix_messages_character_timestamp)."""
+    pending = (
+        _pending_query(db, char)
+        .with_entities(func.count(models.Message.id))
+        .scalar()
+    )
+    return pending >= SUMMARY_EVERY + llm.HISTORY_WINDOW
+
+
+def clip_to_budget(summary: str, max_tokens: int) -> str:
+    # taiem la ultimul rand complet care incape in buget
+    if prompt_builder.count_tokens(summary) <= max_tokens:
+        return summary
+    clipped = prompt_builder.truncate_to_tokens(summary, max_tokens)
+    return clipped[:clipped.rfind("\n")] if "\n" in clipped else clipped
+
+
+def refresh_summary(char_id: str) -> None:
+    """Background task: fold unsummarized messages (except the recent window) into the summary."""
+    with _in_flight_lock:
+        if char_id in _in_flight:
+            return
+        _in_flight.add(char_id)
+
+    db = database.SessionLocal()
+    try:
+        char = db.query(models.Character).filter(models.Character.id == char_id).first()
+        if not char:
+            return
+
+        pending = (
+            _pending_query(db, char)
+            .with_entities(
+                models.Message.sender,
+                models.Message.content,
+                models.Message.is_image,
+                models.Message.timestamp,
+            )
+            .order_by(models.Message.timestamp.asc())
+            .limit(SUMMARY_MAX_BATCH + llm.HISTORY_WINDOW)
+            .all()
+        )
+        to_fold = pending[:-llm.HISTORY_WINDOW][:SUMMARY_MAX_BATCH]
+        if len(to_fold) < SUMMARY_EVERY:
+            return
+
+        summary = llm.summarize_conversation(
+            char.name, char.memory_summary or "", to_fold, SUMMARY_MAX_TOKENS
+        )
+        if not summary:
+            return
+
+        # Compare-and-set: alt worker poate fi actualizat deja rezumatul
+        previous = char.summarized_until
+        updated = (
+            db.query(models.Character)
+            .filter(
+                models.Character.id == char_id,
+                models.Character.summarized_until == previous if previous
+                else models.Character.summarized_until.is_(None),
+            )
+            .update(
+                {
+                    "memory_summary": clip_to_budget(summary, SUMMARY_MAX_TOKENS),
+                    "summarized_until": to_fold[-1].timestamp,
+                },
+                synchronize_session=False,
+            )
+        )
+        db.commit()
+        if updated:
+            print(f"[MEMORY] summarized {len(to_fold)} messages for character {char_id}")
+
+    except Exception as e:
+        print(f"[MEMORY ERROR] {e}")
+        db.rollback()
+    finally:
+        db.close()
+        with _in_flight_lock:
+            _in_flight.discard(char_id)
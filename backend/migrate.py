@@ -0,0 +1,122 @@
+"""
+One-time schema setup, run once per deploy (Procfile `release:` phase)
+instead of in every gunicorn worker:
+
+    python migrate.py
+
+- creates missing tables / columns / indexes (database.sync_schema)
+- installs the full-text indexes (search.install)
+- seeds the credit packages with one bulk INSERT ... ON CONFLICT DO NOTHING
+- backfills the dashboard counters for rows created before they existed
+- syncs Stripe Prices for the packages (billing.sync_packages)
+- drops the cached packages from the shared cache (CACHE_URL, see cache.py),
+  so the running workers serve the seeded / re-priced rows right away
+
+Set AUTO_MIGRATE=1 to run it at worker boot instead (local development).
+"""
+import os
+import time
+
+from sqlalchemy import func, select, update
+
+import database
+import models
+import search
+
+DEFAULT_PACKAGES = [
+    {"id": "starter",     "name": "Starter",      "credits": 100,  "bonus_credits": 0,    "price_usd": 9.99},
+    {"id": "basic",       "name": "Basic",        "credits": 250,  "bonus_credits": 10,   "price_usd": 19.99},
+    {"id": "popular",     "name": "Popular",      "credits": 600,  "bonus_credits": 60,   "price_usd": 39.99},
+    {"id": "pro",         "name": "Premium",      "credits": 1500, "bonus_credits": 300,  "price_usd": 89.99},
+    {"id": "vip",         "name": "Premium",      "credits": 4000, "bonus_credits": 1200, "price_usd": 199.99},
+    {"id": "sub_monthly", "name": "Monthly Sub",  "credits": 100,  "bonus_credits": 0,    "price_usd": 10.00},
+    {"id": "sub_annual",  "name": "Annual Sub",   "credits": 1000, "bonus_credits": 0,    "price_usd": 72.00},
+]
+
+
+def seed_packages() -> None:
+    if database.engine.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+
+    stmt = (
+        insert(models.CreditPackage)
+        .values(DEFAULT_PACKAGES)
+        .on_conflict_do_nothing(index_elements=["id"])
+    )
+    with database.engine.begin() as conn:
+        conn.execute(stmt)
+
+
+def backfill_counters() -> None:
+    """Compute the activity counters once for legacy rows (NULL = never counted)."""
+    char, msg, user, img = models.Character, models.Message, models.User, models.ImageGeneration
+    of_char = msg.character_id == char.id
+    of_user_chars = char.user_id == user.id
+
+    with database.engine.begin() as conn:
+        conn.execute(
+            update(char)
+            .where(char.total_messages.is_(None))
+            .values(
+                total_messages=select(func.count(msg.id)).where(of_char).scalar_subquery(),
+                credits_spent=select(func.coalesce(func.sum(msg.credits_cost), 0)).where(of_char).scalar_subquery(),
+                last_message_at=select(func.max(msg.timestamp)).where(of_char).scalar_subquery(),
+                updated_at=char.updated_at,
+            )
+        )
+        # dupa personaje: totalurile userului se aduna din contoarele lor
+        conn.execute(
+            update(user)
+            .where(user.total_messages.is_(None))
+            .values(
+                total_messages=select(func.coalesce(func.sum(char.total_messages), 0))
+                .where(of_user_chars).scalar_subquery(),
+                total_images=select(func.count(img.id)).where(img.user_id == user.id).scalar_subquery(),
+                last_active_at=select(func.max(char.last_message_at)).where(of_user_chars).scalar_subquery(),
+                updated_at=user.updated_at,
+            )
+        )
+
+
+def sync_stripe_prices() -> None:
+    if not os.getenv("STRIPE_SECRET_KEY"):
+        return
+    import billing
+
+    db = database.SessionLocal()
+    try:
+        billing.sync_packages(db)
+    except Exception as e:
+        print(f"[STRIPE SYNC ERROR] {e}")
+        db.rollback()
+    finally:
+        db.close()
+
+
+def invalidate_package_cache() -> None:
+    import billing
+    import cache
+
+    with database.engine.connect() as conn:
+        ids = conn.execute(select(models.CreditPackage.id)).scalars().all()
+    billing.invalidate_packages(ids)
+    if isinstance(cache.get_cache(), cache.MemoryCache):
+        # cache-ul acestui proces, nu al workerilor: ei vad schimbarea dupa PACKAGES_CACHE_SECONDS
+        print("[MIGRATE] CACHE_URL is memory://, running workers keep their cached packages")
+
+
+def run() -> None:
+    started = time.perf_counter()
+    database.sync_schema(models.Base.metadata)
+    search.install(database.engine)
+    seed_packages()
+    backfill_counters()
+    sync_stripe_prices()
+    invalidate_package_cache()
+    print(f"[MIGRATE] done in {(time.perf_counter() - started) * 1000:.0f}ms")
+
+
+if __name__ == "__main__":
+    run()
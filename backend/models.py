@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Text, Float
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Text, Float, Index
 from sqlalchemy.orm import relationship
 from database import Base
 from datetime import datetime
@@ -23,8 +23,17 @@ class User(Base):
 
     is_premium = Column(Boolean, default=False)
     created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)  # versiune pt ETag
     last_login = Column(DateTime, default=datetime.utcnow)
 
+    # Contoare incrementate la scriere (utils.record_activity), pentru /dashboard/summary.
+    # Pe viata contului: nu scad cand se sterge un personaj. NULL = inca necalculat (migrate.py)
+    total_messages = Column(Integer, default=0)
+    total_images = Column(Integer, default=0)
+    last_active_at = Column(DateTime, nullable=True)
+    # Versiune galerie (ETag /images/gallery): +1 la orice imagine salvata / terminata / stearsa / like
+    gallery_version = Column(Integer, default=0)
+
     characters = relationship("Character", back_populates="creator", cascade="all, delete-orphan")
     transactions = relationship("Transaction", back_populates="user", cascade="all, delete-orphan")
     image_generations = relationship("ImageGeneration", back_populates="user", cascade="all, delete-orphan")
@@ -34,7 +43,7 @@ class Character(Base):
     __tablename__ = "characters"
 
     id = Column(String, primary_key=True, default=gen_uuid)
-    user_id = Column(String, ForeignKey("users.id", ondelete="CASCADE"))
+    user_id = Column(String, ForeignKey("users.id", ondelete="CASCADE"), index=True)
 
     name = Column(String, nullable=False)
     age = Column(Integer, default=24)
@@ -43,8 +52,16 @@ class Character(Base):
     avatar_url = Column(String, nullable=True)
     seed = Column(Integer, default=None)  # Seed fix pentru consistenta vizuala
 
+    # Memorie pe termen lung: rezumat incremental al mesajelor mai vechi
+    memory_summary = Column(Text, nullable=True)
+    summarized_until = Column(DateTime, nullable=True)  # timestamp-ul ultimului mesaj inclus
+
     total_images_generated = Column(Integer, default=0)
+    total_messages = Column(Integer, default=0)        # user + ai, inclusiv mesajele-poza
+    credits_spent = Column(Integer, default=0)
+    last_message_at = Column(DateTime, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     creator = relationship("User", back_populates="characters")
     messages = relationship("Message", back_populates="character", cascade="all, delete-orphan")
@@ -66,6 +83,10 @@ class Message(Base):
 
     character = relationship("Character", back_populates="messages")
 
+    __table_args__ = (
+        Index("ix_messages_character_timestamp", "character_id", "timestamp"),
+    )
+
 
 class Transaction(Base):
     __tablename__ = "transactions"
@@ -82,6 +103,10 @@ class Transaction(Base):
 
     user = relationship("User", back_populates="transactions")
 
+    __table_args__ = (
+        Index("ix_transactions_user_created", "user_id", "created_at"),
+    )
+
 
 class ImageGeneration(Base):
     __tablename__ = "image_generations"
@@ -93,12 +118,33 @@ class ImageGeneration(Base):
     prompt = Column(Text)
     nsfw_level = Column(Integer, default=0)   # 0=Safe, 1=Suggestive, 2=Explicit
     credits_cost = Column(Integer)
-    image_url = Column(String)
+    image_url = Column(String)                  # draft-ul cat timp status == "rendering"
+    draft_url = Column(String, nullable=True)   # randarea rapida (mod progresiv)
+    status = Column(String, default="ready")    # "rendering" -> "ready"; NULL (randuri vechi) = ready
     liked = Column(Boolean, default=False)
     created_at = Column(DateTime, default=datetime.utcnow, index=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     user = relationship("User", back_populates="image_generations")
 
+    __table_args__ = (
+        # Filtrele din galerie incep toate cu user_id si sorteaza dupa created_at
+        Index("ix_image_generations_user_created", "user_id", "created_at"),
+        Index("ix_image_generations_user_character_created", "user_id", "character_id", "created_at"),
+        Index("ix_image_generations_user_nsfw_created", "user_id", "nsfw_level", "created_at"),
+        Index(
+            "ix_image_generations_user_liked_created", "user_id", "created_at",
+            postgresql_where=(liked == True),
+            sqlite_where=(liked == True),
+        ),
+        # Randarile orfane (main._reap_stale_renders): cateva randuri, nu toata galeria userului
+        Index(
+            "ix_image_generations_user_rendering", "user_id", "created_at",
+            postgresql_where=(status == "rendering"),
+            sqlite_where=(status == "rendering"),
+        ),
+    )
+
 
 class CreditPackage(Base):
     __tablename__ = "credit_packages"
@@ -109,5 +155,7 @@ class CreditPackage(Base):
     price_usd = Column(Float)
     bonus_credits = Column(Integer, default=0)
     stripe_price_id = Column(String, nullable=True)
+    # lookup_key-ul (include suma) pentru care a fost gasit stripe_price_id: alt key = price_usd schimbat, re-sync
+    stripe_lookup_key = Column(String, nullable=True)
     is_active = Column(Boolean, default=True)
     created_at = Column(DateTime, default=datetime.utcnow)
@@ -0,0 +1,140 @@
+"""
+bcrypt hashing off the request threads.
+
+Every hash/verify costs ~100-300 ms of CPU. Run on the shared threadpool,
+a burst of logins slows /chat for everyone. Here they run in a small,
+dedicated process pool (PASSWORD_WORKERS processes per gunicorn worker).
+At most PASSWORD_QUEUE_MAX jobs may be queued or running; after that
+hash()/verify() raise Busy right away (503 + Retry-After) and do not pile up.
+
+verify() also returns a new hash when the stored one uses old parameters
+(BCRYPT_ROUNDS raised, deprecated scheme). The caller saves it, so users
+are rehashed when they next log in.
+
+Keep this module light: the pool processes import it, and only passlib is
+imported, on first use.
+"""
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional, Tuple
+
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PASSWORD_WORKERS = int(os.getenv("PASSWORD_WORKERS", "2"))
+PASSWORD_QUEUE_MAX = int(os.getenv("PASSWORD_QUEUE_MAX", str(PASSWORD_WORKERS * 8)))
+
+
+class Busy(Exception):
+    """Too many hashes queued; the client should retry later."""
+
+    def __init__(self, retry_after: int):
+        self.retry_after = retry_after
+        self.status_code = 503
+        self.detail = "Too many login attempts right now. Please try again in a moment."
+        super().__init__(self.detail)
+
+
+# ── Runs inside the pool processes ───────────────────────────────────────────
+_context = None
+
+
+def _pwd_context():
+    global _context
+    if _context is None:
+        from passlib.context import CryptContext
+        _context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+    return _context
+
+
+def hash_password(password: str) -> str:
+    return _pwd_context().hash(password)
+
+
+def verify_and_update(password: str, hashed: str) -> Tuple[bool, Optional[str]]:
+    """(matches, new_hash) - new_hash is set only when the stored hash needs upgrading."""
+    try:
+        return _pwd_context().verify_and_update(password, hashed)
+    except ValueError:   # hash corupt / format necunoscut
+        return False, None
+
+
+# ── Pool (request side) ──────────────────────────────────────────────────────
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+_pending = 0
+_stats = {"completed": 0, "rejected": 0, "rehashed": 0, "avg_ms": 150.0}
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn: copiii nu mostenesc threadurile/conexiunile DB ale workerului
+            _pool = ProcessPoolExecutor(
+                max_workers=PASSWORD_WORKERS, mp_context=multiprocessing.get_context("spawn")
+            )
+        return _pool
+
+
+def _reset_pool() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def _retry_after() -> int:
+    waves = _pending / max(PASSWORD_WORKERS, 1)
+    return max(1, int(waves * _stats["avg_ms"] / 1000) + 1)
+
+
+async def _submit(fn, *args):
+    global _pending
+    if _pending >= PASSWORD_QUEUE_MAX:
+        _stats["rejected"] += 1
+        raise Busy(_retry_after())
+
+    _pending += 1
+    started = time.perf_counter()
+    try:
+        result = await asyncio.get_running_loop().run_in_executor(_get_pool(), fn, *args)
+    except BrokenProcessPool:
+        _reset_pool()   # un copil a murit (OOM); urmatorul apel porneste alt pool
+        raise
+    finally:
+        _pending -= 1
+
+    ms = (time.perf_counter() - started) * 1000
+    _stats["avg_ms"] = _stats["avg_ms"] * 0.9 + ms * 0.1
+    _stats["completed"] += 1
+    return result
+
+
+async def hash(password: str) -> str:
+    return await _submit(hash_password, password)
+
+
+async def verify(password: str, hashed: str) -> Tuple[bool, Optional[str]]:
+    ok, new_hash = await _submit(verify_and_update, password, hashed)
+    if new_hash:
+        _stats["rehashed"] += 1
+    return ok, new_hash
+
+
+def stats() -> dict:
+    return {
+        "workers": PASSWORD_WORKERS,
+        "queue_max": PASSWORD_QUEUE_MAX,
+        "pending": _pending,
+        "bcrypt_rounds": BCRYPT_ROUNDS,
+        **{k: round(v, 1) if isinstance(v, float) else v for k, v in _stats.items()},
+    }
+
+
+def shutdown() -> None:
+    _reset_pool()
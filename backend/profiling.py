@@ -0,0 +1,230 @@
+"""
+Opt-in request instrumentation (PROFILING_ENABLED=1).
+
+- SQL accounting: SQLAlchemy cursor events count statements and their time
+  per request. The same statement repeated more than N_PLUS_ONE_THRESHOLD
+  times is logged as a probable N+1 (e.g. lazy relationship loads).
+- Phases: profiling.phase("llm") blocks (plus "auth", "json" and "db") give a
+  per-request breakdown. Requests slower than SLOW_REQUEST_MS are logged with it.
+  Every response gets a Server-Timing header.
+- Sampling profiler: an admin arms a route prefix for N requests. The
+  threads serving those requests are sampled every SAMPLE_INTERVAL seconds
+  and the stacks are aggregated in collapsed ("folded") format, ready for
+  flamegraph.pl / speedscope. The event-loop thread is shared, so its
+  samples can include concurrent requests.
+"""
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+from fastapi.responses import ORJSONResponse
+from sqlalchemy import event
+
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "0") == "1"
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "1000"))
+N_PLUS_ONE_THRESHOLD = int(os.getenv("N_PLUS_ONE_THRESHOLD", "5"))
+SAMPLE_INTERVAL = float(os.getenv("PROFILE_SAMPLE_INTERVAL", "0.005"))
+MAX_STACK_DEPTH = 64
+
+
+class RequestProfile:
+    def __init__(self, method: str, path: str):
+        self.method = method
+        self.path = path
+        self.started = time.perf_counter()
+        self.sql_count = 0
+        self.sql_ms = 0.0
+        self.statements: Counter = Counter()
+        self.phases: Dict[str, float] = {}
+        self.threads = {threading.get_ident()}
+
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self.started) * 1000
+
+    def add_phase(self, name: str, ms: float) -> None:
+        self.phases[name] = self.phases.get(name, 0.0) + ms
+
+    def breakdown(self) -> Dict[str, float]:
+        parts = {"db": self.sql_ms, **self.phases}
+        parts["other"] = max(self.elapsed_ms() - sum(parts.values()), 0.0)
+        return parts
+
+
+_current: ContextVar[Optional[RequestProfile]] = ContextVar("request_profile", default=None)
+
+
+class phase:
+    """with profiling.phase("llm"): ...  - no-op when profiling is off."""
+
+    __slots__ = ("name", "profile", "started")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.profile = _current.get()
+
+    def __enter__(self):
+        if self.profile is not None:
+            self.profile.threads.add(threading.get_ident())
+            self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        if self.profile is not None:
+            self.profile.add_phase(self.name, (time.perf_counter() - self.started) * 1000)
+        return False
+
+
+class TimedORJSONResponse(ORJSONResponse):
+    def render(self, content) -> bytes:
+        with phase("json"):
+            return super().render(content)
+
+
+# ── SQL accounting ───────────────────────────────────────────────────────────
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None:
+        conn.info.setdefault("profiling_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = _current.get()
+    if profile is None:
+        return
+    started = conn.info.get("profiling_started")
+    if not started:
+        return
+    profile.sql_ms += (time.perf_counter() - started.pop()) * 1000
+    profile.sql_count += 1
+    profile.statements[statement] += 1
+    profile.threads.add(threading.get_ident())
+
+
+# ── Sampling profiler ────────────────────────────────────────────────────────
+_armed: Dict[str, int] = {}            # route prefix -> requests left to sample
+_folded: Dict[str, Counter] = {}       # route prefix -> folded stacks
+_armed_lock = threading.Lock()
+
+
+def arm(route_prefix: str, requests: int) -> None:
+    with _armed_lock:
+        _armed[route_prefix] = requests
+        _folded.setdefault(route_prefix, Counter())
+
+
+def folded_stacks(route_prefix: str) -> str:
+    with _armed_lock:
+        stacks = _folded.get(route_prefix, Counter())
+        return "\n".join(f"{stack} {count}" for stack, count in stacks.most_common())
+
+
+def status() -> dict:
+    with _armed_lock:
+        return {
+            "armed": dict(_armed),
+            "samples": {prefix: sum(c.values()) for prefix, c in _folded.items()},
+        }
+
+
+def _claim_sampling(path: str) -> Optional[str]:
+    with _armed_lock:
+        for prefix, left in _armed.items():
+            if left > 0 and path.startswith(prefix):
+                _armed[prefix] = left - 1
+                return prefix
+    return None
+
+
+def _fold(frame) -> str:
+    names = []
+    while frame is not None and len(names) < MAX_STACK_DEPTH:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class _Sampler(threading.Thread):
+    def __init__(self, profile: RequestProfile, prefix: str):
+        super().__init__(daemon=True, name="profiling-sampler")
+        self.profile = profile
+        self.prefix = prefix
+        self.stacks: Counter = Counter()
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(SAMPLE_INTERVAL):
+            frames = sys._current_frames()
+            for ident in list(self.profile.threads):
+                frame = frames.get(ident)
+                if frame is not None:
+                    self.stacks[_fold(frame)] += 1
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+        with _armed_lock:
+            _folded.setdefault(self.prefix, Counter()).update(self.stacks)
+
+
+# ── Middleware ───────────────────────────────────────────────────────────────
+class ProfilingMiddleware:
+    """Pure ASGI (not BaseHTTPMiddleware) so streaming and disconnect detection keep working."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        profile = RequestProfile(scope["method"], scope["path"])
+        token = _current.set(profile)
+        prefix = _claim_sampling(scope["path"])
+        sampler = _Sampler(profile, prefix) if prefix else None
+        if sampler:
+            sampler.start()
+        status_code = 500
+
+        async def send_with_timing(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                timing = (
+                    f'db;dur={profile.sql_ms:.1f};desc="{profile.sql_count} queries", '
+                    f"app;dur={profile.elapsed_ms():.1f}"
+                )
+                message.setdefault("headers", []).append((b"server-timing", timing.encode()))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            if sampler:
+                sampler.stop()
+            _current.reset(token)
+            _report(profile, status_code)
+
+
+def _report(profile: RequestProfile, status_code: int) -> None:
+    for statement, count in profile.statements.items():
+        if count > N_PLUS_ONE_THRESHOLD:
+            print(f"[PROFILE] possible N+1 on {profile.method} {profile.path}: "
+                  f"{count}x {' '.join(statement.split())[:160]}")
+
+    total = profile.elapsed_ms()
+    if total >= SLOW_REQUEST_MS:
+        parts = " ".join(f"{name}={ms:.0f}ms" for name, ms in profile.breakdown().items())
+        print(f"[SLOW] {profile.method} {profile.path} {total:.0f}ms status={status_code} "
+              f"queries={profile.sql_count} {parts}")
+
+
+def install(app, engine) -> None:
+    if not PROFILING_ENABLED:
+        return
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    app.add_middleware(ProfilingMiddleware)
@@ -0,0 +1,112 @@
+"""
+Prompt assembly with a token budget.
+
+- count_tokens(): local tokenizer. tiktoken is used if it is installed;
+  otherwise a regex approximation of BPE (about 4 characters per token
+  for long words, 1 per short word or punctuation mark). No network calls.
+- SystemPromptCache: the persona prompt is compiled once per
+  (character id, version) and reused byte-for-byte. Provider-side prompt
+  caching then always hits on the system prefix.
+- fill_history(): walks history newest-first and keeps turns until the
+  budget is spent, so a few very long messages cannot blow up the prompt.
+  The current user turn is always kept whole.
+- Memory + recalled facts get at most CONTEXT_BUDGET_SHARE of what the
+  persona leaves, and each recalled snippet at most RECALL_SNIPPET_TOKENS,
+  so recall can never push the conversation itself out of the prompt.
+"""
+import math
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Callable, Hashable, List, Tuple
+
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "1800"))   # system + context + history
+CONTEXT_BUDGET_SHARE = float(os.getenv("PROMPT_CONTEXT_SHARE", "0.3"))   # memory + recall
+RECALL_SNIPPET_TOKENS = int(os.getenv("RECALL_SNIPPET_TOKENS", "60"))
+TURN_OVERHEAD_TOKENS = 4   # role / formatting per message
+SYSTEM_CACHE_SIZE = 2048
+
+_WORD_RE = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+_UNSET = object()
+_encoding = _UNSET
+
+
+def _get_encoding():
+    # Lazy: tiktoken (optional) loads its BPE table on first use, not at import
+    global _encoding
+    if _encoding is _UNSET:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception:   # not installed / BPE file unavailable offline
+            _encoding = None
+    return _encoding
+
+
+def count_tokens(text: str) -> int:
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return sum(math.ceil(len(piece) / 4) for piece in _WORD_RE.findall(text))
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    if count_tokens(text) <= max_tokens:
+        return text
+    encoding = _get_encoding()
+    if encoding is not None:
+        return encoding.decode(encoding.encode(text, disallowed_special=())[:max_tokens])
+    used = 0
+    for match in _WORD_RE.finditer(text):
+        used += math.ceil(len(match.group()) / 4)
+        if used > max_tokens:
+            return text[:match.start()].rstrip()
+    return text
+
+
+class SystemPromptCache:
+    """LRU of compiled system prompts: key -> (text, token count)."""
+
+    def __init__(self, maxsize: int = SYSTEM_CACHE_SIZE):
+        self._items: "OrderedDict[Hashable, Tuple[str, int]]" = OrderedDict()
+        self._maxsize = maxsize
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, build: Callable[[], str]) -> Tuple[str, int]:
+        with self._lock:
+            hit = self._items.get(key)
+            if hit is not None:
+                self._items.move_to_end(key)
+                return hit
+        text = build()
+        entry = (text, count_tokens(text))
+        with self._lock:
+            self._items[key] = entry
+            if len(self._items) > self._maxsize:
+                self._items.popitem(last=False)
+        return entry
+
+
+def turn_cost(turn: dict) -> int:
+    return count_tokens(turn["content"]) + TURN_OVERHEAD_TOKENS
+
+
+def fill_history(turns: List[dict], budget: int) -> List[dict]:
+    """Keep the newest turns that fit in `budget` tokens (chronological order preserved).
+
+    The newest turn (the message being answered) is always kept whole, even
+    if it alone exceeds the budget.
+    """
+    kept = []
+    remaining = budget
+    for turn in reversed(turns):
+        cost = turn_cost(turn)
+        if cost > remaining and kept:
+            break
+        kept.append(turn)
+        remaining -= cost
+    kept.reverse()
+    return kept
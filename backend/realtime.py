@@ -0,0 +1,63 @@
+"""
+Per-user WebSocket hub.
+
+A browser tab opens /ws once: it authenticates a single time and then
+receives pushed events. HTTP routes and background work can publish to
+every socket of a user:
+
+    {"type": "credits",      "credits": 42, "level": 2}
+    {"type": "image_ready",  "image": {...}}
+    {"type": "avatar_ready", "character_id": "...", "avatar_url": "..."}
+
+Events stay inside one worker process: a user's sockets live in the
+worker that accepted them.
+"""
+import asyncio
+from collections import defaultdict
+from typing import Dict, Set
+
+import orjson
+from fastapi import WebSocket
+
+
+class Hub:
+    def __init__(self):
+        self._sockets: Dict[str, Set[WebSocket]] = defaultdict(set)
+        self._loop = None
+
+    def connect(self, user_id: str, websocket: WebSocket) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._sockets[user_id].add(websocket)
+
+    def disconnect(self, user_id: str, websocket: WebSocket) -> None:
+        sockets = self._sockets.get(user_id)
+        if sockets is not None:
+            sockets.discard(websocket)
+            if not sockets:
+                del self._sockets[user_id]
+
+    def is_online(self, user_id: str) -> bool:
+        return user_id in self._sockets
+
+    async def send(self, websocket: WebSocket, event: dict) -> None:
+        await websocket.send_text(orjson.dumps(event).decode())
+
+    async def publish(self, user_id: str, event: dict) -> None:
+        for websocket in list(self._sockets.get(user_id, ())):
+            try:
+                await self.send(websocket, event)
+            except Exception:
+                self.disconnect(user_id, websocket)
+
+    def publish_threadsafe(self, user_id: str, event: dict) -> None:
+        """For sync routes running on the threadpool."""
+        if self._loop is None or not self.is_online(user_id):
+            return
+        asyncio.run_coroutine_threadsafe(self.publish(user_id, event), self._loop)
+
+
+hub = Hub()
+
+
+def credits_event(user) -> dict:
+    return {"type": "credits", "credits": user.credits, "level": user.level}
@@ -0,0 +1,268 @@
+"""
+Scheduler for outbound generation work (LLM calls, fal.ai renders).
+
+Every provider call takes a slot first:
+
+    async with scheduler.slot("llm", scheduler.tier_for(user), deadline):
+        ...
+    with scheduler.blocking_slot("image", tier):        # sync code (threadpool)
+        ...
+
+- Bounded concurrency per provider (SCHED_<PROVIDER>_CONCURRENCY).
+- Waiters queue per tier: "premium" (User.is_premium), "loyal" (level >= 3)
+  and "free". Freed slots go to the tiers by weighted-fair (stride)
+  scheduling: under saturation premium gets ~6x and loyal ~3x the slots of
+  free, and no tier starves.
+- Admission control: a request is rejected right away (Overloaded ->
+  503 + Retry-After) when its tier's share of the queue is full, or when
+  the estimated wait would not fit in its deadline. Free traffic can fill
+  only half of the queue, so premium still gets in during a free-tier burst.
+- Queue-wait and service-time metrics per provider/tier: stats(), shown in
+  /admin/stats.
+
+State is per worker process, like realtime.hub.
+"""
+import asyncio
+import math
+import os
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import Dict, Optional
+
+TIERS = ("premium", "loyal", "free")
+TIER_WEIGHTS = {"premium": 6, "loyal": 3, "free": 1}
+TIER_QUEUE_SHARE = {"premium": 1.0, "loyal": 0.8, "free": 0.5}   # cat din coada poate ocupa un tier
+LOYAL_LEVEL = 3
+WAIT_SAMPLES = 500
+
+
+class Overloaded(Exception):
+    """Provider saturated: rejected before queueing, with a retry hint."""
+
+    def __init__(self, provider: str, retry_after: int):
+        self.provider = provider
+        self.retry_after = retry_after
+        self.status_code = 503
+        self.detail = "We're very busy right now. Please try again in a moment."
+        super().__init__(self.detail)
+
+
+def tier_for(user) -> str:
+    if user.is_premium:
+        return "premium"
+    if (user.level or 1) >= LOYAL_LEVEL:
+        return "loyal"
+    return "free"
+
+
+class _Waiter:
+    __slots__ = ("tier", "enqueued", "granted", "future", "loop", "event")
+
+    def __init__(self, tier: str):
+        self.tier = tier
+        self.enqueued = time.monotonic()
+        self.granted = False
+        self.future = None    # async waiters
+        self.loop = None
+        self.event = None     # thread waiters
+
+    def wake(self) -> None:
+        if self.event is not None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(_resolve, self.future)
+
+
+def _resolve(future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+class Provider:
+    def __init__(self, name: str, concurrency: int, queue_max: int, service_seconds: float):
+        self.name = name
+        self.concurrency = concurrency
+        self.queue_max = queue_max
+        self.active = 0
+        self.avg_service = service_seconds     # EWMA, pentru estimarea asteptarii
+        self._lock = threading.Lock()
+        self._queues = {tier: deque() for tier in TIERS}
+        self._passes = {tier: 0.0 for tier in TIERS}
+        self._vtime = 0.0
+        self._metrics = {
+            tier: {"admitted": 0, "rejected": 0, "completed": 0, "waits": deque(maxlen=WAIT_SAMPLES)}
+            for tier in TIERS
+        }
+
+    # ── all helpers below run under self._lock ──
+    def _queued(self) -> int:
+        return sum(len(q) for q in self._queues.values())
+
+    def _estimated_wait(self, tier: str) -> float:
+        # Cat serveste WFQ inaintea noastra: tot tier-ul nostru + partea ponderata din celelalte
+        mine = len(self._queues[tier]) + 1
+        ahead = mine + sum(
+            min(len(self._queues[other]), mine * TIER_WEIGHTS[other] / TIER_WEIGHTS[tier])
+            for other in TIERS if other != tier
+        )
+        return ahead / self.concurrency * self.avg_service
+
+    def _admit(self, tier: str, budget: Optional[float]) -> None:
+        if self.active < self.concurrency and not self._queued():
+            return
+        wait = self._estimated_wait(tier)
+        too_long = budget is not None and wait + self.avg_service > budget
+        if self._queued() >= self.queue_max * TIER_QUEUE_SHARE[tier] or too_long:
+            self._metrics[tier]["rejected"] += 1
+            raise Overloaded(self.name, max(1, math.ceil(wait)))
+
+    def _enqueue(self, tier: str, budget: Optional[float], admit: bool) -> _Waiter:
+        if admit:
+            self._admit(tier, budget)
+        self._metrics[tier]["admitted"] += 1
+
+        waiter = _Waiter(tier)
+        if self.active < self.concurrency and not self._queued():
+            self._grant(waiter)
+            return waiter
+        if not self._queues[tier]:
+            # tier-ul revine in competitie: nu primeste credit pentru timpul cat a stat gol
+            self._passes[tier] = max(self._passes[tier], self._vtime)
+        self._queues[tier].append(waiter)
+        return waiter
+
+    def _grant(self, waiter: _Waiter) -> None:
+        self.active += 1
+        waiter.granted = True
+        self._metrics[waiter.tier]["waits"].append((time.monotonic() - waiter.enqueued) * 1000)
+
+    def _next(self) -> Optional[_Waiter]:
+        ready = [tier for tier in TIERS if self._queues[tier]]
+        if not ready:
+            return None
+        tier = min(ready, key=lambda t: self._passes[t])
+        self._vtime = self._passes[tier]
+        self._passes[tier] += 1.0 / TIER_WEIGHTS[tier]
+        return self._queues[tier].popleft()
+
+    def _free_slot(self) -> None:
+        self.active -= 1
+        while self.active < self.concurrency:
+            waiter = self._next()
+            if waiter is None:
+                break
+            self._grant(waiter)
+            waiter.wake()
+
+    # ── public (thread-safe) ──
+    def release(self, tier: str, started: float) -> None:
+        with self._lock:
+            held = time.monotonic() - started
+            self.avg_service = self.avg_service * 0.9 + held * 0.1
+            self._metrics[tier]["completed"] += 1
+            self._free_slot()
+
+    def abandon(self, waiter: _Waiter) -> None:
+        """The waiter gave up (cancelled / timed out) before using its slot."""
+        with self._lock:
+            if waiter.granted:
+                self._free_slot()
+            else:
+                self._queues[waiter.tier].remove(waiter)
+
+    def stats(self) -> dict:
+        with self._lock:
+            tiers = {}
+            for tier, m in self._metrics.items():
+                waits = sorted(m["waits"])
+                tiers[tier] = {
+                    "queued": len(self._queues[tier]),
+                    "admitted": m["admitted"],
+                    "rejected": m["rejected"],
+                    "completed": m["completed"],
+                    "wait_p50_ms": round(waits[len(waits) // 2], 1) if waits else None,
+                    "wait_p95_ms": round(waits[int(len(waits) * 0.95)], 1) if waits else None,
+                }
+            return {
+                "concurrency": self.concurrency,
+                "active": self.active,
+                "queue_max": self.queue_max,
+                "avg_service_s": round(self.avg_service, 2),
+                "tiers": tiers,
+            }
+
+
+def _provider(name: str, concurrency: int, queue_max: int, service_seconds: float) -> Provider:
+    env = f"SCHED_{name.upper()}_"
+    return Provider(
+        name,
+        concurrency=int(os.getenv(env + "CONCURRENCY", concurrency)),
+        queue_max=int(os.getenv(env + "QUEUE_MAX", queue_max)),
+        service_seconds=service_seconds,
+    )
+
+
+PROVIDERS: Dict[str, Provider] = {
+    "llm": _provider("llm", 16, 64, 4.0),
+    "image": _provider("image", 4, 24, 20.0),
+}
+
+
+@asynccontextmanager
+async def slot(provider: str, tier: str, deadline=None, admit: bool = True):
+    """Hold one `provider` slot. Raises Overloaded if not admitted."""
+    p = PROVIDERS[provider]
+    with p._lock:
+        waiter = p._enqueue(tier, deadline.remaining() if deadline else None, admit)
+        if not waiter.granted:
+            waiter.loop = asyncio.get_running_loop()
+            waiter.future = waiter.loop.create_future()
+    if waiter.future is not None:
+        try:
+            await waiter.future
+        except BaseException:
+            p.abandon(waiter)
+            raise
+
+    started = time.monotonic()
+    try:
+        yield
+    finally:
+        p.release(tier, started)
+
+
+async def run(provider: str, tier: str, coro, deadline=None, admit: bool = True):
+    """Await `coro` inside a slot (closed unstarted if the request is rejected)."""
+    try:
+        async with slot(provider, tier, deadline, admit):
+            return await coro
+    finally:
+        coro.close()
+
+
+@contextmanager
+def blocking_slot(provider: str, tier: str, timeout: Optional[float] = None, admit: bool = True):
+    """slot() for sync code running on the threadpool."""
+    p = PROVIDERS[provider]
+    with p._lock:
+        waiter = p._enqueue(tier, timeout, admit)
+        if not waiter.granted:
+            waiter.event = threading.Event()
+    if waiter.event is not None and not waiter.event.wait(timeout):
+        with p._lock:
+            if not waiter.granted:
+                p._queues[tier].remove(waiter)
+                raise Overloaded(provider, max(1, math.ceil(p._estimated_wait(tier))))
+        # acordat chiar la limita: il folosim
+
+    started = time.monotonic()
+    try:
+        yield
+    finally:
+        p.release(tier, started)
+
+
+def stats() -> dict:
+    return {name: p.stats() for name, p in PROVIDERS.items()}
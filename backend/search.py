@@ -0,0 +1,232 @@
+"""
+Full-text search over chat messages (Message.content) and gallery prompts
+(ImageGeneration.prompt).
+
+SQLite:   FTS5 tables kept in sync by triggers. The source tables have TEXT
+          primary keys, so their implicit rowid is not stable (VACUUM may
+          renumber it): each FTS table stores its own copy of the text and
+          <fts>_ids maps its INTEGER rowid to the row id.
+Postgres: generated tsvector columns + GIN indexes.
+
+In both cases the database updates the index on every INSERT, so there is
+no batch re-indexing. Results are ranked (bm25 / ts_rank_cd), highlighted
+with <mark> (the rest of the snippet is HTML-escaped) and paged with an
+opaque keyset cursor over (score, id).
+"""
+import base64
+import html
+import re
+from typing import Optional, Tuple
+
+import orjson
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+MARK_START = "<mark>"
+MARK_END = "</mark>"
+# Private-use code points: the database marks the matches with these, the text
+# is escaped, then they become <mark> tags
+_SEL_START = "\ue000"
+_SEL_END = "\ue001"
+
+SCOPES = ("messages", "images")
+
+# (table, text column, FTS / index name)
+_SOURCES = {
+    "messages": ("messages", "content", "messages_fts"),
+    "images": ("image_generations", "prompt", "image_generations_fts"),
+}
+
+
+# ── Index setup ──────────────────────────────────────────────────────────────
+def install(engine) -> None:
+    """Create the text indexes if missing. Safe to call on every boot."""
+    with engine.begin() as conn:
+        if engine.dialect.name == "sqlite":
+            for table, column, fts in _SOURCES.values():
+                _install_sqlite(conn, table, column, fts)
+        elif engine.dialect.name == "postgresql":
+            for table, column, _ in _SOURCES.values():
+                _install_postgres(conn, table, column)
+
+
+def _install_sqlite(conn, table: str, column: str, fts: str) -> None:
+    ids = f"{fts}_ids"
+    installed = {
+        name for (name,) in conn.execute(
+            text("SELECT name FROM sqlite_master WHERE type = 'table' AND name IN (:fts, :ids)"),
+            {"fts": fts, "ids": ids},
+        )
+    }
+    if fts in installed and ids not in installed:
+        # versiunea veche: external content pe rowid-ul implicit, o refacem
+        for suffix in ("ai", "ad", "au"):
+            conn.execute(text(f"DROP TRIGGER IF EXISTS {fts}_{suffix}"))
+        conn.execute(text(f"DROP TABLE {fts}"))
+        installed.clear()
+
+    if not installed:
+        conn.execute(text(f"CREATE TABLE {ids} (rowid INTEGER PRIMARY KEY, id TEXT NOT NULL UNIQUE)"))
+        conn.execute(text(
+            f"CREATE VIRTUAL TABLE {fts} USING fts5("
+            f"{column}, tokenize='unicode61 remove_diacritics 2')"
+        ))
+        # index rows that existed before the FTS table
+        conn.execute(text(f"INSERT INTO {ids}(id) SELECT id FROM {table}"))
+        conn.execute(text(
+            f"INSERT INTO {fts}(rowid, {column}) "
+            f"SELECT m.rowid, s.{column} FROM {ids} m JOIN {table} s ON s.id = m.id"
+        ))
+
+    row = f"(SELECT rowid FROM {ids} WHERE id = old.id)"
+    conn.execute(text(
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN "
+        f"INSERT INTO {ids}(id) VALUES (new.id); "
+        f"INSERT INTO {fts}(rowid, {column}) SELECT rowid, new.{column} FROM {ids} WHERE id = new.id; END"
+    ))
+    conn.execute(text(
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN "
+        f"DELETE FROM {fts} WHERE rowid = {row}; "
+        f"DELETE FROM {ids} WHERE id = old.id; END"
+    ))
+    conn.execute(text(
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {column} ON {table} BEGIN "
+        f"UPDATE {fts} SET {column} = new.{column} WHERE rowid = {row}; END"
+    ))
+
+
+def _install_postgres(conn, table: str, column: str) -> None:
+    # 'simple' config: conversations mix English and Romanian, no stemming
+    conn.execute(text(
+        f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS search_tsv tsvector "
+        f"GENERATED ALWAYS AS (to_tsvector('simple', coalesce({column}, ''))) STORED"
+    ))
+    conn.execute(text(
+        f"CREATE INDEX IF NOT EXISTS ix_{table}_search_tsv ON {table} USING GIN (search_tsv)"
+    ))
+
+
+# ── Cursor ───────────────────────────────────────────────────────────────────
+def encode_cursor(score: float, row_id: str) -> str:
+    return base64.urlsafe_b64encode(orjson.dumps([score, row_id])).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[float, str]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        score, row_id = orjson.loads(base64.urlsafe_b64decode(padded))
+        return float(score), str(row_id)
+    except (ValueError, TypeError, orjson.JSONDecodeError):
+        raise ValueError("Invalid cursor.")
+
+
+# ── Query ────────────────────────────────────────────────────────────────────
+def _fts5_query(q: str) -> str:
+    # Every word becomes a quoted phrase: user input never hits FTS5 syntax
+    words = re.findall(r"\w+", q)
+    return " ".join('"' + w + '"' for w in words)
+
+
+def search(
+    db: Session,
+    user_id: str,
+    q: str,
+    scope: str = "messages",
+    character_id: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = 20,
+) -> Tuple[list, Optional[str]]:
+    """Returns (rows, next_cursor). Lower score = better match."""
+    params = {"user_id": user_id, "limit": limit + 1}
+    after = decode_cursor(cursor) if cursor else None
+    if after:
+        params["after_score"], params["after_id"] = after
+    if character_id:
+        params["character_id"] = character_id
+
+    if db.bind.dialect.name == "sqlite":
+        params["q"] = _fts5_query(q)
+        if not params["q"]:
+            return [], None
+        sql = _sqlite_sql(scope, bool(character_id), bool(after))
+    else:
+        params["q"] = q
+        sql = _postgres_sql(scope, bool(character_id), bool(after))
+
+    rows = db.execute(text(sql), params).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].score, rows[-1].id)
+    return [{**row._mapping, "snippet": highlight(row.snippet)} for row in rows], next_cursor
+
+
+def highlight(snippet: Optional[str]) -> str:
+    """Escape the stored text, then turn the match markers into <mark> tags."""
+    escaped = html.escape(snippet or "")
+    return escaped.replace(_SEL_START, MARK_START).replace(_SEL_END, MARK_END)
+
+
+def _filters(scope: str, by_character: bool, alias: str) -> str:
+    owner = "c.user_id = :user_id" if scope == "messages" else f"{alias}.user_id = :user_id"
+    if by_character:
+        owner += f" AND {alias}.character_id = :character_id"
+    return owner
+
+
+_KEYSET = "(score > :after_score OR (score = :after_score AND id > :after_id))"
+
+
+def _sqlite_sql(scope: str, by_character: bool, keyset: bool) -> str:
+    table, column, fts = _SOURCES[scope]
+    snippet = f"snippet({fts}, 0, '{_SEL_START}', '{_SEL_END}', '…', 12)"
+    if scope == "messages":
+        select = "s.id AS id, s.character_id AS character_id, s.sender AS sender, s.timestamp AS created_at"
+        join = "JOIN characters c ON c.id = s.character_id"
+    else:
+        select = "s.id AS id, s.character_id AS character_id, NULL AS sender, s.created_at AS created_at"
+        join = ""
+    return f"""
+        SELECT * FROM (
+            SELECT {select}, {snippet} AS snippet, bm25({fts}) AS score
+            FROM {fts}
+            JOIN {fts}_ids m ON m.rowid = {fts}.rowid
+            JOIN {table} s ON s.id = m.id
+            {join}
+            WHERE {fts} MATCH :q AND {_filters(scope, by_character, "s")}
+        ) AS hits
+        {"WHERE " + _KEYSET if keyset else ""}
+        ORDER BY score, id
+        LIMIT :limit
+    """
+
+
+def _postgres_sql(scope: str, by_character: bool, keyset: bool) -> str:
+    table, column, _ = _SOURCES[scope]
+    if scope == "messages":
+        select = "s.id AS id, s.character_id AS character_id, s.sender AS sender, s.timestamp AS created_at"
+        join = "JOIN characters c ON c.id = s.character_id"
+    else:
+        select = "s.id AS id, s.character_id AS character_id, NULL AS sender, s.created_at AS created_at"
+        join = ""
+    # ts_headline is expensive: compute it only for the page that is returned
+    headline_opts = f"StartSel={_SEL_START}, StopSel={_SEL_END}, MaxFragments=1, MaxWords=18, MinWords=6"
+    return f"""
+        SELECT hits.id, hits.character_id, hits.sender, hits.created_at, hits.score,
+               ts_headline('simple', coalesce(s.{column}, ''), plainto_tsquery('simple', :q),
+                           '{headline_opts}') AS snippet
+        FROM (
+            SELECT * FROM (
+                SELECT {select}, -ts_rank_cd(s.search_tsv, query) AS score
+                FROM {table} s
+                {join}
+                CROSS JOIN plainto_tsquery('simple', :q) AS query
+                WHERE s.search_tsv @@ query AND {_filters(scope, by_character, "s")}
+            ) AS ranked
+            {"WHERE " + _KEYSET if keyset else ""}
+            ORDER BY score, id
+            LIMIT :limit
+        ) AS hits
+        JOIN {table} s ON s.id = hits.id
+        ORDER BY hits.score, hits.id
+    """
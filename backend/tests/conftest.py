@@ -0,0 +1,53 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# Modulele backend-ului sunt importate flat (import cache, import billing), ca in main.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+_TMP = tempfile.mkdtemp(prefix="bunnycrush-tests-")
+os.environ.setdefault("ENVIRONMENT", "development")
+# fisier, nu :memory: - rutele sync ruleaza pe alte thread-uri / conexiuni
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(_TMP, 'test.db')}")
+os.environ.setdefault("MEMORY_INDEX_DIR", os.path.join(_TMP, "memory_index"))
+
+
+@pytest.fixture(scope="session")
+def app():
+    import main
+    import migrate
+
+    migrate.run()
+    return main.app
+
+
+@pytest.fixture
+def client(app):
+    from fastapi.testclient import TestClient
+
+    return TestClient(app)
+
+
+@pytest.fixture
+def make_user(app):
+    """Creates a user + character directly in the DB; returns (user_id, char_id, auth headers)."""
+    import database
+    import models
+    import utils
+
+    def make(credits: int = 100):
+        db = database.SessionLocal()
+        try:
+            user = models.User(email=f"{models.gen_uuid()}@example.com", hashed_password="x", credits=credits)
+            db.add(user)
+            db.flush()
+            char = models.Character(user_id=user.id, name="Test", visual_prompt="test", seed=1)
+            db.add(char)
+            db.commit()
+            token = utils.create_access_token({"sub": user.id})
+            return user.id, char.id, {"Authorization": f"Bearer {token}"}
+        finally:
+            db.close()
+
+    return make
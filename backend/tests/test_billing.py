@@ -0,0 +1,209 @@
+import types
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import billing
+import cache
+import models
+
+
+class InvalidRequestError(Exception):
+    pass
+
+
+class APIConnectionError(Exception):
+    pass
+
+
+class FakeStripe:
+    """Stand-in for the stripe module: Product.create, Price.list, Price.create."""
+
+    error = types.SimpleNamespace(InvalidRequestError=InvalidRequestError)
+
+    def __init__(self):
+        self.products = []
+        self.prices = []
+        self.on_price_create = None   # hook: runs before the Price is stored
+        self.Product = types.SimpleNamespace(create=self._create_product)
+        self.Price = types.SimpleNamespace(list=self._list_prices, create=self._create_price)
+
+    def _create_product(self, **params):
+        product = types.SimpleNamespace(id=f"prod_{len(self.products) + 1}", **params)
+        self.products.append(product)
+        return product
+
+    def _list_prices(self, lookup_keys, active=True, limit=10):
+        found = [p for p in self.prices if p.lookup_key in lookup_keys and p.active == active]
+        return types.SimpleNamespace(data=found[:limit])
+
+    def _create_price(self, **params):
+        if self.on_price_create:
+            self.on_price_create(params)
+        if any(p.lookup_key == params["lookup_key"] for p in self.prices):
+            raise InvalidRequestError("A price already uses this lookup_key")
+        price = types.SimpleNamespace(id=f"price_{len(self.prices) + 1}", active=True, **params)
+        self.prices.append(price)
+        return price
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    models.Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    session.add_all([
+        models.CreditPackage(id="starter", name="Starter", credits=100, bonus_credits=0, price_usd=9.99),
+        models.CreditPackage(id="popular", name="Popular", credits=600, bonus_credits=60, price_usd=39.99),
+        models.CreditPackage(id="sub_monthly", name="Monthly Sub", credits=100, bonus_credits=0, price_usd=10.00),
+        models.CreditPackage(id="retired", name="Retired", credits=50, bonus_credits=0, price_usd=4.99, is_active=False),
+    ])
+    session.commit()
+    yield session
+    session.close()
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache():
+    cache.set_cache(cache.MemoryCache())
+    yield
+    cache.set_cache(None)
+
+
+@pytest.fixture
+def stripe():
+    return FakeStripe()
+
+
+def _price_ids(db):
+    return {p.id: p.stripe_price_id for p in db.query(models.CreditPackage)}
+
+
+def test_sync_creates_one_price_per_active_package(db, stripe):
+    assert billing.sync_packages(db, stripe) == 3
+
+    assert len(stripe.prices) == 3
+    assert len(stripe.products) == 3
+    ids = _price_ids(db)
+    assert ids["retired"] is None
+    by_id = {p.id: p for p in stripe.prices}
+    assert by_id[ids["starter"]].unit_amount == 999
+    assert by_id[ids["starter"]].lookup_key == "bunnycrush_starter_999usd"
+    assert "recurring" not in vars(by_id[ids["starter"]])
+    assert by_id[ids["sub_monthly"]].recurring == {"interval": "month"}
+
+
+def test_second_sync_creates_no_duplicates(db, stripe):
+    billing.sync_packages(db, stripe)
+    first = _price_ids(db)
+
+    assert billing.sync_packages(db, stripe) == 0
+    # a lost stripe_price_id (e.g. restored DB) is found again by lookup_key
+    db.query(models.CreditPackage).update({models.CreditPackage.stripe_price_id: None})
+    db.commit()
+    assert billing.sync_packages(db, stripe) == 3
+
+    assert len(stripe.prices) == 3
+    assert _price_ids(db) == first
+
+
+def test_lookup_key_race_falls_back_to_existing_price(db, stripe):
+    pkg = db.get(models.CreditPackage, "starter")
+
+    def other_worker_wins(params):
+        stripe.on_price_create = None
+        stripe._create_price(**params)
+
+    stripe.on_price_create = other_worker_wins
+    price_id = billing.ensure_price(pkg, stripe)
+
+    assert len(stripe.prices) == 1
+    assert price_id == stripe.prices[0].id
+
+
+def test_other_stripe_errors_propagate(db, stripe):
+    pkg = db.get(models.CreditPackage, "starter")
+
+    def network_down(params):
+        raise APIConnectionError("connection reset")
+
+    stripe.on_price_create = network_down
+    with pytest.raises(APIConnectionError):
+        billing.ensure_price(pkg, stripe)
+
+
+def test_price_id_for_syncs_unsynced_package(db, stripe):
+    pkg = billing.get_package(db, "popular")
+    assert pkg["stripe_price_id"] is None
+
+    price_id = billing.price_id_for(db, pkg, stripe)
+
+    assert price_id == stripe.prices[0].id
+    assert _price_ids(db)["popular"] == price_id
+    assert billing.get_package(db, "popular")["stripe_price_id"] == price_id   # cache invalidated
+
+
+@pytest.mark.parametrize("change", ["deactivate", "delete"])
+def test_price_id_for_missing_package(db, stripe, change):
+    pkg = billing.get_package(db, "popular")   # cached while still active
+    row = db.get(models.CreditPackage, "popular")
+    if change == "deactivate":
+        row.is_active = False
+    else:
+        db.delete(row)
+    db.commit()
+
+    assert billing.price_id_for(db, pkg, stripe) is None
+    assert stripe.prices == []
+    assert billing.get_package(db, "popular") is None
+
+
+def _reprice(db, package_id, price_usd):
+    db.get(models.CreditPackage, package_id).price_usd = price_usd
+    db.commit()
+
+
+def test_price_change_after_sync_moves_to_a_new_price(db, stripe):
+    billing.sync_packages(db, stripe)
+    old = _price_ids(db)["starter"]
+
+    _reprice(db, "starter", 12.99)
+    assert billing.sync_packages(db, stripe) == 1
+
+    new = _price_ids(db)["starter"]
+    assert new != old
+    price = next(p for p in stripe.prices if p.id == new)
+    assert (price.unit_amount, price.lookup_key) == (1299, "bunnycrush_starter_1299usd")
+    assert db.get(models.CreditPackage, "starter").stripe_lookup_key == "bunnycrush_starter_1299usd"
+    assert billing.sync_packages(db, stripe) == 0
+
+    _reprice(db, "starter", 9.99)   # back to the old amount: the old Price is found again
+    assert billing.sync_packages(db, stripe) == 1
+    assert _price_ids(db)["starter"] == old
+    assert len(stripe.prices) == 4
+
+
+def test_checkout_after_price_change_uses_the_new_price(db, stripe):
+    billing.sync_packages(db, stripe)
+    _reprice(db, "popular", 44.99)   # manual edit, no sync run
+    billing.invalidate_packages(["popular"])   # cache expired / migrate.py ran
+
+    pkg = billing.get_package(db, "popular")
+    assert pkg["stripe_price_id"] is None   # stale Price never served from the cache
+
+    price_id = billing.price_id_for(db, pkg, stripe)
+    assert next(p for p in stripe.prices if p.id == price_id).unit_amount == 4499
+    assert billing.get_package(db, "popular")["stripe_price_id"] == price_id
+
+
+def test_rows_synced_before_lookup_key_was_stored(db, stripe):
+    billing.sync_packages(db, stripe)
+    first = _price_ids(db)
+    db.query(models.CreditPackage).update({models.CreditPackage.stripe_lookup_key: None})
+    db.commit()
+
+    assert billing.sync_packages(db, stripe) == 3   # found again by lookup_key
+    assert len(stripe.prices) == 3
+    assert _price_ids(db) == first
@@ -0,0 +1,239 @@
+import pytest
+
+import cache
+
+
+class FakeClock:
+    """Stands in for the `time` module inside cache.py: time() and monotonic() move together."""
+
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self):
+        return self.now
+
+    def monotonic(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+class FakeRedis:
+    """The Redis commands RedisCache uses, in memory, with expiry on the fake clock."""
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.data = {}
+
+    def _live(self, name):
+        item = self.data.get(name)
+        if item is not None and item[1] is not None and item[1] <= self.clock.now:
+            del self.data[name]
+            return None
+        return item
+
+    def get(self, name):
+        item = self._live(name)
+        return item[0] if item else None
+
+    def set(self, name, value, ex=None):
+        if isinstance(value, str):
+            value = value.encode()
+        self.data[name] = (value, self.clock.now + ex if ex else None)
+
+    def delete(self, name):
+        self.data.pop(name, None)
+
+    def incrby(self, name, amount):
+        item = self._live(name)
+        value = int(item[0]) + amount if item else amount
+        self.data[name] = (str(value).encode(), item[1] if item else None)
+        return value
+
+    def expire(self, name, seconds):
+        item = self._live(name)
+        if item:
+            self.data[name] = (item[0], self.clock.now + seconds)
+
+    def ttl(self, name):
+        item = self._live(name)
+        if item is None:
+            return -2
+        return -1 if item[1] is None else int(item[1] - self.clock.now)
+
+    def mget(self, names):
+        return [self.get(name) for name in names]
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(cache, "time", fake)
+    return fake
+
+
+@pytest.fixture
+def redis_client(clock):
+    return FakeRedis(clock)
+
+
+def _memory(tmp_path, redis_client):
+    return cache.MemoryCache()
+
+
+def _sqlite(tmp_path, redis_client):
+    return cache.SQLiteCache(str(tmp_path / "cache.sqlite"))
+
+
+def _redis(tmp_path, redis_client):
+    return cache.RedisCache(redis_client)
+
+
+def _tiered_sqlite(tmp_path, redis_client):
+    return cache.TieredCache(_sqlite(tmp_path, redis_client))
+
+
+def _tiered_redis(tmp_path, redis_client):
+    return cache.TieredCache(_redis(tmp_path, redis_client))
+
+
+BACKENDS = [_memory, _sqlite, _redis, _tiered_sqlite, _tiered_redis]
+
+
+@pytest.fixture(params=BACKENDS, ids=lambda f: f.__name__.strip("_"))
+def backend(request, tmp_path, clock, redis_client):
+    return request.param(tmp_path, redis_client)
+
+
+# ── Single backend ───────────────────────────────────────────────────────────
+def test_get_set_delete(backend):
+    assert backend.get("missing") is None
+    backend.set("k", b"v1")
+    assert backend.get("k") == b"v1"
+    backend.set("k", b"v2")
+    assert backend.get("k") == b"v2"
+    backend.delete("k")
+    assert backend.get("k") is None
+
+
+def test_json_helpers(backend):
+    backend.set_json("packages", [{"id": "starter", "price_usd": 9.99}])
+    assert backend.get_json("packages") == [{"id": "starter", "price_usd": 9.99}]
+    assert backend.get_json("missing") is None
+
+
+def test_ttl_expires(backend, clock):
+    backend.set("short", b"x", ttl=10)
+    backend.set("forever", b"y")
+    assert 0 < backend.ttl("short") <= 10
+    assert backend.ttl("forever") is None
+
+    clock.advance(11)
+    assert backend.get("short") is None
+    assert backend.ttl("short") is None
+    assert backend.get("forever") == b"y"
+
+
+def test_incr(backend, clock):
+    assert backend.incr("hits", ttl=60) == 1
+    assert backend.incr("hits", 4, ttl=60) == 5
+    assert 0 < backend.ttl("hits") <= 60   # ttl set on creation only
+
+    clock.advance(61)
+    assert backend.incr("hits", ttl=60) == 1   # expired counter starts over
+
+
+def test_sqlite_set_purges_expired_rows(tmp_path, clock):
+    backend = _sqlite(tmp_path, None)
+    backend.set("short", b"x", ttl=10)
+    backend.set("forever", b"y")
+    clock.advance(11)
+    backend.set("other", b"z", ttl=10)   # purge at most once per SQLITE_PURGE_SECONDS
+    assert _kv_keys(backend) == {"short", "forever", "other"}
+
+    clock.advance(cache.SQLITE_PURGE_SECONDS)
+    backend.set("new", b"w")
+    assert _kv_keys(backend) == {"forever", "new"}
+
+
+def _kv_keys(backend):
+    return {key for (key,) in backend._conn().execute("SELECT key FROM kv")}
+
+
+# ── Cross-worker invalidation ────────────────────────────────────────────────
+def _workers(kind, tmp_path, redis_client):
+    # two gunicorn workers: separate TieredCache + separate backend objects, same storage
+    if kind == "sqlite":
+        return [cache.TieredCache(_sqlite(tmp_path, redis_client)) for _ in range(2)]
+    return [cache.TieredCache(_redis(tmp_path, redis_client)) for _ in range(2)]
+
+
+@pytest.fixture(params=["sqlite", "redis"])
+def workers(request, tmp_path, clock, redis_client):
+    return _workers(request.param, tmp_path, redis_client)
+
+
+def test_first_invalidation_reaches_other_worker(workers, clock):
+    # empty log: seq 0 is a real position, the very first set() must invalidate
+    a, b = workers
+    a.shared.set("k", b"old")
+    assert b.get("k") == b"old"   # now in b's L1
+
+    a.set("k", b"new")
+    clock.advance(cache.INVALIDATION_POLL_SECONDS)
+    assert b.get("k") == b"new"
+
+
+def test_delete_reaches_other_worker(workers, clock):
+    a, b = workers
+    a.set("k", b"v")
+    assert b.get("k") == b"v"
+
+    a.delete("k")
+    clock.advance(cache.INVALIDATION_POLL_SECONDS)
+    assert b.get("k") is None
+
+
+def test_l1_served_between_polls(workers, clock):
+    a, b = workers
+    a.set("k", b"v1")
+    assert b.get("k") == b"v1"
+    a.set("k", b"v2")
+    assert b.get("k") == b"v1"   # stale until the next poll, bounded by INVALIDATION_POLL_SECONDS
+    clock.advance(cache.INVALIDATION_POLL_SECONDS)
+    assert b.get("k") == b"v2"
+
+
+def test_worker_started_later_skips_old_log(workers, clock, tmp_path, redis_client):
+    a, b = workers
+    a.set("k", b"v1")
+    kind = "sqlite" if isinstance(a.shared, cache.SQLiteCache) else "redis"
+    c = _workers(kind, tmp_path, redis_client)[0]
+    assert c.get("k") == b"v1"
+
+    a.set("k", b"v2")
+    clock.advance(cache.INVALIDATION_POLL_SECONDS)
+    assert c.get("k") == b"v2"
+
+
+def test_trimmed_log_flushes_l1(workers, clock):
+    a, b = workers
+    a.set("k", b"v1")
+    assert b.get("k") == b"v1"
+
+    a.set("k", b"v2")
+    clock.advance(cache.INVALIDATION_RETENTION + 1)
+    a.set("other", b"x")   # trims / expires the entry for "k"
+    assert b.get("k") == b"v2"
+
+
+def test_redis_counter_reset_flushes_l1(clock, redis_client, tmp_path):
+    a, b = _workers("redis", tmp_path, redis_client)
+    a.set("k", b"v1")
+    assert b.get("k") == b"v1"
+
+    redis_client.data.clear()   # Redis restarted without persistence
+    a.shared.set("k", b"v2")
+    clock.advance(cache.INVALIDATION_POLL_SECONDS)
+    assert b.get("k") == b"v2"
@@ -0,0 +1,89 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import update
+
+import database
+import main
+import models
+
+
+def _add_image(user_id, char_id, **values):
+    db = database.SessionLocal()
+    try:
+        img = models.ImageGeneration(
+            user_id=user_id, character_id=char_id, prompt="beach", credits_cost=7,
+            image_url="https://x/img.jpg", **values,
+        )
+        db.add(img)
+        db.commit()
+        return img.id
+    finally:
+        db.close()
+
+
+def _set_liked_null(image_id):
+    with database.engine.begin() as conn:
+        conn.execute(update(models.ImageGeneration).where(models.ImageGeneration.id == image_id).values(liked=None))
+
+
+def test_gallery_etag_changes_on_like(client, make_user):
+    user_id, char_id, headers = make_user()
+    image_id = _add_image(user_id, char_id)
+
+    first = client.get("/images/gallery", headers=headers)
+    etag = first.headers["etag"]
+    assert client.get("/images/gallery", headers={**headers, "If-None-Match": etag}).status_code == 304
+
+    client.patch(f"/images/{image_id}/like", headers=headers)
+    changed = client.get("/images/gallery", headers={**headers, "If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.json()[0]["liked"] is True
+    assert changed.headers["etag"] != etag
+
+
+def test_legacy_null_liked_is_served_as_false(client, make_user):
+    user_id, char_id, headers = make_user()
+    image_id = _add_image(user_id, char_id)
+    _set_liked_null(image_id)
+
+    for path in ("/images/gallery", "/images/gallery?liked=false", f"/images/{image_id}"):
+        response = client.get(path, headers=headers)
+        assert response.status_code == 200, path
+        body = response.json()
+        row = body[0] if isinstance(body, list) else body
+        assert row["id"] == image_id and row["liked"] is False
+
+    summary = client.get("/dashboard/summary", headers=headers)
+    assert summary.status_code == 200
+    assert summary.json()["recent_images"][0]["liked"] is False
+
+
+def _add_orphaned_render(user_id, char_id):
+    # its worker died mid-render: nobody will ever finish or refund it
+    created = datetime.utcnow() - timedelta(seconds=main.RENDER_STALE_SECONDS + 1)
+    return _add_image(user_id, char_id, status="rendering", draft_url="https://x/img.jpg", created_at=created)
+
+
+@pytest.mark.parametrize("path", ["/images/gallery", "/dashboard/summary", "/export?kind=images"])
+def test_listing_reclaims_orphaned_renders(client, make_user, path):
+    user_id, char_id, headers = make_user(credits=100)
+    rendering = _add_image(user_id, char_id, status="rendering", draft_url="https://x/img.jpg")
+    ready = _add_image(user_id, char_id)
+    etag = client.get("/images/gallery", headers=headers).headers["etag"]
+    orphan = _add_orphaned_render(user_id, char_id)
+
+    response = client.get(path, headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 200
+    if path == "/export?kind=images":
+        listed = [line for line in response.text.splitlines() if line]
+        assert orphan not in response.text and len(listed) == 2
+    else:
+        rows = response.json() if path == "/images/gallery" else response.json()["recent_images"]
+        assert {row["id"] for row in rows} == {rendering, ready}
+    if path == "/dashboard/summary":
+        assert response.json()["user"]["credits"] == 107
+
+    assert client.get(f"/images/{orphan}", headers=headers).status_code == 404
+    assert client.get("/auth/me", headers=headers).json()["credits"] == 107   # refunded exactly once
+    assert client.get("/images/gallery", headers={**headers, "If-None-Match": etag}).status_code == 200
@@ -0,0 +1,61 @@
+import asyncio
+
+import httpx
+import pytest
+
+import cache
+import image_gen
+
+
+@pytest.fixture
+def fal(monkeypatch):
+    """Counts fal.ai calls; each render returns a new URL."""
+    monkeypatch.setenv("FAL_KEY", "test")
+    cache.set_cache(cache.MemoryCache())
+    calls = []
+
+    async def post(self, url, **kwargs):
+        calls.append(kwargs["json"])
+        return httpx.Response(200, json={"images": [{"url": f"https://fal/{len(calls)}.jpg"}]},
+                              request=httpx.Request("POST", url))
+
+    monkeypatch.setattr(httpx.AsyncClient, "post", post)
+    yield calls
+    cache.set_cache(cache.MemoryCache())
+
+
+def _render(**kwargs):
+    args = dict(visual_prompt="red hair", scenario="beach", nsfw=False, seed=42, tier="full")
+    args.update(kwargs)
+    return asyncio.run(image_gen.agenerate_image(**args))
+
+
+def test_same_seed_and_prompt_reuses_the_render(fal):
+    assert _render() == "https://fal/1.jpg"
+    assert _render() == "https://fal/1.jpg"
+    assert len(fal) == 1
+
+
+def test_any_change_is_a_new_render(fal):
+    _render()
+    assert _render(scenario="cafe") == "https://fal/2.jpg"
+    assert _render(seed=43) == "https://fal/3.jpg"
+    assert _render(tier="draft") == "https://fal/4.jpg"
+    assert _render(nsfw=True) == "https://fal/5.jpg"
+
+
+def test_random_seed_is_never_cached(fal):
+    _render(seed=None)
+    _render(seed=None)
+    assert len(fal) == 2
+
+
+def test_failed_render_is_not_cached(fal, monkeypatch):
+    async def error(self, url, **kwargs):
+        return httpx.Response(500, text="boom", request=httpx.Request("POST", url))
+
+    with monkeypatch.context() as m:
+        m.setattr(httpx.AsyncClient, "post", error)
+        with pytest.raises(RuntimeError):
+            _render()
+    assert _render() == "https://fal/1.jpg"
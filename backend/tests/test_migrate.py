@@ -0,0 +1,40 @@
+from sqlalchemy import update
+
+import billing
+import cache
+import database
+import migrate
+import models
+
+
+def _set_price(package_id, price_usd):
+    with database.engine.begin() as conn:
+        conn.execute(update(models.CreditPackage).where(models.CreditPackage.id == package_id)
+                     .values(price_usd=price_usd))
+
+
+def _starter_price(store):
+    cache.set_cache(store)
+    db = database.SessionLocal()
+    try:
+        return billing.get_package(db, "starter")["price_usd"]
+    finally:
+        db.close()
+
+
+def test_migrate_invalidation_reaches_running_workers(app, tmp_path, monkeypatch):
+    # CACHE_URL=sqlite:/// shared by the web workers and the release phase
+    monkeypatch.setattr(cache, "INVALIDATION_POLL_SECONDS", 0)
+    path = str(tmp_path / "cache.sqlite")
+    worker = cache.TieredCache(cache.SQLiteCache(path))
+    try:
+        assert _starter_price(worker) == 9.99   # now in the worker's L1 and the shared file
+
+        _set_price("starter", 12.99)
+        cache.set_cache(cache.TieredCache(cache.SQLiteCache(path)))   # the migrate.py process
+        migrate.run()
+
+        assert _starter_price(worker) == 12.99
+    finally:
+        _set_price("starter", 9.99)
+        cache.set_cache(None)
@@ -0,0 +1,232 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+import deadlines
+import scheduler
+
+
+@pytest.fixture
+def provider(monkeypatch):
+    p = scheduler.Provider("test", concurrency=1, queue_max=10, service_seconds=1.0)
+    monkeypatch.setitem(scheduler.PROVIDERS, "test", p)
+    return p
+
+
+def _enqueue(p, tier, budget=None, admit=True):
+    """A thread waiter, as blocking_slot() makes, without blocking."""
+    with p._lock:
+        waiter = p._enqueue(tier, budget, admit)
+        if not waiter.granted:
+            waiter.event = threading.Event()
+    return waiter
+
+
+def _queued(p):
+    return {tier: s["queued"] for tier, s in p.stats()["tiers"].items()}
+
+
+# ── Weighted-fair ordering ───────────────────────────────────────────────────
+def test_freed_slots_follow_tier_weights(provider):
+    provider.queue_max = 1000
+    holder = _enqueue(provider, "free")
+    assert holder.granted
+    waiters = [_enqueue(provider, tier, admit=False) for tier in scheduler.TIERS for _ in range(20)]
+
+    order = []
+    for _ in range(20):
+        provider.release("free", time.monotonic())
+        granted = [w for w in waiters if w.granted and w.event.is_set()]
+        order.extend(w.tier for w in granted)
+        waiters = [w for w in waiters if w not in granted]
+
+    assert len(order) == 20
+    assert {tier: order.count(tier) for tier in scheduler.TIERS} == {"premium": 12, "loyal": 6, "free": 2}
+    assert "free" in order[:10]   # lowest weight still served every round
+
+
+def test_idle_tier_gets_no_credit_for_its_idle_time(provider):
+    provider.queue_max = 1000
+    _enqueue(provider, "free")
+    premium = [_enqueue(provider, "premium", admit=False) for _ in range(40)]
+    for _ in range(30):
+        provider.release("premium", time.monotonic())
+    assert sum(w.granted for w in premium) == 30
+
+    # free joins late: it competes from now on instead of taking 5 slots in a row
+    free = [_enqueue(provider, "free", admit=False) for _ in range(6)]
+    order = []
+    for _ in range(6):
+        provider.release("premium", time.monotonic())
+        order.append("free" if sum(w.granted for w in free) > order.count("free") else "premium")
+    assert order.count("free") == 1
+
+
+# ── Admission ────────────────────────────────────────────────────────────────
+def test_each_tier_fills_only_its_share_of_the_queue(provider):
+    provider.avg_service = 0.001
+    _enqueue(provider, "free")   # holds the only slot
+    admitted = {tier: 0 for tier in scheduler.TIERS}
+    for tier in ("free", "loyal", "premium"):
+        while True:
+            try:
+                _enqueue(provider, tier)
+            except scheduler.Overloaded as e:
+                assert e.status_code == 503 and e.retry_after >= 1
+                break
+            admitted[tier] += 1
+
+    # queue_max 10: free up to 5 queued, loyal up to 8, premium up to 10
+    assert admitted == {"free": 5, "loyal": 3, "premium": 2}
+    tiers = provider.stats()["tiers"]
+    assert [tiers[t]["rejected"] for t in scheduler.TIERS] == [1, 1, 1]
+    with pytest.raises(scheduler.Overloaded):
+        _enqueue(provider, "free")
+
+
+def test_idle_provider_admits_any_budget(provider):
+    assert _enqueue(provider, "free", budget=0.01).granted
+
+
+def test_rejected_when_estimated_wait_misses_the_deadline(provider):
+    provider.avg_service = 10.0
+    provider.queue_max = 100
+    _enqueue(provider, "free")   # busy: a queued request waits ~10s, then runs ~10s
+
+    with pytest.raises(scheduler.Overloaded) as rejected:
+        _enqueue(provider, "free", budget=15)
+    assert rejected.value.retry_after == 10
+    assert not _enqueue(provider, "free", budget=25).granted
+
+    for _ in range(3):
+        _enqueue(provider, "free", admit=False)
+    # 4 free queued: premium overtakes most of them (weight 6:1), free waits behind all
+    assert not _enqueue(provider, "premium", budget=25).granted
+    with pytest.raises(scheduler.Overloaded):
+        _enqueue(provider, "free", budget=25)
+
+
+def test_slot_uses_the_deadline(provider):
+    provider.avg_service = 10.0
+
+    async def main():
+        async with scheduler.slot("test", "free", deadlines.Deadline(1)):   # idle: admitted
+            with pytest.raises(scheduler.Overloaded):
+                async with scheduler.slot("test", "free", deadlines.Deadline(15)):
+                    pass
+
+    asyncio.run(main())
+    assert provider.active == 0 and _queued(provider)["free"] == 0
+
+
+# ── Abandon / cleanup ────────────────────────────────────────────────────────
+def test_abandon_queued_waiter_leaves_the_queue(provider):
+    _enqueue(provider, "free")
+    waiter = _enqueue(provider, "loyal")
+    provider.abandon(waiter)
+    assert _queued(provider)["loyal"] == 0
+    assert provider.active == 1
+
+
+def test_abandon_after_grant_passes_the_slot_on(provider):
+    _enqueue(provider, "free")
+    first, second = _enqueue(provider, "premium"), _enqueue(provider, "free")
+    provider.release("free", time.monotonic())
+    assert first.granted and not second.granted
+
+    provider.abandon(first)   # granted, but its caller was cancelled before using it
+    assert second.granted and second.event.is_set()
+    assert provider.active == 1
+    provider.release("free", time.monotonic())
+    assert provider.active == 0
+
+
+def test_cancelled_while_queued(provider):
+    async def main():
+        gate = asyncio.Event()
+
+        async def hold():
+            async with scheduler.slot("test", "free"):
+                await gate.wait()
+
+        holder = asyncio.create_task(hold())
+        await asyncio.sleep(0)
+        waiting = asyncio.create_task(scheduler.run("test", "premium", asyncio.sleep(0)))
+        await asyncio.sleep(0)
+        assert _queued(provider)["premium"] == 1
+
+        waiting.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+        assert _queued(provider)["premium"] == 0
+        gate.set()
+        await holder
+
+    asyncio.run(main())
+    assert provider.active == 0
+
+
+def test_cancelled_after_grant_before_running(provider):
+    async def main():
+        gate = asyncio.Event()
+        ran = []
+
+        async def hold(tier):
+            async with scheduler.slot("test", tier):
+                ran.append(tier)
+                await gate.wait()
+
+        holder = asyncio.create_task(hold("free"))
+        await asyncio.sleep(0)
+        granted_next = asyncio.create_task(hold("premium"))
+        after = asyncio.create_task(hold("loyal"))
+        await asyncio.sleep(0)
+
+        gate.set()
+        await asyncio.sleep(0)   # holder released: premium granted, its wake-up still pending
+        await holder
+        granted_next.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await granted_next
+        await after
+
+        assert ran == ["free", "loyal"]
+
+    asyncio.run(main())
+    assert provider.active == 0
+
+
+def test_blocking_slot_timeout_cleans_up(provider):
+    with scheduler.blocking_slot("test", "free"):
+        started = time.monotonic()
+        with pytest.raises(scheduler.Overloaded):
+            with scheduler.blocking_slot("test", "premium", timeout=0.05, admit=False):
+                pass
+        assert time.monotonic() - started >= 0.05
+        assert _queued(provider)["premium"] == 0
+        assert provider.active == 1
+    assert provider.active == 0
+
+    with scheduler.blocking_slot("test", "free", timeout=0.05):   # nothing left queued ahead
+        assert provider.active == 1
+
+
+def test_blocking_slot_granted_by_another_thread(provider):
+    holding, done = threading.Event(), threading.Event()
+
+    def hold():
+        with scheduler.blocking_slot("test", "free"):
+            holding.set()
+            done.wait(1)
+
+    thread = threading.Thread(target=hold)
+    thread.start()
+    holding.wait(1)
+    threading.Timer(0.05, done.set).start()
+    with scheduler.blocking_slot("test", "loyal", timeout=2, admit=False):
+        assert provider.active == 1
+    thread.join()
+    assert provider.active == 0
+    assert provider.stats()["tiers"]["loyal"]["completed"] == 1
@@ -0,0 +1,112 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+import vector_memory
+
+
+@pytest.fixture(autouse=True)
+def index_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(vector_memory, "MEMORY_INDEX_DIR", str(tmp_path))
+    monkeypatch.setattr(vector_memory, "RECALL_MIN_SCORE", 0.35)
+    vector_memory.set_embedder(vector_memory.HashingEmbedder(256))   # also drops the open indexes
+    yield tmp_path
+    vector_memory.set_embedder(vector_memory.HashingEmbedder(256))
+
+
+FACTS = [
+    "my sister is called Ana and she lives in Cluj",
+    "I really hate waking up early in the morning",
+    "my favourite food is spicy ramen with extra egg",
+]
+
+
+def test_hashing_embedder_is_deterministic_and_normalized():
+    a = vector_memory.HashingEmbedder(64).embed(["hello there my friend"])
+    b = vector_memory.HashingEmbedder(64).embed(["hello there my friend"])
+    assert (a == b).all()
+    assert abs(float((a[0] ** 2).sum()) - 1.0) < 1e-5
+
+
+def test_remember_then_recall():
+    vector_memory.remember("c1", FACTS)
+    assert vector_memory.recall("c1", "my sister is called Ana") == [FACTS[0]]
+    assert vector_memory.recall("c1", "what is my favourite food", k=1) == [FACTS[2]]
+
+
+def test_short_messages_are_not_indexed():
+    vector_memory.remember("c1", ["ok", "haha yes", "  "])
+    assert not os.path.exists(os.path.join(vector_memory.MEMORY_INDEX_DIR, "c1.hash256.f32"))
+    assert vector_memory.recall("c1", "ok") == []
+
+
+def test_recall_is_per_character():
+    vector_memory.remember("c1", FACTS)
+    assert vector_memory.recall("c2", "my sister is called Ana") == []
+
+
+def test_exclude_skips_snippets_already_in_prompt():
+    vector_memory.remember("c1", FACTS)
+    query = "hate waking up early, my sister is called Ana"
+    assert set(vector_memory.recall("c1", query)) == {FACTS[0], FACTS[1]}
+    assert vector_memory.recall("c1", query, exclude={FACTS[0]}) == [FACTS[1]]
+
+
+def test_min_score_filters_unrelated(monkeypatch):
+    vector_memory.remember("c1", FACTS)
+    assert vector_memory.recall("c1", "quantum chromodynamics lecture notes") == []
+
+    monkeypatch.setattr(vector_memory, "RECALL_MIN_SCORE", -1.0)
+    assert len(vector_memory.recall("c1", "quantum chromodynamics lecture notes")) == 3
+
+
+def test_other_worker_sees_appended_rows():
+    # two workers = two CharacterIndex objects over the same files
+    prefix = os.path.join(vector_memory.MEMORY_INDEX_DIR, "c1.hash256")
+    embedder = vector_memory.HashingEmbedder(256)
+    writer = vector_memory.CharacterIndex(prefix, 256)
+    reader = vector_memory.CharacterIndex(prefix, 256)
+    query = embedder.embed(["my favourite food"])[0]
+
+    assert reader.search(query, 3) == []
+    writer.add(embedder.embed(FACTS[:2]), FACTS[:2])
+    assert len(reader.search(query, 3)) == 2
+
+    writer.add(embedder.embed(FACTS[2:]), FACTS[2:])   # file grew: reader remaps
+    hits = reader.search(query, 3)
+    assert len(hits) == 3 and hits[0][1] == FACTS[2]
+    assert reader.texts == FACTS
+
+
+def test_half_written_text_line_is_not_read():
+    prefix = os.path.join(vector_memory.MEMORY_INDEX_DIR, "c1.hash256")
+    embedder = vector_memory.HashingEmbedder(256)
+    writer = vector_memory.CharacterIndex(prefix, 256)
+    writer.add(embedder.embed(FACTS[:1]), FACTS[:1])
+    with open(prefix + ".jsonl", "ab") as f:
+        f.write(b'"partial')   # another worker mid-write
+
+    reader = vector_memory.CharacterIndex(prefix, 256)
+    assert [text for _, text in reader.search(embedder.embed(["sister"])[0], 3)] == FACTS[:1]
+
+
+def test_forget_removes_files_and_open_index():
+    vector_memory.remember("c1", FACTS)
+    vector_memory.remember("c10", FACTS)   # same prefix characters must survive
+    assert vector_memory.recall("c1", "my sister is called Ana")
+
+    vector_memory.forget("c1")
+
+    names = os.listdir(vector_memory.MEMORY_INDEX_DIR)
+    assert not [n for n in names if n.startswith("c1.")]
+    assert [n for n in names if n.startswith("c10.")]
+    assert vector_memory.recall("c1", "my sister is called Ana") == []
+    assert vector_memory.recall("c10", "my sister is called Ana")
+
+
+def test_worker_boot_does_not_import_numpy():
+    code = "import sys, main; assert 'numpy' not in sys.modules, 'numpy imported at boot'"
+    backend = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    subprocess.run([sys.executable, "-c", code], cwd=backend, env=dict(os.environ), check=True)
@@ -0,0 +1,45 @@
+import pytest
+from starlette.websockets import WebSocketDisconnect
+
+
+def _token(headers):
+    return headers["Authorization"].split(" ", 1)[1]
+
+
+@pytest.mark.parametrize("frame", ["[1, 2]", '"x"', "null", "{not json"])
+def test_non_object_auth_message_is_a_400_then_4401(client, frame):
+    with client.websocket_connect("/ws") as ws:
+        ws.send_text(frame)
+        assert ws.receive_json() == {"type": "error", "status": 400, "detail": "Expected a JSON object."}
+        with pytest.raises(WebSocketDisconnect) as closed:
+            ws.receive_json()
+        assert closed.value.code == 4401
+
+
+def test_binary_auth_frame_is_accepted(client, make_user):
+    user_id, _, headers = make_user()
+    with client.websocket_connect("/ws") as ws:
+        ws.send_bytes(b'{"type": "auth", "token": "%s"}' % _token(headers).encode())
+        ready = ws.receive_json()
+        assert ready["type"] == "ready" and ready["user"]["id"] == user_id
+
+
+def test_bad_messages_after_auth_keep_the_socket_open(client, make_user):
+    _, _, headers = make_user()
+    with client.websocket_connect("/ws") as ws:
+        ws.send_json({"type": "auth", "token": _token(headers)})
+        assert ws.receive_json()["type"] == "ready"
+
+        for send in (lambda: ws.send_text("[1, 2]"), lambda: ws.send_text('"x"'),
+                     lambda: ws.send_text("{not json"), lambda: ws.send_bytes(b"\xff\x00")):
+            send()
+            error = ws.receive_json()
+            assert (error["type"], error["status"]) == ("error", 400)
+
+        ws.send_json({"type": "select_character", "character_id": {"id": 1}})
+        assert ws.receive_json()["status"] == 404
+        ws.send_json({"type": "chat", "message": ["hi"]})
+        assert ws.receive_json()["status"] == 400
+
+        ws.send_bytes(b'{"type": "ping"}')
+        assert ws.receive_json() == {"type": "pong"}
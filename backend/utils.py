@@ -1,13 +1,16 @@
-from passlib.context import CryptContext
 from jose import JWTError, jwt
 from datetime import datetime, timedelta
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
+from sqlalchemy import func, update
 from sqlalchemy.orm import Session
+from typing import Optional
 import os
 
 import database
 import models
+import passwords
+import profiling
 
 # ── JWT config ───────────────────────────────────────────────────────────
 _DEFAULT_SECRET = "SCHIMBA_IN_PRODUCTIE_foloseste_openssl_rand_hex_32"
@@ -17,7 +20,6 @@ if SECRET_KEY == _DEFAULT_SECRET and os.getenv("ENVIRONMENT") != "development":
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_DAYS = 30
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
 
 # ── Credit costs ──────────────────────────────────────────────────────────────
@@ -34,12 +36,13 @@ COST_IMAGE_NORMAL = 7
 COST_IMAGE_NSFW = 15
 
 # ── Passwords ────────────────────────────────────────────────────────────────────
+# Sincron, in procesul curent (scripturi). Rutele folosesc passwords.hash/verify (process pool).
 def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
+    return passwords.hash_password(password)
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+    return passwords.verify_and_update(plain_password, hashed_password)[0]
 
 
 # ── JWT ───────────────────────────────────────────────────────────────────────
@@ -50,6 +53,14 @@ def create_access_token(data: dict) -> str:
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
 
+def user_id_from_token(token: str) -> Optional[str]:
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return None
+    return payload.get("sub")
+
+
 def get_current_user(
     token: str = Depends(oauth2_scheme),
     db: Session = Depends(database.get_db)
@@ -59,12 +70,9 @@ def get_current_user(
         detail="Invalid or expired token.",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id: str = payload.get("sub")
-        if user_id is None:
-            raise credentials_exception
-    except JWTError:
+    with profiling.phase("auth"):
+        user_id = user_id_from_token(token)
+    if user_id is None:
         raise credentials_exception
 
     user = db.query(models.User).filter(models.User.id == user_id).first()
@@ -139,3 +147,52 @@ def add_credits(
         status="completed"
     )
     db.add(transaction)
+
+
+# ── Activity counters ─────────────────────────────────────────────────────────
+def record_activity(
+    db: Session,
+    user_id: str,
+    character_id: str,
+    messages: int = 0,
+    images: int = 0,
+    credits: int = 0,
+) -> None:
+    """Bump the dashboard counters in the current transaction (committed by the caller)."""
+    now = datetime.utcnow()
+    # Incrementam in SQL (col = col + n): doua requesturi paralele nu pierd un update
+    db.execute(
+        update(models.User)
+        .where(models.User.id == user_id)
+        .values(
+            total_messages=models.User.total_messages + messages,
+            total_images=models.User.total_images + images,
+            last_active_at=now,
+        )
+        .execution_options(synchronize_session=False)
+    )
+    db.execute(
+        update(models.Character)
+        .where(models.Character.id == character_id)
+        .values(
+            total_messages=models.Character.total_messages + messages,
+            credits_spent=models.Character.credits_spent + credits,
+            last_message_at=now,
+            # contoarele nu schimba persona: pastram versiunea (ETag /characters, cache prompt)
+            updated_at=models.Character.updated_at,
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+
+def bump_gallery_version(db: Session, user_id: str) -> None:
+    """Invalidate the user's gallery ETags (in the caller's transaction)."""
+    db.execute(
+        update(models.User)
+        .where(models.User.id == user_id)
+        .values(
+            gallery_version=func.coalesce(models.User.gallery_version, 0) + 1,
+            updated_at=models.User.updated_at,   # /auth/me nu se schimba
+        )
+        .execution_options(synchronize_session=False)
+    )
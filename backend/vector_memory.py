@@ -0,0 +1,245 @@
+"""
+Embedding-based recall of older facts ("my sister is called Ana", "I hate
+mornings") that have fallen out of the recent history window.
+
+- User messages are embedded after the response is sent (BackgroundTasks),
+  by a pluggable embedder. HashingEmbedder is deterministic and local
+  (no network), OpenAIEmbedder calls an embeddings API.
+- Each character has a contiguous float32 matrix on disk
+  (<MEMORY_INDEX_DIR>/<char_id>.<embedder>.f32), memory-mapped for search,
+  plus a .jsonl sidecar holding the snippet texts in the same row order.
+- Search is brute-force cosine similarity: one mat-vec product over
+  L2-normalized rows, then argpartition for the top-k.
+
+stats() reports the bytes held by loaded indexes and the search latency.
+"""
+from __future__ import annotations
+
+import fcntl
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import TYPE_CHECKING, List, Optional
+
+import orjson
+
+if TYPE_CHECKING:   # numpy e importat lazy, in functii: ~100ms din boot-ul workerului
+    import numpy as np
+
+MEMORY_INDEX_DIR = os.getenv("MEMORY_INDEX_DIR", "./memory_index")
+RECALL_K = int(os.getenv("MEMORY_RECALL_K", "3"))
+RECALL_MIN_SCORE = float(os.getenv("MEMORY_RECALL_MIN_SCORE", "0.35"))
+MIN_WORDS = 3            # "ok", "haha" nu merita indexate
+MAX_OPEN_INDEXES = 256
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    import numpy as np
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (vectors / norms).astype(np.float32, copy=False)
+
+
+# ── Embedders ────────────────────────────────────────────────────────────────
+class HashingEmbedder:
+    """Feature hashing of words + word bigrams. Deterministic, no model download."""
+
+    def __init__(self, dim: int = 256):
+        self.dim = dim
+        self.name = f"hash{dim}"
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        import numpy as np
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            words = re.findall(r"\w+", text.lower())
+            features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+            for feature in features:
+                h = int.from_bytes(hashlib.blake2b(feature.encode(), digest_size=8).digest(), "little")
+                out[row, h % self.dim] += 1.0 if h >> 63 else -1.0
+        return _normalize(out)
+
+
+class OpenAIEmbedder:
+    """Any OpenAI-compatible /embeddings endpoint."""
+
+    def __init__(self, model: str, dim: int, base_url: str, api_key: str):
+        self.model = model
+        self.dim = dim
+        self.name = re.sub(r"[^a-zA-Z0-9_-]", "_", model) + str(dim)
+        self._base_url = base_url
+        self._api_key = api_key
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        import numpy as np
+        from openai import OpenAI
+        client = OpenAI(base_url=self._base_url, api_key=self._api_key)
+        response = client.embeddings.create(model=self.model, input=texts, dimensions=self.dim)
+        return _normalize(np.array([d.embedding for d in response.data], dtype=np.float32))
+
+
+def _default_embedder():
+    if os.getenv("MEMORY_EMBEDDER", "hash") == "openai":
+        return OpenAIEmbedder(
+            model=os.getenv("EMBEDDING_MODEL", "text-embedding-3-small"),
+            dim=int(os.getenv("MEMORY_EMBED_DIM", "256")),
+            base_url=os.getenv("EMBEDDING_BASE_URL", "https://api.openai.com/v1"),
+            api_key=os.getenv("OPENAI_API_KEY", "placeholder"),
+        )
+    return HashingEmbedder(int(os.getenv("MEMORY_EMBED_DIM", "256")))
+
+
+_embedder = _default_embedder()
+
+
+def set_embedder(embedder) -> None:
+    """Swap the embedder (e.g. HashingEmbedder in tests). Indexes are keyed by embedder name."""
+    global _embedder
+    _embedder = embedder
+    with _indexes_lock:
+        _indexes.clear()
+
+
+# ── Per-character index ──────────────────────────────────────────────────────
+class CharacterIndex:
+    def __init__(self, prefix: str, dim: int):
+        import numpy as np
+        self.dim = dim
+        self.vec_path = prefix + ".f32"
+        self.text_path = prefix + ".jsonl"
+        self.lock_path = prefix + ".lock"
+        self.vectors = np.zeros((0, dim), dtype=np.float32)
+        self.texts: List[str] = []
+        self._vec_size = -1
+        self._text_offset = 0
+        self._lock = threading.Lock()
+
+    def _refresh(self) -> None:
+        # Alt worker poate fi adaugat randuri: remapam doar daca fisierul a crescut
+        vec_size = os.path.getsize(self.vec_path) if os.path.exists(self.vec_path) else 0
+        if vec_size == self._vec_size:
+            return
+
+        if os.path.exists(self.text_path):
+            with open(self.text_path, "rb") as f:
+                f.seek(self._text_offset)
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break   # rand scris pe jumatate
+                    self.texts.append(orjson.loads(line))
+                    self._text_offset += len(line)
+
+        rows = min(vec_size // (4 * self.dim), len(self.texts))
+        if rows:
+            import numpy as np
+            self.vectors = np.memmap(self.vec_path, dtype=np.float32, mode="r", shape=(rows, self.dim))
+        self._vec_size = vec_size
+
+    def add(self, vectors: np.ndarray, texts: List[str]) -> None:
+        import numpy as np
+        os.makedirs(os.path.dirname(self.vec_path), exist_ok=True)
+        # flock: texte si vectori trebuie sa ramana in aceeasi ordine intre workeri
+        with open(self.lock_path, "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                with open(self.text_path, "ab") as f:
+                    f.write(b"".join(orjson.dumps(t) + b"\n" for t in texts))
+                with open(self.vec_path, "ab") as f:
+                    f.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def search(self, query: np.ndarray, k: int) -> List[tuple]:
+        import numpy as np
+        with self._lock:
+            self._refresh()
+            vectors, texts = self.vectors, self.texts
+        n = len(vectors)
+        if n == 0:
+            return []
+        scores = vectors @ query
+        k = min(k, n)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(float(scores[i]), texts[i]) for i in top]
+
+    @property
+    def nbytes(self) -> int:
+        return self.vectors.nbytes + sum(len(t) for t in self.texts)
+
+
+_indexes: "OrderedDict[str, CharacterIndex]" = OrderedDict()
+_indexes_lock = threading.Lock()
+_search_ms = deque(maxlen=1024)
+
+
+def _index_for(char_id: str) -> CharacterIndex:
+    with _indexes_lock:
+        index = _indexes.get(char_id)
+        if index is None:
+            prefix = os.path.join(MEMORY_INDEX_DIR, f"{char_id}.{_embedder.name}")
+            index = _indexes[char_id] = CharacterIndex(prefix, _embedder.dim)
+            if len(_indexes) > MAX_OPEN_INDEXES:
+                _indexes.popitem(last=False)
+        else:
+            _indexes.move_to_end(char_id)
+        return index
+
+
+# ── Public API ───────────────────────────────────────────────────────────────
+def remember(char_id: str, texts: List[str]) -> None:
+    """Background task: embed and append messages to the character's index."""
+    texts = [t.strip() for t in texts if t and len(t.split()) >= MIN_WORDS]
+    if not texts:
+        return
+    try:
+        _index_for(char_id).add(_embedder.embed(texts), texts)
+    except Exception as e:
+        print(f"[MEMORY EMBED ERROR] {e}")
+
+
+def recall(char_id: str, query: str, exclude: Optional[set] = None, k: int = RECALL_K) -> List[str]:
+    """Top-k snippets most similar to `query`, minus those already in the prompt."""
+    try:
+        q = _embedder.embed([query])[0]
+        start = time.perf_counter()
+        hits = _index_for(char_id).search(q, k + len(exclude or ()))
+        _search_ms.append((time.perf_counter() - start) * 1000)
+    except Exception as e:
+        print(f"[MEMORY RECALL ERROR] {e}")
+        return []
+
+    exclude = exclude or set()
+    return [text for score, text in hits if score >= RECALL_MIN_SCORE and text not in exclude][:k]
+
+
+def forget(char_id: str) -> None:
+    with _indexes_lock:
+        _indexes.pop(char_id, None)
+    prefix = os.path.join(MEMORY_INDEX_DIR, f"{char_id}.")
+    if not os.path.isdir(MEMORY_INDEX_DIR):
+        return
+    for name in os.listdir(MEMORY_INDEX_DIR):
+        path = os.path.join(MEMORY_INDEX_DIR, name)
+        if path.startswith(prefix):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def stats() -> dict:
+    with _indexes_lock:
+        loaded = list(_indexes.values())
+    timings = sorted(_search_ms)
+    return {
+        "embedder": _embedder.name,
+        "loaded_indexes": len(loaded),
+        "vectors": sum(len(i.vectors) for i in loaded),
+        "bytes": sum(i.nbytes for i in loaded),
+        "search_ms_p50": timings[len(timings) // 2] if timings else None,
+        "search_ms_p99": timings[int(len(timings) * 0.99)] if timings else None,
+    }
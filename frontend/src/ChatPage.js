@@ -1,7 +1,10 @@
 import React, { useState, useEffect, useRef } from 'react';
-import { sendMessage, getChatHistory, generateImage } from './api';
+import { sendMessage, getChatHistory, generateImage, openSession, getImage, getMe } from './api';
 import './ChatPage.css';
 
+const RENDER_POLL_MS = 4000;
+const RENDER_FAILED_TEXT = "The photo couldn't be finished. Your credits were refunded.";
+
 function ChatPage({ character, user, onBack, onCreditsUpdate, onShowAuth }) {
   const [messages, setMessages] = useState([]);
   const [input, setInput] = useState('');
@@ -22,6 +25,50 @@ function ChatPage({ character, user, onBack, onCreditsUpdate, onShowAuth }) {
     messagesEndRef.current?.scrollIntoView({ behavior: 'smooth' });
   }, [messages]);
 
+  // Progressive images: the draft is shown first, the full render replaces it when ready
+  const finishRender = (imageId, imageUrl) => {
+    setMessages(prev => prev.map(m => m.image_id === imageId
+      ? { ...m, image_url: imageUrl, rendering: false } : m));
+  };
+
+  const failRender = (imageId) => {
+    setMessages(prev => prev.map(m => m.image_id === imageId
+      ? { role: 'ai', content: RENDER_FAILED_TEXT, id: m.id, isError: true } : m));
+  };
+
+  useEffect(() => {
+    if (!user) return;
+    const ws = openSession((event) => {
+      if (event.type === 'image_ready') {
+        finishRender(event.image.id, event.image.image_url);
+      } else if (event.type === 'image_failed') {
+        failRender(event.image_id);
+      } else if (event.type === 'credits') {
+        onCreditsUpdate(event.credits);
+      }
+    });
+    return () => ws.close();
+  }, [user]);
+
+  // The events only reach sockets on the worker that renders: poll as a fallback
+  const renderingIds = messages.filter(m => m.rendering).map(m => m.image_id).join(',');
+  useEffect(() => {
+    if (!renderingIds) return;
+    const timer = setInterval(() => {
+      renderingIds.split(',').forEach(async (imageId) => {
+        try {
+          const res = await getImage(imageId);
+          if (res.data.status !== 'rendering') finishRender(imageId, res.data.image_url);
+        } catch (err) {
+          if (err.response?.status !== 404) return;   // network blip: next tick retries
+          failRender(imageId);
+          getMe().then(res => onCreditsUpdate(res.data.credits)).catch(() => {});
+        }
+      });
+    }, RENDER_POLL_MS);
+    return () => clearInterval(timer);
+  }, [renderingIds]);
+
   const loadHistory = async () => {
     setLoadingHistory(true);
     try {
@@ -80,6 +127,8 @@ function ChatPage({ character, user, onBack, onCreditsUpdate, onShowAuth }) {
         content: '',
         is_image: true,
         image_url: res.data.image_url,
+        image_id: res.data.image_id,
+        rendering: res.data.status === 'rendering',
         id: Date.now(),
       }]);
       onCreditsUpdate(res.data.credits);
@@ -341,7 +390,7 @@ function MessageBubble({ msg, charName, charAvatar, formatTime }) {
             <img
               src={msg.image_url}
               alt="Generated"
-              className="chat-image"
+              className={`chat-image${msg.rendering ? ' chat-image-draft' : ''}`}
               onClick={() => window.open(msg.image_url, '_blank')}
             />
           </div>
@@ -1,5 +1,5 @@
 import React, { useState, useEffect } from 'react';
-import { getMe, listCharacters, getPackages, createCheckout, getTransactions, deleteCharacter } from './api';
+import { getDashboardSummary, getPackages, createCheckout, getTransactions, deleteCharacter } from './api';
 import './Dashboard.css';
 
 // Level thresholds (in USD / euro spent via credits)
@@ -52,8 +52,12 @@ function Dashboard({ user: initialUser, onClose, onStartChat, onNewCharacter, on
   const [loadingCheckout, setLoadingCheckout] = useState(null);
 
   useEffect(() => {
-    getMe().then(r => { setUser(r.data); onCreditsUpdate(r.data.credits); }).catch(() => {});
-    listCharacters().then(r => setCharacters(r.data)).catch(() => {});
+    getDashboardSummary().then(r => {
+      setUser(r.data.user);
+      onCreditsUpdate(r.data.user.credits);
+      setCharacters(r.data.characters);
+      setTransactions(r.data.recent_transactions);
+    }).catch(() => {});
   }, []);
 
   useEffect(() => {
@@ -220,7 +224,7 @@ function Dashboard({ user: initialUser, onClose, onStartChat, onNewCharacter, on
                     </div>
                     <div className="companion-info">
                       <div className="companion-name">{char.name}</div>
-                      <div className="companion-meta">{char.age} yrs — {char.total_images_generated} photos generated</div>
+                      <div className="companion-meta">{char.age} yrs — {char.total_messages} messages — {char.total_images_generated} photos generated</div>
                     </div>
                     <div className="companion-actions">
                       <button className="btn-primary btn-sm" onClick={() => { onStartChat(char); onClose(); }}>
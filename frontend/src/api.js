@@ -37,12 +37,30 @@ export const getChatHistory = (char_id, limit = 50) =>
 export const generateImage = (character_id, scenario, nsfw = false) =>
   api.post('/images/generate', { character_id, scenario, nsfw });
 
-export const getGallery = (limit = 40) =>
-  api.get('/images/gallery', { params: { limit } });
+// One image; polled while status === 'rendering' (404 = render failed, credits refunded)
+export const getImage = (image_id) => api.get(`/images/${image_id}`);
+export const cancelImageRender = (image_id) => api.post(`/images/${image_id}/cancel`);
+
+// filters: { character_id, liked, nsfw_level, created_after, created_before }
+export const getGallery = (limit = 40, filters = {}) =>
+  api.get('/images/gallery', { params: { limit, ...filters } });
+
+export const getGalleryStats = () => api.get('/images/gallery/stats');
 
 export const toggleLike = (image_id) =>
   api.patch(`/images/${image_id}/like`);
 
+// Search (scope: 'messages' | 'images')
+export const search = (q, { scope = 'messages', character_id, cursor, limit = 20 } = {}) =>
+  api.get('/search', { params: { q, scope, character_id, cursor, limit } });
+
+// Dashboard: account + characters (with message counts) + recent activity, one call
+export const getDashboardSummary = () => api.get('/dashboard/summary');
+
+// Export: format = 'ndjson' | 'csv' | 'zip' (zip = messages + images + image files)
+export const exportData = ({ kind = 'messages', format = 'ndjson', character_id } = {}) =>
+  api.get('/export', { params: { kind, format, character_id }, responseType: 'blob' });
+
 // Credits
 export const getPackages = () => api.get('/credits/packages');
 export const createCheckout = (package_id, success_url, cancel_url) =>
@@ -50,4 +68,12 @@ export const createCheckout = (package_id, success_url, cancel_url) =>
 export const getTransactions = (limit = 20) =>
   api.get('/credits/transactions', { params: { limit } });
 
+// Realtime session: chat reply tokens, image/avatar ready, credit updates
+export const openSession = (onEvent) => {
+  const ws = new WebSocket(`${API_URL.replace(/^http/, 'ws')}/ws`);
+  ws.onopen = () => ws.send(JSON.stringify({ type: 'auth', token: localStorage.getItem('token') }));
+  ws.onmessage = (e) => onEvent(JSON.parse(e.data));
+  return ws;
+};
+
 export default api;